@@ -1,13 +1,13 @@
 import os
 import sys
+import time
 import asyncio
+import functools
 import logging
-import random
-import requests
 import json
 from datetime import datetime
 from dotenv import load_dotenv
-from telethon import TelegramClient, events, Button
+from telethon import TelegramClient, events, Button, errors
 from telethon.tl import types, functions
 import pytz
 
@@ -19,10 +19,37 @@ load_dotenv()
 
 # Database imports
 try:
-    from py.gacha import SessionLocal, User, Transaction, get_wib_time, engine, Base
+    from py.models import SessionLocal, Transaction, generate_payload, get_wib_time, user_service, wib_isoformat
+    from py.aio import AsyncDB, AsyncHTTP
+    from py.bot_api import get_bot_api
+    from py.stats import bump, read_counters
+    from py.settlement import SettlementBatcher
+    from py.sweeper import run_sweeper
+    from py.payments import check_precheckout, deposit_success_message
+    from py.outbox import OutboxSender, RetryAfter, PermanentError, enqueue_for_payload
+    from py.archive import run_archiver
+    from py.users import touch_users
+    from py.refunds import (
+        MAX_BATCH, RefundBatch, RefundReport, RefundRunner, RefundSessions, parse_charge_list, resolve_charges
+    )
+    from py import metrics, profiling
 except ImportError:
     # Fallback jika struktur folder berbeda
-    from gacha import SessionLocal, User, Transaction, get_wib_time, engine, Base
+    from models import SessionLocal, Transaction, generate_payload, get_wib_time, user_service, wib_isoformat
+    from aio import AsyncDB, AsyncHTTP
+    from bot_api import get_bot_api
+    from stats import bump, read_counters
+    from settlement import SettlementBatcher
+    from sweeper import run_sweeper
+    from payments import check_precheckout, deposit_success_message
+    from outbox import OutboxSender, RetryAfter, PermanentError, enqueue_for_payload
+    from archive import run_archiver
+    from users import touch_users
+    from refunds import (
+        MAX_BATCH, RefundBatch, RefundReport, RefundRunner, RefundSessions, parse_charge_list, resolve_charges
+    )
+    import metrics
+    import profiling
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -31,8 +58,25 @@ API_ID = int(os.getenv('API_ID'))
 API_HASH = os.getenv('API_HASH')
 BOT_TOKEN = os.getenv('BOT_TOKEN')
 WEBHOOK_URL = os.getenv('WEBHOOK_URL')
+# URL API (py/gacha.py) untuk membangunkan long-poll status pembayaran
+API_INTERNAL_URL = os.getenv('API_INTERNAL_URL', f"http://127.0.0.1:{os.getenv('PORT', 8080)}")
+# Secret untuk /api/internal/* (sama dengan API). Kosong = API tidak dinotifikasi;
+# BOT_TOKEN tidak pernah dikirim sebagai gantinya
+INTERNAL_API_SECRET = os.getenv('INTERNAL_API_SECRET')
+# Jika pembayaran diterima lewat webhook Bot API di py/gacha.py
+# (TELEGRAM_WEBHOOK_SECRET), bot tidak ikut memproses pre-checkout/pembayaran
+PAYMENTS_VIA_WEBHOOK = os.getenv('PAYMENTS_VIA_WEBHOOK', '').lower() in ('1', 'true', 'yes')
+# Admin bot (/balance, /stats, /refund), dipisah koma
+ADMIN_IDS = {int(admin_id) for admin_id in os.getenv('ADMIN_IDS', '7998861975').split(',') if admin_id.strip()}
+REFUND_FILE_MAX_BYTES = int(os.getenv('REFUND_FILE_MAX_BYTES', 1024 * 1024))
 
-bot = TelegramClient('stdeposit', API_ID, API_HASH)
+# Handler dijalankan paralel; kerja DB/HTTP yang blocking dilempar ke thread pool
+bot = TelegramClient('stdeposit', API_ID, API_HASH, sequential_updates=False)
+adb = AsyncDB(SessionLocal, max_workers=int(os.getenv('BOT_DB_WORKERS', 4)))
+http = AsyncHTTP(
+    max_workers=int(os.getenv('BOT_HTTP_WORKERS', 8)),
+    timeout=float(os.getenv('BOT_HTTP_TIMEOUT', 10))
+)
 
 # Timezone Indonesia
 WIB = pytz.timezone('Asia/Jakarta')
@@ -40,23 +84,130 @@ WIB = pytz.timezone('Asia/Jakarta')
 def get_wib_time():
     return datetime.now(WIB)
 
+async def notify_transaction_event(payload, status, amount=None, completed_at=None):
+    """Beritahu API bahwa status transaksi berubah (membangunkan long-poll)"""
+    if not INTERNAL_API_SECRET:
+        return
+    try:
+        await http.request(
+            'POST',
+            f"{API_INTERNAL_URL}/api/internal/transaction-event",
+            json={
+                'payload': payload,
+                'status': status,
+                'amount': amount,
+                'completed_at': completed_at
+            },
+            headers={'X-Internal-Secret': INTERNAL_API_SECRET},
+            timeout=2
+        )
+    except Exception as e:
+        logger.warning(f"Gagal notify API untuk payload {payload}: {e}")
+
+def _queue_deposit_notification(db, payload, charge_id, amount, completed_at):
+    # Dipanggil di commit settlement: konfirmasi tidak hilang walau bot mati
+    enqueue_for_payload(db, payload, deposit_success_message(amount, charge_id, completed_at), completed_at)
+
+# Settlement pembayaran: kredit saldo atomik, beberapa pembayaran per commit
+settler = SettlementBatcher(
+    adb,
+    clock=get_wib_time,
+    max_batch=int(os.getenv('SETTLEMENT_BATCH_SIZE', 50)),
+    max_delay=float(os.getenv('SETTLEMENT_BATCH_DELAY_MS', 10)) / 1000,
+    on_settled=_queue_deposit_notification
+)
+
+async def _send_notification(chat_id, text, parse_mode):
+    try:
+        await bot.send_message(chat_id, text, parse_mode=parse_mode)
+    except errors.FloodWaitError as e:
+        raise RetryAfter(e.seconds)
+    except (errors.UserIsBlockedError, errors.InputUserDeactivatedError, errors.PeerIdInvalidError) as e:
+        raise PermanentError(str(e))
+
+# Notifikasi ke user dikirim dari outbox (py/outbox.py), terpisah dari handler pembayaran
+outbox_sender = OutboxSender(adb, _send_notification, get_wib_time)
+
+async def _refund_charge(item):
+    try:
+        await bot(functions.payments.RefundStarsChargeRequest(
+            user_id=await bot.get_input_entity(item.telegram_id),
+            charge_id=item.charge_id
+        ))
+    except errors.FloodWaitError as e:
+        raise RetryAfter(e.seconds)
+    except errors.ServerError:
+        # Error 5xx Telegram: dicoba ulang oleh RefundRunner
+        raise
+    except (errors.RPCError, ValueError) as e:
+        # CHARGE_NOT_FOUND / CHARGE_ALREADY_REFUNDED / user tidak dikenal: tidak perlu dicoba ulang
+        raise PermanentError(str(e))
+
+# Konfirmasi refund per admin & per batch; runner dipakai bersama (FloodWait berlaku untuk bot)
+refund_sessions = RefundSessions()
+refund_runner = RefundRunner(adb, _refund_charge, get_wib_time)
+
+# Metrics handler bot, dilayani di BOT_METRICS_PORT (jika di-set)
+BOT_METRICS_PORT = os.getenv('BOT_METRICS_PORT')
+HANDLER_LATENCY = metrics.registry.histogram(
+    'gacha_bot_handler_seconds', 'Durasi handler bot', ('handler', 'outcome')
+)
+
+def timed_handler(func):
+    """Catat durasi handler ke HANDLER_LATENCY (+ profil SQL jika SQL_PROFILE=1)"""
+    @functools.wraps(func)
+    async def wrapper(event):
+        started = time.perf_counter()
+        outcome = 'error'
+        try:
+            with profiling.profiled(f"handler {func.__name__}"):
+                result = await func(event)
+            outcome = 'ok'
+            return result
+        finally:
+            HANDLER_LATENCY.observe(time.perf_counter() - started, handler=func.__name__, outcome=outcome)
+    return wrapper
+
+# ============ AKSES DATABASE (dijalankan di thread pool via adb.run) ============
+
+def _ensure_user(db, telegram_id, username=None, first_name=None, last_name=None):
+    """Ambil user atau buat jika belum ada (profil diperbarui), return users.id"""
+    user = user_service.get_or_create(
+        db, telegram_id, username, first_name, last_name, refresh_profile=True
+    )
+    user_id = user.id
+    db.commit()
+    return user_id
+
+def _create_pending_transaction(db, telegram_id, username, first_name, last_name, amount, payload):
+    # User dan transaksi di-commit sekaligus
+    user = user_service.get_or_create(
+        db, telegram_id, username, first_name, last_name, refresh_profile=True
+    )
+    transaction = Transaction(
+        user_id=user.id,
+        amount=amount,
+        payload=payload,
+        status='pending',
+        created_at=get_wib_time()
+    )
+    db.add(transaction)
+    bump(db, pending_count=1)
+    touch_users(db, user.id)
+    db.commit()
+
 @bot.on(events.NewMessage(pattern='/start'))
+@timed_handler
 async def start(event):
     # Simpan user ke database jika belum ada
-    db = SessionLocal()
-    try:
-        user = db.query(User).filter(User.telegram_id == event.sender_id).first()
-        if not user:
-            user = User(
-                telegram_id=event.sender_id,
-                username=event.sender.username,
-                first_name=event.sender.first_name,
-                last_name=event.sender.last_name
-            )
-            db.add(user)
-            db.commit()
-    finally:
-        db.close()
+    sender = event.sender
+    await adb.run(
+        _ensure_user,
+        event.sender_id,
+        sender.username,
+        sender.first_name,
+        sender.last_name
+    )
     
     await event.respond(
         "💰 **Selamat Datang di Deposit Bot** 💰\n\n"
@@ -69,6 +220,7 @@ async def start(event):
     )
 
 @bot.on(events.NewMessage(pattern='/deposit'))
+@timed_handler
 async def deposit_handler(event):
     try:
         command = event.message.text.split()
@@ -82,54 +234,24 @@ async def deposit_handler(event):
             return
         
         user_id = event.sender_id
-        timestamp = int(get_wib_time().timestamp())
         
-        # Buat payload unik
-        payload = f"deposit:{user_id}:{amount}:{random.randint(1000, 9999)}:{timestamp}"
+        # Buat payload unik bertanda tangan
+        payload = generate_payload(user_id, amount)
         
         # Simpan ke database
-        db = SessionLocal()
-        try:
-            # Dapatkan user
-            user = db.query(User).filter(User.telegram_id == user_id).first()
-            if not user:
-                user = User(
-                    telegram_id=user_id,
-                    username=event.sender.username,
-                    first_name=event.sender.first_name,
-                    last_name=event.sender.last_name
-                )
-                db.add(user)
-                db.commit()
-                db.refresh(user)
-            
-            # Buat transaksi
-            transaction = Transaction(
-                user_id=user.id,
-                amount=amount,
-                payload=payload,
-                status='pending',
-                created_at=get_wib_time()
-            )
-            db.add(transaction)
-            db.commit()
-        finally:
-            db.close()
-        
-        # Panggil Bot API untuk createInvoiceLink
-        url = f"https://api.telegram.org/bot{BOT_TOKEN}/createInvoiceLink"
-        
-        data = {
-            "title": f"Deposit {amount} Stars",
-            "description": f"Deposit {amount} Telegram Stars",
-            "payload": payload,
-            "currency": "XTR",
-            "prices": [{"label": f"Deposit {amount} ⭐", "amount": amount}],
-            "provider_token": ""
-        }
+        sender = event.sender
+        await adb.run(
+            _create_pending_transaction,
+            user_id,
+            sender.username,
+            sender.first_name,
+            sender.last_name,
+            amount,
+            payload
+        )
         
-        response = requests.post(url, json=data)
-        result = response.json()
+        # Panggil Bot API untuk createInvoiceLink (client pooled bersama)
+        result = await http.run(get_bot_api().create_invoice_link, payload, amount)
         
         if result.get("ok"):
             invoice_link = result["result"]
@@ -150,7 +272,11 @@ async def deposit_handler(event):
         await event.respond("❌ Terjadi kesalahan")
 
 @bot.on(events.Raw)
+@timed_handler
 async def raw_handler(event):
+    if PAYMENTS_VIA_WEBHOOK:
+        return
+    
     # HANDLE PRE-CHECKOUT QUERY
     if isinstance(event, types.UpdateBotPrecheckoutQuery):
         query_id = event.query_id
@@ -161,35 +287,15 @@ async def raw_handler(event):
         
         logger.info(f"Pre-checkout received: User {user_id}, Amount {total_amount} {currency}, Payload {payload}")
         
-        db = SessionLocal()
         try:
             # Cari transaksi di database
-            transaction = db.query(Transaction).filter(Transaction.payload == payload).first()
+            error = await adb.run(check_precheckout, payload, user_id, currency, total_amount, get_wib_time())
             
-            if not transaction:
+            if error:
                 await bot(functions.messages.SetBotPrecheckoutResultsRequest(
                     query_id=query_id,
                     success=False,
-                    error="Transaksi tidak valid"
-                ))
-                return
-            
-            # Load user relationship
-            user = db.query(User).filter(User.id == transaction.user_id).first()
-            
-            if user.telegram_id != user_id:
-                await bot(functions.messages.SetBotPrecheckoutResultsRequest(
-                    query_id=query_id,
-                    success=False,
-                    error="User tidak sesuai"
-                ))
-                return
-            
-            if currency != 'XTR' or total_amount != transaction.amount:
-                await bot(functions.messages.SetBotPrecheckoutResultsRequest(
-                    query_id=query_id,
-                    success=False,
-                    error="Jumlah tidak sesuai"
+                    error=error
                 ))
                 return
             
@@ -211,8 +317,6 @@ async def raw_handler(event):
                 ))
             except:
                 pass
-        finally:
-            db.close()
     
     # HANDLE SUCCESSFUL PAYMENT
     elif isinstance(event, types.UpdateNewMessage):
@@ -231,47 +335,29 @@ async def raw_handler(event):
                 
                 logger.info(f"PAYMENT SUCCESS! User {user_id}, Charge ID {charge_id}")
                 
-                db = SessionLocal()
-                try:
-                    # Cari transaksi
-                    transaction = db.query(Transaction).filter(Transaction.payload == payload).first()
+                completed_at = await settler.submit(payload, charge_id, total_amount)
+                
+                if completed_at:
+                    # Bangunkan Mini App yang menunggu invoice ini
+                    await notify_transaction_event(
+                        payload,
+                        'completed',
+                        total_amount,
+                        wib_isoformat(completed_at)
+                    )
+                    
+                    # Konfirmasi sudah masuk outbox bersama settlement
+                    outbox_sender.wake()
                     
-                    if transaction and transaction.status == 'pending':
-                        # Update transaksi
-                        transaction.status = 'completed'
-                        transaction.charge_id = charge_id
-                        transaction.completed_at = get_wib_time()
-                        
-                        # Update saldo user
-                        user = db.query(User).filter(User.id == transaction.user_id).first()
-                        if user:
-                            user.balance += total_amount
-                        
-                        db.commit()
-                        
-                        # Kirim konfirmasi
-                        waktu = get_wib_time().strftime('%d/%m/%Y %H:%M:%S')
-                        await bot.send_message(
-                            user_id,
-                            f"✅ **DEPOSIT BERHASIL!**\n\n"
-                            f"💰 **Jumlah:** {total_amount} ⭐\n"
-                            f"🆔 **Transaksi:** `{charge_id}`\n"
-                            f"📅 **Waktu:** {waktu}\n\n"
-                            f"Terima kasih telah melakukan deposit! 🎉"
-                        )
-                        
-                        logger.info(f"Deposit completed for user {user_id}")
-                finally:
-                    db.close()
+                    logger.info(f"Deposit completed for user {user_id}")
                 
             except Exception as e:
                 logger.error(f"Error processing payment: {e}")
 
 @bot.on(events.NewMessage(pattern='/balance'))
+@timed_handler
 async def balance_handler(event):
-    admin_ids = [7998861975]
-    
-    if event.sender_id not in admin_ids:
+    if event.sender_id not in ADMIN_IDS:
         await event.respond("❌ Perintah ini hanya untuk admin")
         return
     
@@ -286,174 +372,196 @@ async def balance_handler(event):
         await event.respond("❌ Gagal mendapatkan saldo")
 
 @bot.on(events.NewMessage(pattern='/stats'))
+@timed_handler
 async def stats_handler(event):
-    admin_ids = [7998861975]
-    
-    if event.sender_id not in admin_ids:
+    if event.sender_id not in ADMIN_IDS:
         await event.respond("❌ Perintah ini hanya untuk admin")
         return
     
-    db = SessionLocal()
-    try:
-        total_users = db.query(User).count()
-        total_transactions = db.query(Transaction).filter(Transaction.status == 'completed').count()
-        total_stars = db.query(Transaction).filter(Transaction.status == 'completed').with_entities(db.func.sum(Transaction.amount)).scalar() or 0
-        pending = db.query(Transaction).filter(Transaction.status == 'pending').count()
-    finally:
-        db.close()
+    # Counter incremental, tidak ada scan tabel users/transactions
+    counters = await adb.run(read_counters)
     
     await event.respond(
         f"📊 **STATISTIK**\n\n"
-        f"👥 Total User: {total_users}\n"
-        f"✅ Transaksi Sukses: {total_transactions}\n"
-        f"💰 Total Stars: {total_stars} ⭐\n"
-        f"⏳ Pending: {pending}"
+        f"👥 Total User: {counters['users']}\n"
+        f"✅ Transaksi Sukses: {counters['completed_count']}\n"
+        f"💰 Total Stars: {counters['completed_amount']} ⭐\n"
+        f"⏳ Pending: {counters['pending_count']}"
+    )
+
+def _refund_usage():
+    return (
+        "📌 **Cara Refund:**\n"
+        "`/refund <user_id> <telegram_payment_charge_id>`\n\n"
+        "Contoh:\n"
+        "`/refund 7998861975 stxWMsESZh95IM-lsM8wEYqzsRSaRbYrISfS3lOK9ZLW9ZP53KKc2jia_YGOHzWglVnGZS2r4jfZMrqixsjmeRD6iWH8ni4iJ29QK2lz5HvXsI`\n\n"
+        "📦 **Refund Massal:**\n"
+        "`/refundbulk` diikuti charge ID (satu per baris), atau kirim/balas file .txt "
+        "dengan caption `/refundbulk`.\n"
+        "Charge yang tidak ada di database ditulis `<user_id> <charge_id>`."
     )
 
-@bot.on(events.NewMessage(pattern='/refund'))
+async def _refund_list_text(event):
+    """Teks perintah + isi file .txt yang dilampirkan atau dibalas"""
+    text = event.message.text or ''
+    message = event.message
+    if not message.file and message.is_reply:
+        message = await message.get_reply_message()
+    if message and message.file:
+        if message.file.size and message.file.size > REFUND_FILE_MAX_BYTES:
+            raise ValueError(f"File terlalu besar (maks {REFUND_FILE_MAX_BYTES // 1024} KB)")
+        data = await message.download_media(bytes)
+        text += '\n' + data.decode('utf-8', errors='replace')
+    return text
+
+async def _prepare_refund(event, text):
+    """Buat batch refund dan kirim konfirmasi dengan tombol inline"""
+    entries, invalid = parse_charge_list(text)
+    if not entries:
+        await event.respond(_refund_usage())
+        return
+    if len(entries) > MAX_BATCH:
+        await event.respond(f"❌ Maksimal {MAX_BATCH} charge per batch (dikirim {len(entries)})")
+        return
+    
+    items, unknown = await adb.run(resolve_charges, entries)
+    if not items:
+        await event.respond(
+            "❌ Charge ID tidak ditemukan di database.\n"
+            "Tulis sebagai `<user_id> <charge_id>` untuk charge di luar database."
+        )
+        return
+    
+    batch = refund_sessions.add(RefundBatch(event.sender_id, event.chat_id, items, unknown))
+    
+    text = "⚠️ **Konfirmasi Refund**\n\n"
+    if len(items) == 1:
+        text += (
+            f"User ID: `{items[0].telegram_id}`\n"
+            f"Charge ID: `{items[0].charge_id}`\n"
+        )
+    else:
+        text += f"Jumlah charge: {len(items)}\n"
+    if batch.total_amount:
+        text += f"Total: {batch.total_amount} ⭐\n"
+    if unknown:
+        text += f"\n⚠️ {len(unknown)} charge tidak ada di database dan tanpa user_id (dilewati)\n"
+    if invalid:
+        text += f"⚠️ {len(invalid)} baris/token tidak valid (dilewati)\n"
+    text += f"\nBatch `{batch.id}` berlaku {int(refund_sessions.ttl // 60)} menit. Yakin ingin refund?"
+    
+    confirm_msg = await event.respond(text, buttons=[[
+        Button.inline("✅ Ya, refund", data=f"refund:ok:{batch.id}".encode()),
+        Button.inline("❌ Batal", data=f"refund:no:{batch.id}".encode()),
+    ]])
+    batch.message_id = confirm_msg.id
+
+@bot.on(events.NewMessage(pattern=r'^/refund(?:@\w+)?(?:\s|$)'))
+@timed_handler
 async def refund_handler(event):
     """
     Refund deposit Stars
     Format: /refund <user_id> <telegram_payment_charge_id>
     """
-    admin_ids = [7998861975]  # ID owner bot
-    
-    if event.sender_id not in admin_ids:
+    if event.sender_id not in ADMIN_IDS:
         await event.respond("❌ Perintah ini hanya untuk owner bot")
         return
     
     parts = event.message.text.split()
     if len(parts) != 3:
-        await event.respond(
-            "📌 **Cara Refund:**\n"
-            "`/refund <user_id> <telegram_payment_charge_id>`\n\n"
-            "Contoh:\n"
-            "`/refund 7998861975 stxWMsESZh95IM-lsM8wEYqzsRSaRbYrISfS3lOK9ZLW9ZP53KKc2jia_YGOHzWglVnGZS2r4jfZMrqixsjmeRD6iWH8ni4iJ29QK2lz5HvXsI`"
-        )
+        await event.respond(_refund_usage())
+        return
+    if not parts[1].isdigit():
+        await event.respond("❌ User ID harus berupa angka")
+        return
+    
+    await _prepare_refund(event, f"{parts[1]} {parts[2]}")
+
+@bot.on(events.NewMessage(pattern=r'^/refundbulk(?:@\w+)?(?:\s|$)'))
+@timed_handler
+async def refund_bulk_handler(event):
+    """
+    Refund massal
+    Format: /refundbulk + charge ID per baris, atau file .txt (lampiran / reply)
+    """
+    if event.sender_id not in ADMIN_IDS:
+        await event.respond("❌ Perintah ini hanya untuk owner bot")
         return
     
     try:
-        user_id = int(parts[1].strip())
-        charge_id = parts[2].strip()
-        
-        if not charge_id:
-            await event.respond("❌ Charge ID tidak boleh kosong")
-            return
-        
-        # Konfirmasi ke admin
-        confirm_msg = await event.respond(
-            f"⚠️ **Konfirmasi Refund**\n\n"
-            f"User ID: `{user_id}`\n"
-            f"Charge ID: `{charge_id}`\n\n"
-            f"Yakin ingin refund?\n"
-            f"Ketik **YA** untuk konfirmasi, atau **TIDAK** untuk batal."
-        )
-        
-        # Simpan data sementara
-        event.client.refund_data = {
-            'user_id': user_id,
-            'charge_id': charge_id,
-            'confirm_msg_id': confirm_msg.id,
-            'chat_id': event.chat_id
-        }
-        
-    except ValueError:
-        await event.respond("❌ User ID harus berupa angka")
-    except Exception as e:
-        await event.respond(f"❌ Error: {str(e)}")
+        text = await _refund_list_text(event)
+    except ValueError as e:
+        await event.respond(f"❌ {e}")
+        return
+    
+    await _prepare_refund(event, text)
+
+def _refund_progress_text(batch, report):
+    return (
+        f"⏳ **Memproses refund** (batch `{batch.id}`)\n\n"
+        f"Progres: {report.done}/{report.total}\n"
+        f"✅ Berhasil: {report.refunded}\n"
+        f"↩️ Sudah direfund: {report.already}\n"
+        f"❌ Gagal: {len(report.failed)}"
+    )
 
-@bot.on(events.NewMessage)
-async def handle_refund_confirmation(event):
-    """Menangani konfirmasi refund dari admin"""
-    if not hasattr(event.client, 'refund_data'):
+def _refund_summary_text(batch, report):
+    elapsed = time.monotonic() - report.started
+    text = (
+        f"{'✅' if not report.failed else '⚠️'} **Refund Selesai** (batch `{batch.id}`)\n\n"
+        f"✅ Berhasil: {report.refunded}\n"
+        f"↩️ Sudah direfund sebelumnya: {report.already}\n"
+        f"❌ Gagal: {len(report.failed)}\n"
+        f"⏱ Waktu: {elapsed:.0f} detik\n"
+    )
+    if report.unrecorded:
+        text += f"\n⚠️ {report.unrecorded} refund gagal dicatat ke database, lihat log bot\n"
+    if report.failed:
+        text += "\n**Gagal:**\n"
+        for charge_id, error in report.failed[:10]:
+            text += f"`{charge_id[:24]}…` {error[:60]}\n"
+        if len(report.failed) > 10:
+            text += f"... dan {len(report.failed) - 10} lainnya (lihat log bot)\n"
+    return text
+
+@bot.on(events.CallbackQuery(pattern=rb'^refund:(ok|no):([0-9a-f]+)$'))
+@timed_handler
+async def refund_confirm_handler(event):
+    """Tombol konfirmasi refund: hanya admin pembuat batch yang bisa menjalankannya"""
+    if event.sender_id not in ADMIN_IDS:
+        await event.answer("❌ Hanya untuk owner bot", alert=True)
         return
     
-    refund_data = event.client.refund_data
-    user_id = refund_data['user_id']
-    charge_id = refund_data['charge_id']
+    action = event.pattern_match.group(1).decode()
+    batch = refund_sessions.pop(event.sender_id, event.pattern_match.group(2).decode())
+    if batch is None:
+        await event.answer("Batch tidak ditemukan atau sudah kedaluwarsa", alert=True)
+        return
     
-    text = event.message.text.strip().upper()
+    if action == 'no':
+        await event.answer()
+        await event.edit("❌ Refund dibatalkan.")
+        return
     
-    if text == 'YA':
-        processing_msg = await event.respond("⏳ **Memproses refund...**")
-        
-        try:
-            # Proses refund via API
-            result = await bot(functions.payments.RefundStarsChargeRequest(
-                user_id=await bot.get_input_entity(user_id),
-                charge_id=charge_id
-            ))
-            
-            await processing_msg.delete()
-            
-            # Hapus pesan konfirmasi
-            try:
-                await bot.delete_messages(
-                    refund_data['chat_id'],
-                    [refund_data['confirm_msg_id']]
-                )
-            except:
-                pass
-            
-            # Update status di database
-            db = SessionLocal()
-            try:
-                transaction = db.query(Transaction).filter(Transaction.charge_id == charge_id).first()
-                if transaction:
-                    transaction.status = 'refunded'
-                    transaction.refunded_at = get_wib_time()
-                    db.commit()
-            finally:
-                db.close()
-            
-            await event.respond(
-                f"✅ **Refund Berhasil!**\n\n"
-                f"User ID: `{user_id}`\n"
-                f"Charge ID: `{charge_id}`\n\n"
-                f"Stars telah dikembalikan ke user."
-            )
-            
-            # Notifikasi user
-            try:
-                await bot.send_message(
-                    user_id,
-                    f"🔄 **Deposit Dikembalikan (Refund)**\n\n"
-                    f"ID Transaksi: `{charge_id}`\n\n"
-                    f"Stars telah dikembalikan ke akun Anda."
-                )
-            except:
-                pass
-            
-            logger.info(f"Refund processed: {charge_id} for user {user_id}")
-            
-        except Exception as e:
-            await processing_msg.delete()
-            error_msg = str(e)
-            
-            if "CHARGE_NOT_FOUND" in error_msg:
-                feedback = "❌ Charge ID tidak ditemukan atau tidak valid"
-            elif "CHARGE_ALREADY_REFUNDED" in error_msg:
-                feedback = "❌ Transaksi ini sudah direfund sebelumnya"
-            else:
-                feedback = f"❌ Gagal refund: {error_msg}"
-            
-            await event.respond(feedback)
-            logger.error(f"Refund error for {charge_id}: {e}")
-        
-        delattr(event.client, 'refund_data')
-        
-    elif text == 'TIDAK':
-        # Batal refund
-        try:
-            await bot.delete_messages(
-                refund_data['chat_id'],
-                [refund_data['confirm_msg_id']]
-            )
-        except:
-            pass
-        
-        await event.respond("❌ Refund dibatalkan.")
-        delattr(event.client, 'refund_data')
+    await event.answer("⏳ Memproses refund...")
+    await event.edit(_refund_progress_text(batch, RefundReport(len(batch.items))))
+    logger.info(f"Refund batch {batch.id}: {len(batch.items)} charge oleh admin {batch.admin_id}")
+    
+    async def on_progress(report):
+        await bot.edit_message(batch.chat_id, batch.message_id, _refund_progress_text(batch, report))
+    
+    report = await refund_runner.run(batch.items, on_progress)
+    outbox_sender.wake()
+    
+    logger.info(
+        f"Refund batch {batch.id} selesai: {report.refunded} berhasil, {report.already} sudah, "
+        f"{len(report.failed)} gagal, {report.unrecorded} tidak tercatat"
+    )
+    summary = _refund_summary_text(batch, report)
+    try:
+        await bot.edit_message(batch.chat_id, batch.message_id, summary)
+    except errors.RPCError:
+        await bot.send_message(batch.chat_id, summary)
 
 async def main():
     await bot.start(bot_token=BOT_TOKEN)
@@ -462,8 +570,35 @@ async def main():
     logger.info("="*50)
     logger.info(f"WEBHOOK URL: {WEBHOOK_URL}")
     logger.info("="*50)
+    if not INTERNAL_API_SECRET:
+        logger.warning("INTERNAL_API_SECRET belum di-set: API tidak dinotifikasi saat pembayaran masuk")
+    
+    # Expire invoice pending yang terbengkalai (PENDING_SWEEPER=0 jika dijalankan
+    # sebagai worker terpisah: python py/sweeper.py)
+    sweeper_task = None
+    if os.getenv('PENDING_SWEEPER', '1') != '0':
+        sweeper_task = asyncio.create_task(run_sweeper(adb, get_wib_time))
+    
+    outbox_task = asyncio.create_task(outbox_sender.run())
     
-    await bot.run_until_disconnected()
+    # Pindahkan transaksi final yang lama ke transactions_archive
+    # (TRANSACTION_ARCHIVER=0 jika dijalankan lewat python py/archive.py)
+    archiver_task = None
+    if os.getenv('TRANSACTION_ARCHIVER', '1') != '0':
+        archiver_task = asyncio.create_task(run_archiver(adb, get_wib_time))
+    
+    if BOT_METRICS_PORT:
+        metrics.start_metrics_server(int(BOT_METRICS_PORT))
+        logger.info(f"Metrics bot di port {BOT_METRICS_PORT}/metrics")
+    
+    try:
+        await bot.run_until_disconnected()
+    finally:
+        for task in (outbox_task, sweeper_task, archiver_task):
+            if task:
+                task.cancel()
+        http.shutdown()
+        adb.shutdown()
 
 if __name__ == '__main__':
     try:
@@ -0,0 +1,121 @@
+"""Server Telegram Bot API palsu untuk load test lokal.
+
+Menjawab `POST /bot<token>/<method>` seperti api.telegram.org, dengan
+latency dan error rate yang bisa diatur, sehingga benchmark tidak pernah
+menyentuh Telegram asli.
+
+    python bench/fake_bot_api.py --port 8081 --latency-ms 80 --jitter-ms 40 --error-rate 0.01
+
+Arahkan API ke server ini dengan BOT_API_BASE_URL=http://127.0.0.1:8081
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_PATH_RE = re.compile(r'^/bot(?P<token>[^/]+)/(?P<method>\w+)$')
+
+
+class FakeBotAPIConfig:
+    def __init__(self, latency_ms=50.0, jitter_ms=20.0, error_rate=0.0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.calls = 0
+        self.errors = 0
+        self.lock = threading.Lock()
+
+    def delay(self):
+        jitter = random.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0
+        return max(0.0, self.latency_ms + jitter) / 1000
+
+
+def _result_for(method, params):
+    if method == 'createInvoiceLink':
+        return f"https://t.me/$fake_{params.get('payload', '')}"
+    if method == 'getMe':
+        return {'id': 1, 'is_bot': True, 'first_name': 'FakeBot', 'username': 'fake_bot'}
+    if method == 'sendMessage':
+        return {'message_id': random.randint(1, 10 ** 6), 'chat': {'id': params.get('chat_id')}}
+    return True
+
+
+def make_handler(config):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            raw = self.rfile.read(length) if length else b''
+            match = _PATH_RE.match(self.path)
+
+            time.sleep(config.delay())
+
+            with config.lock:
+                config.calls += 1
+                failed = random.random() < config.error_rate
+                if failed:
+                    config.errors += 1
+
+            if not match:
+                self._send(404, {'ok': False, 'error_code': 404, 'description': 'Not Found'})
+            elif failed:
+                self._send(500, {'ok': False, 'error_code': 500, 'description': 'Internal Server Error (fake)'})
+            else:
+                try:
+                    params = json.loads(raw) if raw else {}
+                except ValueError:
+                    params = {}
+                self._send(200, {'ok': True, 'result': _result_for(match.group('method'), params)})
+
+        do_GET = do_POST
+
+        def _send(self, status, body):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def start_fake_bot_api(host='127.0.0.1', port=0, latency_ms=50.0, jitter_ms=20.0, error_rate=0.0):
+    """Jalankan server di thread background. Return (server, config, base_url)"""
+    config = FakeBotAPIConfig(latency_ms, jitter_ms, error_rate)
+    server = ThreadingHTTPServer((host, port), make_handler(config))
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name='fake-bot-api', daemon=True)
+    thread.start()
+    base_url = f"http://{host}:{server.server_address[1]}"
+    return server, config, base_url
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fake Telegram Bot API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency-ms', type=float, default=50.0)
+    parser.add_argument('--jitter-ms', type=float, default=20.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    config = FakeBotAPIConfig(args.latency_ms, args.jitter_ms, args.error_rate)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(config))
+    print(f"Fake Bot API di http://{args.host}:{args.port} "
+          f"(latency {args.latency_ms}±{args.jitter_ms} ms, error rate {args.error_rate})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
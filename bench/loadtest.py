@@ -0,0 +1,321 @@
+"""Load test API Gacha (py/gacha.py) dengan Bot API palsu.
+
+Menjalankan API terhadap database sementara dan fake Bot API lokal
+(bench/fake_bot_api.py), lalu mengirim campuran request yang realistis
+pada concurrency tertentu. Hasil: p50/p95/p99 latency, error dan
+throughput per endpoint.
+
+Rate limit API (py/ratelimit.py) dimatikan di API yang di-spawn karena
+semua request bench datang dari 127.0.0.1; aktifkan dengan --rate-limit.
+Response 429 dihitung di kolom `rate_limited` dan tidak masuk latency.
+
+    python bench/loadtest.py --concurrency 32 --duration 30
+    python bench/loadtest.py --mix auth=10,create-deposit=10,check-transaction=60,user=20
+    python bench/loadtest.py --bot-latency-ms 300 --bot-error-rate 0.05 --json bench_output.json
+    python bench/loadtest.py --rate-limit
+
+Dengan --url, server yang sudah berjalan yang diuji (tanpa spawn API dan
+tanpa fake Bot API; server tersebut harus sudah diarahkan ke Bot API
+palsu lewat BOT_API_BASE_URL, dan dijalankan dengan RATE_LIMIT_ENABLED=0
+kecuali rate limit memang ikut diukur).
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict, deque
+
+import requests
+
+try:
+    from bench.fake_bot_api import start_fake_bot_api
+except ImportError:
+    from fake_bot_api import start_fake_bot_api
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_MIX = 'auth=20,create-deposit=10,check-transaction=50,user=20'
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise SystemExit(f"Endpoint tidak dikenal di --mix: {name} (pilihan: {', '.join(SCENARIOS)})")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+class RateLimited(Exception):
+    """Response 429 dari rate limit API"""
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.rate_limited = defaultdict(int)
+
+    def record(self, name, seconds, ok):
+        with self.lock:
+            self.latencies[name].append(seconds)
+            if not ok:
+                self.errors[name] += 1
+
+    def record_limited(self, name):
+        # Jalur cepat 429 tidak mewakili endpoint: tidak masuk latency
+        with self.lock:
+            self.rate_limited[name] += 1
+
+
+class Context:
+    def __init__(self, base_url, user_ids):
+        self.base_url = base_url
+        self.user_ids = user_ids
+        # Payload hasil create-deposit, dipakai skenario check-transaction
+        self.payloads = deque(maxlen=5000)
+
+
+def _succeeded(response):
+    if response.status_code == 429:
+        raise RateLimited()
+    return response.ok and response.json().get('success')
+
+
+def _auth_body(telegram_id):
+    return {'user': json.dumps({'id': telegram_id, 'username': f'bench{telegram_id}', 'first_name': 'Bench'})}
+
+
+def scenario_auth(session, ctx):
+    response = session.post(f"{ctx.base_url}/api/auth", json=_auth_body(random.choice(ctx.user_ids)), timeout=30)
+    return _succeeded(response)
+
+
+def scenario_create_deposit(session, ctx):
+    response = session.post(f"{ctx.base_url}/api/create-deposit", json={
+        'telegram_id': random.choice(ctx.user_ids),
+        'amount': random.randint(1, 100)
+    }, timeout=30)
+    if response.status_code == 429:
+        raise RateLimited()
+    data = response.json() if response.content else {}
+    if response.ok and data.get('success'):
+        ctx.payloads.append(data['payload'])
+        return True
+    return False
+
+
+def scenario_check_transaction(session, ctx):
+    try:
+        payload = random.choice(ctx.payloads)
+    except IndexError:
+        return scenario_create_deposit(session, ctx)
+    response = session.post(f"{ctx.base_url}/api/check-transaction", json={'payload': payload}, timeout=30)
+    return _succeeded(response)
+
+
+def scenario_user(session, ctx):
+    response = session.get(f"{ctx.base_url}/api/user/{random.choice(ctx.user_ids)}?limit=20", timeout=30)
+    return _succeeded(response)
+
+
+SCENARIOS = {
+    'auth': scenario_auth,
+    'create-deposit': scenario_create_deposit,
+    'check-transaction': scenario_check_transaction,
+    'user': scenario_user,
+}
+
+
+def worker(ctx, mix, recorder, start_at, deadline):
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    session = requests.Session()
+    while time.perf_counter() < deadline:
+        name = random.choices(names, weights)[0]
+        started = time.perf_counter()
+        limited = False
+        try:
+            ok = SCENARIOS[name](session, ctx)
+        except RateLimited:
+            ok, limited = False, True
+        except Exception:
+            ok = False
+        finished = time.perf_counter()
+        # Request selama warmup tidak dihitung
+        if started < start_at:
+            continue
+        if limited:
+            recorder.record_limited(name)
+        else:
+            recorder.record(name, finished - started, ok)
+    session.close()
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def summarize(recorder, duration):
+    rows = []
+    all_latencies = []
+    for name in sorted(set(recorder.latencies) | set(recorder.rate_limited)):
+        values = sorted(recorder.latencies[name])
+        all_latencies.extend(values)
+        rows.append(_summary_row(name, values, recorder.errors[name], recorder.rate_limited[name], duration))
+    all_latencies.sort()
+    rows.append(_summary_row(
+        'TOTAL', all_latencies, sum(recorder.errors.values()), sum(recorder.rate_limited.values()), duration
+    ))
+    return rows
+
+
+def _summary_row(name, values, errors, rate_limited, duration):
+    return {
+        'endpoint': name,
+        'requests': len(values),
+        'errors': errors,
+        'rate_limited': rate_limited,
+        'rps': round(len(values) / duration, 1) if duration else 0,
+        'p50_ms': round(percentile(values, 50) * 1000, 1),
+        'p95_ms': round(percentile(values, 95) * 1000, 1),
+        'p99_ms': round(percentile(values, 99) * 1000, 1),
+        'max_ms': round((values[-1] if values else 0) * 1000, 1),
+    }
+
+
+def print_table(rows):
+    headers = ['endpoint', 'requests', 'errors', 'rate_limited', 'rps', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms']
+    widths = [max(len(h), *(len(str(row[h])) for row in rows)) for h in headers]
+    print('  '.join(h.ljust(w) for h, w in zip(headers, widths)))
+    for row in rows:
+        print('  '.join(str(row[h]).ljust(w) for h, w in zip(headers, widths)))
+
+
+def wait_until_ready(base_url, process=None, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process is not None and process.poll() is not None:
+            raise SystemExit('API berhenti sebelum siap, ulangi dengan --show-api-log')
+        try:
+            if requests.get(f"{base_url}/api/test", timeout=1).ok:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise SystemExit(f"API di {base_url} tidak siap dalam {timeout} detik")
+
+
+def start_api(port, bot_api_url, workdir, show_log=False, rate_limit=False):
+    """Spawn py/gacha.py dengan database sementara di `workdir`"""
+    env = dict(os.environ)
+    env.update({
+        'PORT': str(port),
+        'DATABASE_URL': f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        'BOT_TOKEN': env.get('BENCH_BOT_TOKEN', 'bench:token'),
+        'BOT_API_BASE_URL': bot_api_url,
+        # Semua request bench dari satu IP: dengan rate limit yang terukur hanya 429
+        'RATE_LIMIT_ENABLED': '1' if rate_limit else '0',
+    })
+    # Log per-request dari server ikut memperlambat pengukuran, default dibuang
+    output = None if show_log else subprocess.DEVNULL
+    # Skema tidak dibuat otomatis saat API start
+    subprocess.run(
+        [sys.executable, os.path.join(REPO_ROOT, 'py', 'models.py'), 'migrate'],
+        cwd=workdir, env=env, stdout=output, stderr=output, check=True
+    )
+    return subprocess.Popen(
+        [sys.executable, os.path.join(REPO_ROOT, 'py', 'gacha.py')],
+        cwd=workdir, env=env, stdout=output, stderr=output
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test API Gacha')
+    parser.add_argument('--url', help='Uji server yang sudah berjalan (tanpa spawn API)')
+    parser.add_argument('--port', type=int, default=18080, help='Port API yang di-spawn')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=20, help='Detik pengukuran')
+    parser.add_argument('--warmup', type=float, default=2, help='Detik warmup (tidak dihitung)')
+    parser.add_argument('--users', type=int, default=200, help='Jumlah telegram_id berbeda')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f'Bobot endpoint (default {DEFAULT_MIX})')
+    parser.add_argument('--bot-latency-ms', type=float, default=50)
+    parser.add_argument('--bot-jitter-ms', type=float, default=20)
+    parser.add_argument('--bot-error-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help='Simpan hasil ke file JSON')
+    parser.add_argument('--show-api-log', action='store_true', help='Tampilkan log server API')
+    parser.add_argument('--rate-limit', action='store_true',
+                        help='Aktifkan rate limit di API yang di-spawn (default mati)')
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    mix = parse_mix(args.mix)
+    process = None
+    fake_server = None
+
+    with tempfile.TemporaryDirectory(prefix='gacha-bench-') as workdir:
+        try:
+            if args.url:
+                base_url = args.url.rstrip('/')
+                wait_until_ready(base_url)
+            else:
+                fake_server, _, bot_api_url = start_fake_bot_api(
+                    latency_ms=args.bot_latency_ms,
+                    jitter_ms=args.bot_jitter_ms,
+                    error_rate=args.bot_error_rate
+                )
+                base_url = f"http://127.0.0.1:{args.port}"
+                process = start_api(args.port, bot_api_url, workdir, args.show_api_log, args.rate_limit)
+                wait_until_ready(base_url, process)
+
+            ctx = Context(base_url, list(range(10 ** 9, 10 ** 9 + args.users)))
+
+            # Pastikan semua user sudah ada sebelum pengukuran
+            with requests.Session() as session:
+                for telegram_id in ctx.user_ids:
+                    session.post(f"{base_url}/api/auth", json=_auth_body(telegram_id), timeout=30)
+
+            recorder = Recorder()
+            start_at = time.perf_counter() + args.warmup
+            deadline = start_at + args.duration
+            threads = [
+                threading.Thread(target=worker, args=(ctx, mix, recorder, start_at, deadline), daemon=True)
+                for _ in range(args.concurrency)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            rows = summarize(recorder, args.duration)
+            print(f"\nconcurrency={args.concurrency} duration={args.duration}s mix={args.mix} "
+                  f"bot_latency={args.bot_latency_ms}±{args.bot_jitter_ms}ms bot_error_rate={args.bot_error_rate}")
+            print_table(rows)
+
+            if args.json:
+                with open(args.json, 'w') as f:
+                    json.dump({'config': vars(args), 'results': rows}, f, indent=2)
+        finally:
+            if process is not None:
+                process.terminate()
+                try:
+                    process.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+            if fake_server is not None:
+                fake_server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
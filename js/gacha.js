@@ -3,6 +3,16 @@ const API_BASE_URL = 'https://logs-meets-charlie-wheels.trycloudflare.com';
 let currentUser = null;
 let currentPayload = null;
 let paymentCheckInterval = null;
+let paymentSubscription = null;
+// 'subscribe' = long-poll /api/wait-transaction, 'poll' = cek tiap 3 detik
+const PAYMENT_CHECK_MODE = 'subscribe';
+const PAYMENT_WAIT_SECONDS = 25;
+const PAYMENT_MAX_WAIT_MS = 3 * 60 * 1000;
+// Riwayat transaksi: infinite scroll berbasis cursor
+const HISTORY_PAGE_SIZE = 20;
+let historyCursor = null;
+let historyLoading = false;
+let historyObserver = null;
 let reconnectAttempts = 0;
 const MAX_RECONNECT_ATTEMPTS = 3;
 
@@ -15,24 +25,6 @@ tg.ready();
 tg.setHeaderColor('#667eea');
 tg.setBackgroundColor('#f8f9fa');
 
-// Cek koneksi ke API sebelum melakukan apapun
-async function checkApiConnection() {
-    try {
-        const response = await fetchWithTimeout(`${API_BASE_URL}/api/test`, {
-            method: 'GET',
-            timeout: 5000
-        });
-        
-        if (response.ok) {
-            console.log('✅ API Connection OK');
-            return true;
-        }
-    } catch (error) {
-        console.error('❌ API Connection Failed:', error);
-        return false;
-    }
-}
-
 // Fetch dengan timeout
 async function fetchWithTimeout(url, options = {}) {
     const { timeout = 10000 } = options;
@@ -60,18 +52,42 @@ async function fetchWithTimeout(url, options = {}) {
     }
 }
 
+// Cache response GET per URL beserta ETag-nya (validator untuk If-None-Match)
+const etagCache = new Map();
+
+// GET JSON dengan conditional request: 304 = pakai data dari cache
+async function fetchJsonCached(url, options = {}) {
+    const cached = etagCache.get(url);
+    const headers = cached ? { 'If-None-Match': cached.etag } : {};
+
+    const response = await fetchWithTimeout(url, {
+        ...options,
+        method: 'GET',
+        cache: 'no-store',
+        headers: { ...headers, ...options.headers }
+    });
+
+    if (response.status === 304 && cached) {
+        return cached.data;
+    }
+
+    if (!response.ok) {
+        throw new Error(`HTTP error! status: ${response.status}`);
+    }
+
+    const data = await response.json();
+    const etag = response.headers.get('ETag');
+    if (etag) {
+        etagCache.set(url, { etag, data });
+    }
+    return data;
+}
+
 // Cek apakah user sudah login via Telegram
 document.addEventListener('DOMContentLoaded', async function() {
     showLoading(true);
     
-    // Cek koneksi API dulu
-    const apiConnected = await checkApiConnection();
-    if (!apiConnected) {
-        showError('Tidak dapat terhubung ke server. Periksa koneksi internet Anda.');
-        showLoading(false);
-        return;
-    }
-    
+    // Koneksi API dicek sekaligus oleh /api/bootstrap (satu request saat startup)
     if (tg.initDataUnsafe && tg.initDataUnsafe.user) {
         await authenticateUser();
     } else {
@@ -91,8 +107,8 @@ document.getElementById('continueBtn').addEventListener('click', showInvoicePrev
 document.getElementById('backBtn').addEventListener('click', () => {
     document.getElementById('invoicePreview').style.display = 'none';
     document.getElementById('mainContent').style.display = 'block';
-    if (paymentCheckInterval) {
-        clearInterval(paymentCheckInterval);
+    if (paymentCheckInterval || paymentSubscription) {
+        stopPaymentCheck();
         document.getElementById('paymentModal').style.display = 'none';
     }
 });
@@ -139,7 +155,9 @@ async function authenticateUser(retryCount = 0) {
 
         console.log('Sending auth data:', authData);
 
-        const response = await fetchWithTimeout(`${API_BASE_URL}/api/auth`, {
+        // Auth + profil + saldo + riwayat + invoice pending dalam satu request
+        const response = await fetchWithTimeout(
+            `${API_BASE_URL}/api/bootstrap?limit=${HISTORY_PAGE_SIZE}`, {
             method: 'POST',
             body: JSON.stringify(authData),
             timeout: 10000
@@ -150,18 +168,24 @@ async function authenticateUser(retryCount = 0) {
         }
 
         const responseData = await response.json();
-        console.log('Auth response:', responseData);
+        console.log('Bootstrap response:', responseData);
 
         if (responseData.error) {
             throw new Error(responseData.error);
         }
 
-        currentUser = responseData;
+        currentUser = responseData.user;
         updateUserInfo();
         document.getElementById('mainContent').style.display = 'block';
         document.getElementById('historySection').style.display = 'block';
-        await loadTransactionHistory();
+        renderHistoryPage(responseData);
         showSuccess(`Selamat datang, ${currentUser.first_name || currentUser.username}!`);
+
+        // Lanjutkan menunggu invoice yang belum dibayar
+        if (responseData.pending_invoice) {
+            currentPayload = responseData.pending_invoice.payload;
+            startPaymentCheck(currentPayload, true);
+        }
         
         // Reset reconnect attempts on success
         reconnectAttempts = 0;
@@ -289,11 +313,141 @@ document.getElementById('payBtn').addEventListener('click', function(e) {
 });
 
 // Cek status pembayaran
-function startPaymentCheck(payload) {
+// quiet: jangan tampilkan error saat waktu tunggu habis (invoice lama dari bootstrap)
+function startPaymentCheck(payload, quiet = false) {
+    stopPaymentCheck();
+
+    if (PAYMENT_CHECK_MODE === 'subscribe') {
+        subscribePaymentStatus(payload, quiet);
+    } else {
+        pollPaymentStatus(payload, quiet);
+    }
+}
+
+// Hentikan polling / subscription yang sedang berjalan
+function stopPaymentCheck() {
     if (paymentCheckInterval) {
         clearInterval(paymentCheckInterval);
+        paymentCheckInterval = null;
+    }
+    if (paymentSubscription) {
+        paymentSubscription.active = false;
+        if (paymentSubscription.controller) {
+            paymentSubscription.controller.abort();
+        }
+        paymentSubscription = null;
+    }
+}
+
+// Pembayaran selesai: update saldo dan tampilan
+async function onPaymentCompleted(data) {
+    stopPaymentCheck();
+    document.getElementById('paymentModal').style.display = 'none';
+
+    // Update saldo user
+    currentUser.balance += data.amount;
+    updateUserInfo();
+
+    // Load ulang riwayat
+    await loadTransactionHistory();
+
+    // Kembali ke halaman utama
+    document.getElementById('invoicePreview').style.display = 'none';
+    document.getElementById('mainContent').style.display = 'block';
+
+    showSuccess(`Deposit ${formatNumber(data.amount)} ⭐ berhasil!`);
+    
+    // Kirim notifikasi ke Telegram
+    tg.HapticFeedback.notificationOccurred('success');
+}
+
+function onPaymentTimeout(quiet = false) {
+    stopPaymentCheck();
+    document.getElementById('paymentModal').style.display = 'none';
+    if (!quiet) {
+        showError('Waktu pembayaran habis. Silakan coba lagi.');
+    }
+}
+
+// Mode subscribe: satu request long-poll terbuka per invoice,
+// server menjawab begitu transaksi keluar dari status pending
+async function subscribePaymentStatus(payload, quiet = false) {
+    const subscription = { active: true, controller: null };
+    paymentSubscription = subscription;
+    const deadline = Date.now() + PAYMENT_MAX_WAIT_MS;
+
+    while (subscription.active && Date.now() < deadline) {
+        const remaining = Math.max(1, Math.floor((deadline - Date.now()) / 1000));
+        const waitSeconds = Math.min(PAYMENT_WAIT_SECONDS, remaining);
+
+        try {
+            subscription.controller = new AbortController();
+            const response = await fetch(`${API_BASE_URL}/api/wait-transaction`, {
+                method: 'POST',
+                mode: 'cors',
+                credentials: 'omit',
+                signal: subscription.controller.signal,
+                headers: {
+                    'Content-Type': 'application/json',
+                    'Accept': 'application/json'
+                },
+                body: JSON.stringify({ payload, timeout: waitSeconds })
+            });
+
+            if (response.status === 404) {
+                // Server lama tanpa endpoint long-poll
+                if (subscription.active) {
+                    paymentSubscription = null;
+                    pollPaymentStatus(payload, quiet);
+                }
+                return;
+            }
+
+            if (response.status === 429) {
+                // Rate limit: tunggu sesuai Retry-After lalu subscribe ulang
+                const retryAfter = parseInt(response.headers.get('Retry-After'), 10) || 5;
+                await new Promise(resolve => setTimeout(resolve, retryAfter * 1000));
+                continue;
+            }
+
+            if (!response.ok) {
+                throw new Error(`HTTP error! status: ${response.status}`);
+            }
+
+            const data = await response.json();
+            if (!subscription.active) return;
+
+            if (data.status === 'completed') {
+                await onPaymentCompleted(data);
+                return;
+            }
+
+            if (data.status && data.status !== 'pending') {
+                stopPaymentCheck();
+                document.getElementById('paymentModal').style.display = 'none';
+                if (!quiet) {
+                    showError('Pembayaran tidak berhasil. Silakan coba lagi.');
+                }
+                return;
+            }
+
+            document.getElementById('paymentStatus').textContent = 'Menunggu pembayaran...';
+
+        } catch (error) {
+            if (!subscription.active) return;
+            console.error('Error waiting payment:', error);
+            // Jeda sebentar sebelum subscribe ulang
+            await new Promise(resolve => setTimeout(resolve, 3000));
+        }
+    }
+
+    if (subscription.active) {
+        onPaymentTimeout(quiet);
     }
+}
 
+// Mode poll: cek status tiap 3 detik
+function pollPaymentStatus(payload, quiet = false) {
     let checkCount = 0;
     const maxChecks = 60; // Maksimal 3 menit (60 x 3 detik)
 
@@ -314,25 +468,7 @@ function startPaymentCheck(payload) {
             const data = await response.json();
 
             if (data.status === 'completed') {
-                clearInterval(paymentCheckInterval);
-                document.getElementById('paymentModal').style.display = 'none';
-
-                // Update saldo user
-                currentUser.balance += data.amount;
-                updateUserInfo();
-
-                // Load ulang riwayat
-                await loadTransactionHistory();
-
-                // Kembali ke halaman utama
-                document.getElementById('invoicePreview').style.display = 'none';
-                document.getElementById('mainContent').style.display = 'block';
-
-                showSuccess(`Deposit ${formatNumber(data.amount)} ⭐ berhasil!`);
-                
-                // Kirim notifikasi ke Telegram
-                tg.HapticFeedback.notificationOccurred('success');
-                
+                await onPaymentCompleted(data);
                 return;
             }
 
@@ -340,9 +476,7 @@ function startPaymentCheck(payload) {
                 `Menunggu pembayaran... (${checkCount}/${maxChecks})`;
 
             if (checkCount >= maxChecks) {
-                clearInterval(paymentCheckInterval);
-                document.getElementById('paymentModal').style.display = 'none';
-                showError('Waktu pembayaran habis. Silakan coba lagi.');
+                onPaymentTimeout(quiet);
             }
 
         } catch (error) {
@@ -354,56 +488,124 @@ function startPaymentCheck(payload) {
 
 // Batalkan pengecekan pembayaran
 function cancelPaymentCheck() {
-    if (paymentCheckInterval) {
-        clearInterval(paymentCheckInterval);
-    }
+    stopPaymentCheck();
     document.getElementById('paymentModal').style.display = 'none';
     showError('Pembayaran dibatalkan');
 }
 
-// Load riwayat transaksi
+// Load riwayat transaksi (halaman pertama)
 async function loadTransactionHistory() {
     if (!currentUser) return;
 
-    try {
-        const response = await fetchWithTimeout(`${API_BASE_URL}/api/user/${currentUser.id}`, {
-            method: 'GET',
-            timeout: 5000
-        });
-
-        if (!response.ok) {
-            throw new Error(`HTTP error! status: ${response.status}`);
-        }
+    historyCursor = null;
 
-        const data = await response.json();
+    try {
+        const data = await fetchJsonCached(
+            `${API_BASE_URL}/api/user/${currentUser.id}?limit=${HISTORY_PAGE_SIZE}`,
+            { timeout: 5000 }
+        );
 
-        const historyList = document.getElementById('historyList');
-        historyList.innerHTML = '';
-
-        if (data.transactions && data.transactions.length > 0) {
-            data.transactions.forEach(trans => {
-                const item = document.createElement('div');
-                item.className = 'history-item';
-                item.innerHTML = `
-                    <div class="history-info">
-                        <div class="history-amount">+${formatNumber(trans.amount)} ⭐</div>
-                        <div class="history-date">${trans.completed_at || 'Pending'}</div>
-                    </div>
-                    <div class="history-status">
-                        <span class="status-badge success">✅ Selesai</span>
-                    </div>
-                `;
-                historyList.appendChild(item);
-            });
-        } else {
-            historyList.innerHTML = '<p style="text-align: center; color: #999; padding: 20px;">Belum ada transaksi</p>';
-        }
+        renderHistoryPage(data);
     } catch (error) {
         console.error('Error loading history:', error);
         // Don't show error to user for history loading
     }
 }
 
+// Tampilkan halaman pertama riwayat (dari /api/user atau /api/bootstrap)
+function renderHistoryPage(data) {
+    const historyList = document.getElementById('historyList');
+    historyList.innerHTML = '';
+    historyCursor = null;
+
+    if (data.transactions && data.transactions.length > 0) {
+        appendHistoryItems(data.transactions);
+        historyCursor = data.next_cursor || null;
+        observeHistoryEnd();
+    } else {
+        historyList.innerHTML = '<p style="text-align: center; color: #999; padding: 20px;">Belum ada transaksi</p>';
+    }
+}
+
+// Load halaman berikutnya saat user scroll sampai bawah
+async function loadMoreTransactions() {
+    if (!currentUser || !historyCursor || historyLoading) return;
+
+    historyLoading = true;
+
+    try {
+        const params = new URLSearchParams({
+            limit: HISTORY_PAGE_SIZE,
+            cursor: historyCursor
+        });
+        const data = await fetchJsonCached(
+            `${API_BASE_URL}/api/transactions/${currentUser.id}?${params}`,
+            { timeout: 5000 }
+        );
+
+        appendHistoryItems(data.transactions || []);
+        historyCursor = data.next_cursor || null;
+        observeHistoryEnd();
+    } catch (error) {
+        console.error('Error loading more history:', error);
+    } finally {
+        historyLoading = false;
+    }
+}
+
+function appendHistoryItems(transactions) {
+    const historyList = document.getElementById('historyList');
+
+    transactions.forEach(trans => {
+        const item = document.createElement('div');
+        item.className = 'history-item';
+        item.innerHTML = `
+            <div class="history-info">
+                <div class="history-amount">+${formatNumber(trans.amount)} ⭐</div>
+                <div class="history-date">${trans.completed_at || 'Pending'}</div>
+            </div>
+            <div class="history-status">
+                <span class="status-badge success">✅ Selesai</span>
+            </div>
+        `;
+        historyList.appendChild(item);
+    });
+}
+
+// Pasang sentinel di akhir list; saat terlihat, load halaman berikutnya
+function observeHistoryEnd() {
+    const historyList = document.getElementById('historyList');
+    let sentinel = document.getElementById('historySentinel');
+
+    if (!historyCursor) {
+        if (sentinel) sentinel.remove();
+        return;
+    }
+
+    if (!sentinel) {
+        sentinel = document.createElement('div');
+        sentinel.id = 'historySentinel';
+        sentinel.style.height = '1px';
+    }
+    historyList.appendChild(sentinel);
+
+    if (!('IntersectionObserver' in window)) {
+        // WebView lama: cukup load semua halaman berurutan
+        setTimeout(loadMoreTransactions, 0);
+        return;
+    }
+
+    if (!historyObserver) {
+        historyObserver = new IntersectionObserver(entries => {
+            if (entries.some(entry => entry.isIntersecting)) {
+                loadMoreTransactions();
+            }
+        });
+    }
+    historyObserver.disconnect();
+    historyObserver.observe(sentinel);
+}
+
 // Utility functions
 function showLoading(show) {
     const loadingEl = document.getElementById('loading');
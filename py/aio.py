@@ -0,0 +1,66 @@
+"""Akses database dan HTTP non-blocking untuk handler async (b.py).
+
+SQLAlchemy dan `requests` bersifat blocking, jadi semua kerja tersebut
+dijalankan di thread pool terbatas. Event loop Telethon tetap bebas
+memproses update lain (termasuk pre-checkout query) selama query atau
+request HTTP berjalan.
+"""
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+
+class AsyncDB:
+    """Jalankan fungsi `func(db, *args)` dengan session sendiri di thread pool"""
+
+    def __init__(self, session_factory, max_workers=4):
+        self.session_factory = session_factory
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='bot-db')
+
+    def _call(self, func, args, kwargs):
+        db = self.session_factory()
+        try:
+            return func(db, *args, **kwargs)
+        finally:
+            db.close()
+
+    async def run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        # Bawa contextvars (mis. profil SQL handler) ke thread pool
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(self.executor, context.run, self._call, func, args, kwargs)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+
+class AsyncHTTP:
+    """Client HTTP async: request dijalankan di thread pool terpisah dari DB"""
+
+    def __init__(self, max_workers=8, timeout=10, session=None):
+        self.timeout = timeout
+        self.session = session or requests.Session()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='bot-http')
+
+    async def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        loop = asyncio.get_running_loop()
+        call = functools.partial(self.session.request, method, url, **kwargs)
+        return await loop.run_in_executor(self.executor, call)
+
+    async def run(self, func, *args, **kwargs):
+        """Jalankan fungsi blocking lain (mis. BotAPI) di thread pool HTTP"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    async def post_json(self, url, data, **kwargs):
+        """POST JSON dan kembalikan body response yang sudah di-decode"""
+        response = await self.request('POST', url, json=data, **kwargs)
+        return response.json()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+        self.session.close()
@@ -0,0 +1,45 @@
+"""Pengaturan, metrics HTTP dan bentuk response yang sama untuk API Flask
+(py/gacha.py) dan ASGI (py/gacha_asgi.py), tanpa import framework web.
+"""
+import os
+
+from dotenv import load_dotenv
+
+try:
+    from py import metrics
+except ImportError:
+    import metrics
+
+load_dotenv()
+
+# Long-poll status pembayaran
+LONGPOLL_TIMEOUT = int(os.getenv('LONGPOLL_TIMEOUT', 25))
+# Secret endpoint internal/admin (header X-Internal-Secret), harus sama dengan
+# b.py. Sengaja tidak memakai BOT_TOKEN; kosong = endpoint internal/admin ditolak
+INTERNAL_API_SECRET = os.getenv('INTERNAL_API_SECRET')
+# Webhook Bot API (pre-checkout + pembayaran langsung di proses ini); kosong = nonaktif
+TELEGRAM_WEBHOOK_SECRET = os.getenv('TELEGRAM_WEBHOOK_SECRET')
+# Jika di-set, /metrics hanya bisa dibaca dengan header Authorization: Bearer <token>
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+# Metrics HTTP (lihat /metrics)
+HTTP_REQUESTS = metrics.registry.counter(
+    'gacha_http_requests_total', 'Jumlah request HTTP', ('method', 'endpoint', 'status')
+)
+HTTP_LATENCY = metrics.registry.histogram(
+    'gacha_http_request_seconds', 'Latency request HTTP', ('method', 'endpoint')
+)
+HTTP_IN_FLIGHT = metrics.registry.gauge(
+    'gacha_http_requests_in_flight', 'Request HTTP yang sedang diproses'
+)
+
+
+def auth_profile(user):
+    """Profil user dalam bentuk response /api/auth"""
+    return {
+        'id': user.telegram_id,
+        'username': user.username,
+        'first_name': user.first_name,
+        'last_name': user.last_name,
+        'balance': user.balance
+    }
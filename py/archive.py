@@ -0,0 +1,142 @@
+"""Arsip transaksi lama (hot/cold).
+
+Transaksi yang sudah final (completed, refunded, expired, failed) dan lebih
+tua dari ARCHIVE_AFTER_DAYS dipindahkan dari `transactions` ke
+`transactions_archive` dalam batch, satu commit per batch. Tabel
+`transactions` dan index-nya jadi hanya berisi aktivitas terbaru; riwayat
+lama tetap bisa dibaca lewat `transaction_history` di py/models.py yang
+membaca arsip jika cursor sudah melewati jendela hot.
+
+Counter di stats_counters tidak berubah karena transaksi hanya pindah tabel.
+
+Berjalan di event loop b.py (lihat `run_archiver`) atau sebagai worker
+terpisah:
+
+    python py/archive.py            # loop terus
+    python py/archive.py --once     # satu kali arsip lalu keluar
+
+Pengaturan: ARCHIVE_AFTER_DAYS (default 90, harus sama di API dan
+worker), ARCHIVE_INTERVAL_SECONDS (default 3600), ARCHIVE_BATCH_SIZE
+(default 1000).
+"""
+import asyncio
+import logging
+import os
+import sys
+import time
+from datetime import timedelta
+
+from dotenv import load_dotenv
+from sqlalchemy import DateTime, bindparam, text
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_AFTER = timedelta(days=float(os.getenv('ARCHIVE_AFTER_DAYS', 90)))
+ARCHIVE_INTERVAL = float(os.getenv('ARCHIVE_INTERVAL_SECONDS', 3600))
+ARCHIVE_BATCH_SIZE = int(os.getenv('ARCHIVE_BATCH_SIZE', 1000))
+
+FINAL_STATUSES = ('completed', 'refunded', 'expired', 'failed')
+
+_COLUMNS = 'id, user_id, amount, payload, charge_id, status, created_at, completed_at, refunded_at'
+
+_SELECT_SQL = text(
+    "SELECT id FROM transactions "
+    "WHERE status IN :statuses AND created_at < :cutoff "
+    "ORDER BY created_at LIMIT :batch_size"
+).bindparams(
+    bindparam('statuses', expanding=True),
+    bindparam('cutoff', type_=DateTime())
+)
+
+_COPY_SQL = text(
+    f"INSERT INTO transactions_archive ({_COLUMNS}, archived_at) "
+    f"SELECT {_COLUMNS}, :archived_at FROM transactions WHERE id IN :ids"
+).bindparams(
+    bindparam('ids', expanding=True),
+    bindparam('archived_at', type_=DateTime())
+)
+
+_DELETE_SQL = text(
+    "DELETE FROM transactions WHERE id IN :ids"
+).bindparams(bindparam('ids', expanding=True))
+
+
+def archive_horizon(now, age=ARCHIVE_AFTER):
+    """Semua transaksi di arsip dibuat sebelum waktu ini (naive, seperti kolom DB)"""
+    return now.replace(tzinfo=None) - age
+
+
+def archive_batch(db, now, age=ARCHIVE_AFTER, batch_size=ARCHIVE_BATCH_SIZE):
+    """Pindahkan satu batch ke arsip dan commit. Return jumlah transaksi yang dipindah"""
+    ids = db.execute(_SELECT_SQL, {
+        'statuses': list(FINAL_STATUSES),
+        'cutoff': archive_horizon(now, age),
+        'batch_size': batch_size
+    }).scalars().all()
+    if not ids:
+        db.rollback()
+        return 0
+    db.execute(_COPY_SQL, {'ids': ids, 'archived_at': now})
+    db.execute(_DELETE_SQL, {'ids': ids})
+    db.commit()
+    return len(ids)
+
+
+def archive(db, now, age=ARCHIVE_AFTER, batch_size=ARCHIVE_BATCH_SIZE):
+    """Arsipkan semua transaksi final yang lewat umur arsip, batch demi batch"""
+    total = 0
+    while True:
+        moved = archive_batch(db, now, age, batch_size)
+        total += moved
+        if moved < batch_size:
+            return total
+
+
+async def run_archiver(adb, clock, age=ARCHIVE_AFTER, interval=ARCHIVE_INTERVAL, batch_size=ARCHIVE_BATCH_SIZE):
+    """Loop arsip untuk event loop bot, kerja DB lewat AsyncDB (py/aio.py)"""
+    logger.info(f"Arsip transaksi aktif: umur {age}, interval {interval}s, batch {batch_size}")
+    while True:
+        try:
+            total = 0
+            while True:
+                moved = await adb.run(archive_batch, clock(), age, batch_size)
+                total += moved
+                if moved < batch_size:
+                    break
+            if total:
+                logger.info(f"Arsip: {total} transaksi dipindah ke transactions_archive")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Arsip error: {e}")
+        await asyncio.sleep(interval)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    try:
+        from py.models import SessionLocal, get_wib_time
+    except ImportError:
+        from models import SessionLocal, get_wib_time
+
+    once = '--once' in sys.argv[1:]
+    logger.info(f"Arsip worker: umur {ARCHIVE_AFTER}, interval {ARCHIVE_INTERVAL}s, batch {ARCHIVE_BATCH_SIZE}")
+    while True:
+        db = SessionLocal()
+        try:
+            total = archive(db, get_wib_time())
+            if total or once:
+                logger.info(f"Arsip: {total} transaksi dipindah ke transactions_archive")
+        except Exception as e:
+            logger.error(f"Arsip error: {e}")
+        finally:
+            db.close()
+        if once:
+            return
+        time.sleep(ARCHIVE_INTERVAL)
+
+
+if __name__ == '__main__':
+    main()
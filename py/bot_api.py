@@ -0,0 +1,176 @@
+"""Client Telegram Bot API bersama dengan connection pool keep-alive.
+
+Dipakai oleh endpoint deposit di py/gacha.py dan oleh b.py, sehingga
+createInvoiceLink memakai ulang koneksi TLS ke api.telegram.org dan tidak
+melakukan handshake baru untuk setiap invoice.
+
+`AsyncBotAPI` adalah versi async (httpx, opsional) untuk API mode ASGI
+(py/gacha_asgi.py).
+"""
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+try:
+    from py.metrics import BOT_API_LATENCY
+except ImportError:
+    from metrics import BOT_API_LATENCY
+
+
+def _settings(base_url, pool_size, connect_timeout, read_timeout):
+    """Nilai yang tidak diberikan dibaca dari env"""
+    if base_url is None:
+        base_url = os.getenv('BOT_API_BASE_URL', 'https://api.telegram.org')
+    if pool_size is None:
+        pool_size = int(os.getenv('BOT_API_POOL_SIZE', 20))
+    if connect_timeout is None:
+        connect_timeout = float(os.getenv('BOT_API_CONNECT_TIMEOUT', 5))
+    if read_timeout is None:
+        read_timeout = float(os.getenv('BOT_API_READ_TIMEOUT', 10))
+    return base_url.rstrip('/'), pool_size, connect_timeout, read_timeout
+
+
+def invoice_params(payload, amount):
+    """Parameter createInvoiceLink untuk deposit Telegram Stars (XTR)"""
+    return {
+        "title": f"Deposit {amount} Stars",
+        "description": f"Deposit {amount} Telegram Stars",
+        "payload": payload,
+        "currency": "XTR",
+        "prices": [{"label": f"Deposit {amount} ⭐", "amount": amount}],
+        "provider_token": ""
+    }
+
+
+class BotAPI:
+    """Konfigurasi default dibaca dari env: BOT_API_BASE_URL, BOT_API_POOL_SIZE,
+    BOT_API_CONNECT_TIMEOUT dan BOT_API_READ_TIMEOUT"""
+
+    def __init__(self, token, base_url=None, pool_size=None, connect_timeout=None, read_timeout=None):
+        base_url, pool_size, connect_timeout, read_timeout = _settings(
+            base_url, pool_size, connect_timeout, read_timeout
+        )
+        
+        self.token = token
+        self.base_url = base_url
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = requests.Session()
+        # pool_block=False: jika pool penuh, koneksi tambahan dibuat lalu dibuang
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def call(self, method, data=None):
+        """Panggil method Bot API, return JSON response (dict dengan 'ok')"""
+        url = f"{self.base_url}/bot{self.token}/{method}"
+        started = time.perf_counter()
+        outcome = 'exception'
+        try:
+            result = self.session.post(url, json=data or {}, timeout=self.timeout).json()
+            outcome = 'ok' if result.get('ok') else 'error'
+            return result
+        finally:
+            BOT_API_LATENCY.observe(time.perf_counter() - started, method=method, outcome=outcome)
+
+    def create_invoice_link(self, payload, amount):
+        """Buat link invoice deposit Telegram Stars (XTR)"""
+        return self.call('createInvoiceLink', invoice_params(payload, amount))
+
+    def set_webhook(self, url, secret_token):
+        """Daftarkan webhook /api/webhook/telegram, hanya untuk update pembayaran"""
+        return self.call('setWebhook', {
+            "url": url,
+            "secret_token": secret_token,
+            "allowed_updates": ["pre_checkout_query", "message"]
+        })
+
+    def delete_webhook(self):
+        return self.call('deleteWebhook')
+
+    def close(self):
+        self.session.close()
+
+
+class AsyncBotAPI:
+    """Versi async BotAPI di atas httpx.AsyncClient (pool keep-alive yang sama)"""
+
+    def __init__(self, token, base_url=None, pool_size=None, connect_timeout=None, read_timeout=None):
+        if httpx is None:
+            raise ImportError("AsyncBotAPI membutuhkan httpx (pip install httpx)")
+        base_url, pool_size, connect_timeout, read_timeout = _settings(
+            base_url, pool_size, connect_timeout, read_timeout
+        )
+        self.token = token
+        self.base_url = base_url
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+        )
+
+    async def call(self, method, data=None):
+        url = f"{self.base_url}/bot{self.token}/{method}"
+        started = time.perf_counter()
+        outcome = 'exception'
+        try:
+            response = await self.client.post(url, json=data or {})
+            result = response.json()
+            outcome = 'ok' if result.get('ok') else 'error'
+            return result
+        finally:
+            BOT_API_LATENCY.observe(time.perf_counter() - started, method=method, outcome=outcome)
+
+    async def create_invoice_link(self, payload, amount):
+        return await self.call('createInvoiceLink', invoice_params(payload, amount))
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def get_bot_api():
+    """Client bersama per proses, dibuat saat pertama dipakai"""
+    global _client, _client_pid
+    # Dibuat ulang setelah fork (worker gunicorn): socket keep-alive tidak boleh dipakai bersama
+    if _client is None or _client_pid != os.getpid():
+        with _client_lock:
+            if _client is None or _client_pid != os.getpid():
+                _client = BotAPI(os.getenv('BOT_TOKEN'))
+                _client_pid = os.getpid()
+    return _client
+
+
+def main():
+    """python py/bot_api.py set-webhook <url> | delete-webhook | webhook-info"""
+    import sys
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    args = sys.argv[1:]
+    api = get_bot_api()
+    if args[:1] == ['set-webhook'] and len(args) == 2:
+        secret = os.getenv('TELEGRAM_WEBHOOK_SECRET')
+        if not secret:
+            sys.exit("TELEGRAM_WEBHOOK_SECRET belum di-set")
+        print(api.set_webhook(args[1], secret))
+    elif args == ['delete-webhook']:
+        print(api.delete_webhook())
+    elif args == ['webhook-info']:
+        print(api.call('getWebhookInfo'))
+    else:
+        sys.exit(main.__doc__)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""Factory engine SQLAlchemy yang dipakai API, bot dan worker (lewat py/models.py).
+
+API dan bot berjalan sebagai proses terpisah yang menulis ke file SQLite
+yang sama. Setiap koneksi SQLite baru diberi profil produksi:
+
+- journal_mode=WAL: pembaca tidak diblok penulis (pembayaran dari bot)
+- synchronous=NORMAL: aman untuk WAL, fsync jauh lebih sedikit
+- busy_timeout: penulis kedua menunggu lock, bukan langsung
+  "database is locked"
+- cache_size / mmap_size: halaman panas tetap di memori
+
+Semua nilai bisa diubah lewat env (lihat SQLITE_* di bawah).
+
+`create_async_db_engine` membuat engine asyncio (aiosqlite / asyncpg)
+dengan profil yang sama untuk API mode ASGI (py/gacha_asgi.py).
+"""
+import os
+
+from sqlalchemy import create_engine, event
+
+# Driver async default per dialect jika DATABASE_URL tidak menyebut driver
+_ASYNC_DRIVERS = {'sqlite': 'sqlite+aiosqlite', 'postgresql': 'postgresql+asyncpg'}
+
+
+def _sqlite_pragmas():
+    return {
+        'journal_mode': os.getenv('SQLITE_JOURNAL_MODE', 'WAL'),
+        'synchronous': os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL'),
+        'busy_timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 5000)),
+        # Nilai negatif = KiB, jadi -20000 sekitar 20 MB per koneksi
+        'cache_size': -int(os.getenv('SQLITE_CACHE_SIZE_KB', 20000)),
+        'mmap_size': int(os.getenv('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+        'temp_store': 'MEMORY',
+    }
+
+
+def _apply_sqlite_profile(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in _sqlite_pragmas().items():
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+
+def create_db_engine(database_url=None, **kwargs):
+    """Buat engine untuk DATABASE_URL, dengan profil SQLite jika perlu"""
+    database_url = database_url or os.getenv('DATABASE_URL', 'sqlite:///gacha.db')
+
+    # Pool cukup besar untuk thread Flask + long-poll yang sedang menunggu
+    options = {
+        'pool_size': int(os.getenv('DB_POOL_SIZE', 10)),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 20)),
+        'pool_timeout': float(os.getenv('DB_POOL_TIMEOUT', 30)),
+    }
+
+    is_sqlite = database_url.startswith('sqlite')
+    is_memory = is_sqlite and (database_url in ('sqlite://', 'sqlite:///:memory:'))
+
+    if is_sqlite:
+        options['connect_args'] = {
+            'check_same_thread': False,
+            'timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 5000)) / 1000,
+        }
+        if is_memory:
+            # Database memory memakai StaticPool bawaan SQLAlchemy, tanpa opsi pool
+            for key in ('pool_size', 'max_overflow', 'pool_timeout'):
+                options.pop(key)
+    else:
+        options['pool_pre_ping'] = True
+
+    options.update(kwargs)
+    engine = create_engine(database_url, **options)
+
+    if is_sqlite and not is_memory:
+        event.listen(engine, 'connect', _apply_sqlite_profile)
+
+    return engine
+
+
+def create_async_db_engine(database_url=None, **kwargs):
+    """Versi asyncio create_db_engine (butuh aiosqlite atau asyncpg)"""
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    database_url = database_url or os.getenv('DATABASE_URL', 'sqlite:///gacha.db')
+    scheme, sep, rest = database_url.partition('://')
+    database_url = _ASYNC_DRIVERS.get(scheme, scheme) + sep + rest
+
+    options = {
+        'pool_size': int(os.getenv('DB_POOL_SIZE', 10)),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 20)),
+        'pool_timeout': float(os.getenv('DB_POOL_TIMEOUT', 30)),
+    }
+
+    is_sqlite = database_url.startswith('sqlite')
+    is_memory = is_sqlite and rest in ('', '/:memory:')
+
+    if is_sqlite:
+        options['connect_args'] = {'timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 5000)) / 1000}
+        if is_memory:
+            for key in ('pool_size', 'max_overflow', 'pool_timeout'):
+                options.pop(key)
+    else:
+        options['pool_pre_ping'] = True
+
+    options.update(kwargs)
+    engine = create_async_engine(database_url, **options)
+
+    if is_sqlite and not is_memory:
+        event.listen(engine.sync_engine, 'connect', _apply_sqlite_profile)
+
+    return engine
@@ -1,116 +1,187 @@
+"""API Gacha Stars (Flask).
+
+Route didaftarkan di Blueprint `api`; app dibuat lewat `create_app()`
+(py/serve.py untuk production, FLASK_DEV_SERVER=1 untuk server
+development). Model dan helper data ada di py/models.py, jadi mengimpor
+modul ini tidak membuat engine atau menyentuh skema; jalankan
+`python py/models.py migrate` sekali sebelum start.
+"""
 import os
 import json
-from datetime import datetime
-from flask import Flask, request, jsonify, g
+import hmac
+import time
+import functools
+from flask import Blueprint, Flask, current_app, request, jsonify, g, Response
 from flask_cors import CORS
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Boolean, ForeignKey
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship, scoped_session
-import pytz
+from sqlalchemy.orm import scoped_session
 from dotenv import load_dotenv
 
+try:
+    from py.api_common import (
+        INTERNAL_API_SECRET, LONGPOLL_TIMEOUT, METRICS_TOKEN, TELEGRAM_WEBHOOK_SECRET,
+        HTTP_IN_FLIGHT, HTTP_LATENCY, HTTP_REQUESTS, auth_profile
+    )
+    from py.models import (
+        SessionLocal, Base, User, Transaction, ArchivedTransaction,
+        TRANSACTION_FIELDS, find_transaction, finished_transactions, generate_payload, get_engine,
+        get_wib_time, transaction_history, transaction_status, user_etag, user_service, wib_isoformat
+    )
+    from py.payment_events import PaymentEventBus, waiters
+    from py.bot_api import get_bot_api
+    from py.pagination import parse_page_size
+    from py.serialization import json_response, rows_to_dicts
+    from py.stats import bump, read_counters
+    from py.users import touch_users
+    from py.payments import check_precheckout, deposit_success_message
+    from py.settlement import settle_payments
+    from py.ratelimit import client_ip, create_limiter, limited_body
+    from py import metrics, profiling
+except ImportError:
+    from api_common import (
+        INTERNAL_API_SECRET, LONGPOLL_TIMEOUT, METRICS_TOKEN, TELEGRAM_WEBHOOK_SECRET,
+        HTTP_IN_FLIGHT, HTTP_LATENCY, HTTP_REQUESTS, auth_profile
+    )
+    from models import (
+        SessionLocal, Base, User, Transaction, ArchivedTransaction,
+        TRANSACTION_FIELDS, find_transaction, finished_transactions, generate_payload, get_engine,
+        get_wib_time, transaction_history, transaction_status, user_etag, user_service, wib_isoformat
+    )
+    from payment_events import PaymentEventBus, waiters
+    from bot_api import get_bot_api
+    from pagination import parse_page_size
+    from serialization import json_response, rows_to_dicts
+    from stats import bump, read_counters
+    from users import touch_users
+    from payments import check_precheckout, deposit_success_message
+    from settlement import settle_payments
+    from ratelimit import client_ip, create_limiter, limited_body
+    import metrics
+    import profiling
+
 # Load environment variables
 load_dotenv()
 
-app = Flask(__name__)
-CORS(app)  # Enable CORS for GitHub Pages
+api = Blueprint('api', __name__)
+
+# Buat scoped session untuk Flask (engine dibuat saat request pertama)
+db_session = scoped_session(SessionLocal)
+Base.query = db_session.query_property()
+
+def create_app():
+    """Buat app Flask API; dipanggil sekali per proses (py/serve.py)"""
+    app = Flask(__name__)
+    CORS(app, expose_headers=['ETag'])  # Enable CORS for GitHub Pages
+    app.register_blueprint(api)
+    if not INTERNAL_API_SECRET:
+        app.logger.warning("INTERNAL_API_SECRET belum di-set: endpoint internal/admin menolak semua request")
+    return app
 
-# Timezone Indonesia
-WIB = pytz.timezone('Asia/Jakarta')
 
-# Database Configuration
-DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///gacha.db')
-engine = create_engine(DATABASE_URL, connect_args={'check_same_thread': False} if 'sqlite' in DATABASE_URL else {})
+def find_user_version(telegram_id):
+    """(id, version, balance) user tanpa memuat objek ORM, None jika tidak ada"""
+    return db_session.query(User.id, User.version, User.balance).filter(
+        User.telegram_id == telegram_id
+    ).first()
 
-# Buat SessionLocal
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+def not_modified(etag):
+    """Response 304 jika If-None-Match cocok dengan `etag`, selain itu None"""
+    if request.if_none_match.contains_weak(etag):
+        return with_etag(Response(status=304), etag)
+    return None
 
-# Buat scoped session untuk Flask
-db_session = scoped_session(SessionLocal)
+def with_etag(response, etag):
+    # no-cache: browser boleh menyimpan, tapi selalu revalidasi dengan If-None-Match
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
 
-Base = declarative_base()
-Base.query = db_session.query_property()
+# Metrics pool DB & long-poll (metrics HTTP: py/api_common.py)
+metrics.registry.gauge(
+    'gacha_db_pool_checked_out', 'Koneksi DB yang sedang dipakai',
+    callback=lambda: get_engine().pool.checkedout()
+)
+metrics.registry.gauge(
+    'gacha_db_pool_size', 'Ukuran pool koneksi DB',
+    callback=lambda: get_engine().pool.size()
+)
+metrics.registry.gauge(
+    'gacha_db_pool_overflow', 'Koneksi overflow di atas ukuran pool',
+    callback=lambda: get_engine().pool.overflow()
+)
+metrics.registry.gauge(
+    'gacha_longpoll_waiting_payloads', 'Payload yang sedang ditunggu long-poll',
+    callback=lambda: len(waiters)
+)
+
+def _finished_transactions(payloads):
+    db = SessionLocal()
+    try:
+        return finished_transactions(db, payloads)
+    finally:
+        db.close()
+
+# Event status transaksi untuk long-poll, diteruskan ke semua worker (py/payment_events.py)
+payment_events = PaymentEventBus(waiters, _finished_transactions)
+
+# Rate limit per IP untuk endpoint mahal (py/ratelimit.py)
+limiter = create_limiter()
 
-# Models
-class User(Base):
-    __tablename__ = 'users'
-    
-    id = Column(Integer, primary_key=True)
-    telegram_id = Column(Integer, unique=True, nullable=False)
-    username = Column(String(100))
-    first_name = Column(String(100))
-    last_name = Column(String(100))
-    balance = Column(Integer, default=0)  # Stars balance
-    created_at = Column(DateTime, default=lambda: datetime.now(WIB))
-    updated_at = Column(DateTime, default=lambda: datetime.now(WIB), onupdate=lambda: datetime.now(WIB))
-    
-    # Relationships
-    transactions = relationship('Transaction', back_populates='user', cascade='all, delete-orphan')
-    
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'telegram_id': self.telegram_id,
-            'username': self.username,
-            'first_name': self.first_name,
-            'last_name': self.last_name,
-            'balance': self.balance,
-            'created_at': self.created_at.isoformat() if self.created_at else None
-        }
-
-class Transaction(Base):
-    __tablename__ = 'transactions'
-    
-    id = Column(Integer, primary_key=True)
-    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
-    amount = Column(Integer, nullable=False)  # Stars amount
-    payload = Column(String(255), unique=True, nullable=False)
-    charge_id = Column(String(255), unique=True)
-    status = Column(String(50), default='pending')  # pending, completed, failed, refunded
-    created_at = Column(DateTime, default=lambda: datetime.now(WIB))
-    completed_at = Column(DateTime)
-    refunded_at = Column(DateTime)
-    
-    # Relationships
-    user = relationship('User', back_populates='transactions')
-    
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'user_id': self.user_id,
-            'amount': self.amount,
-            'payload': self.payload,
-            'charge_id': self.charge_id,
-            'status': self.status,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'completed_at': self.completed_at.isoformat() if self.completed_at else None,
-            'refunded_at': self.refunded_at.isoformat() if self.refunded_at else None
-        }
-
-# Create tables
-Base.metadata.create_all(bind=engine)
-
-# Helper functions
-def get_wib_time():
-    return datetime.now(WIB)
-
-def generate_payload(user_id, amount):
-    """Generate unique payload for transaction"""
-    import random
-    timestamp = int(get_wib_time().timestamp())
-    random_num = random.randint(1000, 9999)
-    return f"deposit:{user_id}:{amount}:{random_num}:{timestamp}"
+def rate_limited(route):
+    """Tolak dengan 429 + Retry-After jika budget `route` habis, sebelum view menyentuh DB"""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            retry_after = limiter.hit(route, ip=client_ip(
+                request.remote_addr,
+                request.headers.get('X-Forwarded-For'),
+                request.headers.get('CF-Connecting-IP')
+            ))
+            if retry_after:
+                # Body yang tidak dibaca merusak request berikutnya di koneksi
+                # keep-alive gunicorn: habiskan dulu (body API kecil)
+                request.get_data(cache=False)
+                response = jsonify(limited_body(retry_after))
+                response.status_code = 429
+                response.headers['Retry-After'] = str(retry_after)
+                return response
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def is_internal_request():
+    """Request dari bot / admin: header X-Internal-Secret harus cocok"""
+    secret = request.headers.get('X-Internal-Secret', '')
+    return bool(INTERNAL_API_SECRET) and hmac.compare_digest(secret, INTERNAL_API_SECRET)
 
 # API Routes
-@app.before_request
+@api.before_app_request
 def before_request():
     g.db = db_session
+    g.request_started = time.perf_counter()
+    # Label disimpan di g untuk dipakai saat teardown
+    g.metrics_labels = (request.method, request.url_rule.rule if request.url_rule else 'unmatched')
+    g.sql_profile = profiling.start(' '.join(g.metrics_labels))
+    HTTP_IN_FLIGHT.inc()
+
+@api.after_app_request
+def after_request(response):
+    g.response_status = response.status_code
+    return response
 
-@app.teardown_appcontext
+@api.teardown_app_request
 def shutdown_session(exception=None):
+    profiling.stop(g.pop('sql_profile', None))
     db_session.remove()
+    
+    started = g.pop('request_started', None)
+    if started is not None:
+        HTTP_IN_FLIGHT.dec()
+        method, endpoint = g.pop('metrics_labels')
+        status = g.pop('response_status', 500)
+        HTTP_LATENCY.observe(time.perf_counter() - started, method=method, endpoint=endpoint)
+        HTTP_REQUESTS.inc(method=method, endpoint=endpoint, status=status)
 
-@app.route('/')
+@api.route('/')
 def index():
     return jsonify({
         'status': 'online',
@@ -118,7 +189,8 @@ def index():
         'time': get_wib_time().isoformat()
     })
 
-@app.route('/api/user', methods=['GET'])
+@api.route('/api/user', methods=['GET'])
+@rate_limited('read')
 def get_user():
     """Get or create user by Telegram ID"""
     telegram_id = request.args.get('telegram_id')
@@ -131,32 +203,31 @@ def get_user():
     except:
         return jsonify({'success': False, 'error': 'invalid telegram_id'}), 400
     
+    # User lama dengan ETag yang masih berlaku: tidak perlu upsert
+    if request.if_none_match:
+        row = find_user_version(telegram_id)
+        if row:
+            cached = not_modified(user_etag(row.id, row.version))
+            if cached:
+                return cached
+    
     # Get user data from request
     username = request.args.get('username', '')
     first_name = request.args.get('first_name', '')
     last_name = request.args.get('last_name', '')
     
-    user = db_session.query(User).filter(User.telegram_id == telegram_id).first()
-    
-    if not user:
-        # Create new user
-        user = User(
-            telegram_id=telegram_id,
-            username=username,
-            first_name=first_name,
-            last_name=last_name,
-            balance=0
-        )
-        db_session.add(user)
-        db_session.commit()
-        db_session.refresh(user)
+    user = user_service.get_or_create(db_session, telegram_id, username, first_name, last_name)
+    user_dict = user.to_dict()
+    etag = user_etag(user.id, user.version)
+    db_session.commit()
     
-    return jsonify({
+    return with_etag(jsonify({
         'success': True,
-        'user': user.to_dict()
-    })
+        'user': user_dict
+    }), etag)
 
-@app.route('/api/user/balance', methods=['GET'])
+@api.route('/api/user/balance', methods=['GET'])
+@rate_limited('read')
 def get_balance():
     """Get user balance"""
     telegram_id = request.args.get('telegram_id')
@@ -169,17 +240,19 @@ def get_balance():
     except:
         return jsonify({'success': False, 'error': 'invalid telegram_id'}), 400
     
-    user = db_session.query(User).filter(User.telegram_id == telegram_id).first()
+    user = find_user_version(telegram_id)
     
     if not user:
         return jsonify({'success': False, 'error': 'user not found'}), 404
     
-    return jsonify({
+    etag = user_etag(user.id, user.version)
+    return not_modified(etag) or with_etag(jsonify({
         'success': True,
         'balance': user.balance
-    })
+    }), etag)
 
-@app.route('/api/deposit/create', methods=['POST'])
+@api.route('/api/deposit/create', methods=['POST'])
+@rate_limited('deposit')
 def create_deposit():
     """Create deposit invoice"""
     data = request.json
@@ -203,25 +276,14 @@ def create_deposit():
     except:
         return jsonify({'success': False, 'error': 'invalid parameters'}), 400
     
-    # Get or create user
-    user = db_session.query(User).filter(User.telegram_id == telegram_id).first()
-    
-    if not user:
-        # Get user details from request
-        username = data.get('username', '')
-        first_name = data.get('first_name', '')
-        last_name = data.get('last_name', '')
-        
-        user = User(
-            telegram_id=telegram_id,
-            username=username,
-            first_name=first_name,
-            last_name=last_name,
-            balance=0
-        )
-        db_session.add(user)
-        db_session.commit()
-        db_session.refresh(user)
+    # Get or create user (di-commit bersama transaksi di bawah)
+    user = user_service.get_or_create(
+        db_session,
+        telegram_id,
+        data.get('username', ''),
+        data.get('first_name', ''),
+        data.get('last_name', '')
+    )
     
     # Generate unique payload
     payload = generate_payload(telegram_id, amount)
@@ -234,6 +296,8 @@ def create_deposit():
         status='pending'
     )
     db_session.add(transaction)
+    bump(db_session, pending_count=1)
+    touch_users(db_session, user.id)
     db_session.commit()
     
     # Call Telegram Bot API to create invoice link
@@ -242,21 +306,8 @@ def create_deposit():
     if not bot_token:
         return jsonify({'success': False, 'error': 'bot token not configured'}), 500
     
-    url = f"https://api.telegram.org/bot{bot_token}/createInvoiceLink"
-    
-    invoice_data = {
-        "title": f"Deposit {amount} Stars",
-        "description": f"Deposit {amount} Telegram Stars",
-        "payload": payload,
-        "currency": "XTR",
-        "prices": [{"label": f"Deposit {amount} ⭐", "amount": amount}],
-        "provider_token": ""
-    }
-    
     try:
-        import requests
-        response = requests.post(url, json=invoice_data, timeout=10)
-        result = response.json()
+        result = get_bot_api().create_invoice_link(payload, amount)
         
         if result.get('ok'):
             invoice_link = result['result']
@@ -271,6 +322,8 @@ def create_deposit():
         else:
             # Delete pending transaction
             db_session.delete(transaction)
+            bump(db_session, pending_count=-1)
+            touch_users(db_session, transaction.user_id)
             db_session.commit()
             
             return jsonify({
@@ -281,6 +334,8 @@ def create_deposit():
     except Exception as e:
         # Delete pending transaction
         db_session.delete(transaction)
+        bump(db_session, pending_count=-1)
+        touch_users(db_session, transaction.user_id)
         db_session.commit()
         
         return jsonify({
@@ -288,7 +343,8 @@ def create_deposit():
             'error': str(e)
         }), 500
 
-@app.route('/api/transactions/<telegram_id>', methods=['GET'])
+@api.route('/api/transactions/<telegram_id>', methods=['GET'])
+@rate_limited('read')
 def get_user_transactions(telegram_id):
     """Get user transactions"""
     try:
@@ -296,29 +352,39 @@ def get_user_transactions(telegram_id):
     except:
         return jsonify({'success': False, 'error': 'invalid telegram_id'}), 400
     
-    user = db_session.query(User).filter(User.telegram_id == telegram_id).first()
+    user = find_user_version(telegram_id)
     
     if not user:
         return jsonify({'success': False, 'error': 'user not found'}), 404
     
-    status = request.args.get('status', 'all')
-    
-    query = db_session.query(Transaction).filter(Transaction.user_id == user.id)
+    # Riwayat tidak berubah sejak versi ini: 304 tanpa query ke transactions
+    etag = user_etag(user.id, user.version)
+    cached = not_modified(etag)
+    if cached:
+        return cached
     
-    if status != 'all':
-        query = query.filter(Transaction.status == status)
+    status = request.args.get('status', 'all')
     
-    transactions = query.order_by(Transaction.created_at.desc()).limit(50).all()
+    try:
+        limit = parse_page_size(request.args.get('limit'))
+        transactions, next_cursor = transaction_history(
+            db_session, user.id, status=None if status == 'all' else status,
+            cursor=request.args.get('cursor'), limit=limit
+        )
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     
-    return jsonify({
+    return with_etag(json_response({
         'success': True,
-        'transactions': [t.to_dict() for t in transactions]
-    })
+        'transactions': rows_to_dicts(transactions, TRANSACTION_FIELDS),
+        'next_cursor': next_cursor
+    }), etag)
 
-@app.route('/api/transaction/check/<payload>', methods=['GET'])
+@api.route('/api/transaction/check/<payload>', methods=['GET'])
+@rate_limited('check')
 def check_transaction(payload):
     """Check transaction status by payload"""
-    transaction = db_session.query(Transaction).filter(Transaction.payload == payload).first()
+    transaction = find_transaction(db_session, payload=payload)
     
     if not transaction:
         return jsonify({'success': False, 'error': 'transaction not found'}), 404
@@ -328,16 +394,92 @@ def check_transaction(payload):
         'transaction': transaction.to_dict()
     })
 
-@app.route('/api/webhook/telegram', methods=['POST'])
+@api.route('/api/webhook/telegram', methods=['POST'])
 def telegram_webhook():
-    """Webhook untuk menerima update dari Telegram (opsional)"""
-    # Ini bisa digunakan jika ingin menerima update langsung
-    # Tapi kita sudah menggunakan polling di b.py
-    return jsonify({'status': 'ok'})
+    """Webhook Bot API: pre-checkout dan pembayaran diproses langsung di sini.
+    
+    Aktif jika TELEGRAM_WEBHOOK_SECRET di-set; daftarkan dengan
+    `python py/bot_api.py set-webhook <url>` dan set PAYMENTS_VIA_WEBHOOK=1
+    untuk b.py. Jawaban ke Telegram (answerPreCheckoutQuery / sendMessage)
+    dikirim sebagai body response webhook, tanpa request Bot API tambahan.
+    """
+    if not TELEGRAM_WEBHOOK_SECRET:
+        return jsonify({'success': False, 'error': 'webhook disabled'}), 404
+    
+    token = request.headers.get('X-Telegram-Bot-Api-Secret-Token', '')
+    if not hmac.compare_digest(token, TELEGRAM_WEBHOOK_SECRET):
+        return jsonify({'success': False, 'error': 'forbidden'}), 403
+    
+    update = request.get_json(silent=True) or {}
+    
+    if 'pre_checkout_query' in update:
+        return jsonify(webhook_precheckout(update['pre_checkout_query']))
+    
+    message = update.get('message') or {}
+    if 'successful_payment' in message:
+        # Error di sini -> 500, Telegram mengirim ulang (settlement idempotent)
+        return jsonify(webhook_successful_payment(message))
+    
+    return jsonify({})
+
+def webhook_precheckout(query):
+    payload = query.get('invoice_payload', '')
+    try:
+        error = check_precheckout(
+            db_session, payload, query['from']['id'],
+            query.get('currency'), query.get('total_amount'), get_wib_time()
+        )
+    except Exception as e:
+        current_app.logger.error(f"Error in pre_checkout webhook: {e}")
+        error = "Terjadi kesalahan sistem"
+    
+    answer = {
+        'method': 'answerPreCheckoutQuery',
+        'pre_checkout_query_id': query['id'],
+        'ok': error is None
+    }
+    if error:
+        answer['error_message'] = error
+    return answer
+
+def webhook_successful_payment(message):
+    payment = message['successful_payment']
+    payload = payment.get('invoice_payload', '')
+    charge_id = payment['telegram_payment_charge_id']
+    amount = payment['total_amount']
+    
+    completed_at = settle_payments(db_session, [(payload, charge_id, amount)], get_wib_time())[0]
+    if not completed_at:
+        # Sudah di-settle (update dikirim ulang) atau payload tidak dikenal
+        return {}
+    
+    # Long-poll langsung bangun, tanpa notify dari b.py
+    payment_events.publish(payload, {
+        'status': 'completed',
+        'amount': amount,
+        'completed_at': wib_isoformat(completed_at)
+    })
+    
+    return {
+        'method': 'sendMessage',
+        'chat_id': message['chat']['id'],
+        'text': deposit_success_message(amount, charge_id, completed_at),
+        'parse_mode': 'HTML'
+    }
 
 # ============ TAMBAHKAN ENDPOINT INI ============
 
-@app.route('/api/test', methods=['GET'])
+@api.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Metrics dalam text exposition format Prometheus"""
+    if METRICS_TOKEN:
+        expected = f'Bearer {METRICS_TOKEN}'
+        if not hmac.compare_digest(request.headers.get('Authorization', ''), expected):
+            return Response('forbidden\n', status=403, mimetype='text/plain')
+    
+    return Response(metrics.registry.render(), content_type=metrics.CONTENT_TYPE)
+
+@api.route('/api/test', methods=['GET'])
 def api_test():
     """Endpoint untuk test koneksi"""
     return jsonify({
@@ -346,53 +488,95 @@ def api_test():
         'time': get_wib_time().isoformat()
     })
 
-@app.route('/api/auth', methods=['POST'])
+def auth_user_from_request(data):
+    """Cari atau buat user dari data auth Mini App (field 'user' dari initData).
+
+    Return (user, None) atau (None, (response, status)) jika data tidak valid.
+    Pemanggil yang melakukan commit.
+    """
+    if not data or 'user' not in data:
+        return None, (jsonify({'success': False, 'error': 'Invalid auth data'}), 400)
+    
+    # Parse user data
+    user_data = json.loads(data['user'])
+    
+    telegram_id = user_data.get('id')
+    # Field yang tidak ada di initData = None, tidak menimpa profil lama
+    username = user_data.get('username')
+    first_name = user_data.get('first_name')
+    last_name = user_data.get('last_name')
+    
+    if not telegram_id:
+        return None, (jsonify({'success': False, 'error': 'No user ID'}), 400)
+    
+    # Cari atau buat user; profil dari Telegram selalu yang terbaru
+    user = user_service.get_or_create(
+        db_session, telegram_id, username, first_name, last_name, refresh_profile=True
+    )
+    
+    return user, None
+
+@api.route('/api/auth', methods=['POST'])
+@rate_limited('auth')
 def api_auth():
     """Autentikasi user dari Telegram"""
     try:
-        data = request.json
-        if not data or 'user' not in data:
-            return jsonify({'success': False, 'error': 'Invalid auth data'}), 400
+        user, error = auth_user_from_request(request.json)
+        if error:
+            return error
         
-        # Parse user data
-        user_data = json.loads(data['user'])
+        profile = auth_profile(user)
+        db_session.commit()
         
-        telegram_id = user_data.get('id')
-        username = user_data.get('username', '')
-        first_name = user_data.get('first_name', '')
-        last_name = user_data.get('last_name', '')
+        return jsonify({'success': True, **profile})
         
-        if not telegram_id:
-            return jsonify({'success': False, 'error': 'No user ID'}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@api.route('/api/bootstrap', methods=['POST'])
+@rate_limited('auth')
+def api_bootstrap():
+    """Startup Mini App dalam satu request: auth, profil, saldo, riwayat, invoice pending"""
+    try:
+        try:
+            limit = parse_page_size(request.args.get('limit'))
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
         
-        # Cari atau buat user
-        user = db_session.query(User).filter(User.telegram_id == telegram_id).first()
+        user, error = auth_user_from_request(request.json)
+        if error:
+            return error
         
-        if not user:
-            user = User(
-                telegram_id=telegram_id,
-                username=username,
-                first_name=first_name,
-                last_name=last_name,
-                balance=0
-            )
-            db_session.add(user)
-            db_session.commit()
-            db_session.refresh(user)
+        user_id = user.id
+        profile = auth_profile(user)
+        db_session.commit()
         
-        return jsonify({
+        # Halaman pertama riwayat
+        transactions, next_cursor = transaction_history(db_session, user_id, limit=limit)
+        
+        # Invoice pending terakhir (index user_id, status, created_at)
+        pending = db_session.query(Transaction).filter(
+            Transaction.user_id == user_id,
+            Transaction.status == 'pending'
+        ).order_by(Transaction.created_at.desc()).first()
+        
+        return json_response({
             'success': True,
-            'id': user.telegram_id,
-            'username': user.username,
-            'first_name': user.first_name,
-            'last_name': user.last_name,
-            'balance': user.balance
+            'user': profile,
+            'transactions': rows_to_dicts(transactions, TRANSACTION_FIELDS),
+            'next_cursor': next_cursor,
+            'pending_invoice': {
+                'payload': pending.payload,
+                'amount': pending.amount,
+                'created_at': pending.created_at.isoformat() if pending.created_at else None
+            } if pending else None
         })
         
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
-@app.route('/api/create-deposit', methods=['POST'])
+@api.route('/api/create-deposit', methods=['POST'])
+@rate_limited('deposit')
 def api_create_deposit():
     """Buat deposit invoice"""
     try:
@@ -419,23 +603,12 @@ def api_create_deposit():
             status='pending'
         )
         db_session.add(transaction)
+        bump(db_session, pending_count=1)
+        touch_users(db_session, user.id)
         db_session.commit()
         
         # Buat invoice link
-        bot_token = os.getenv('BOT_TOKEN')
-        url = f"https://api.telegram.org/bot{bot_token}/createInvoiceLink"
-        
-        invoice_data = {
-            "title": f"Deposit {amount} Stars",
-            "description": f"Deposit {amount} Telegram Stars",
-            "payload": payload,
-            "currency": "XTR",
-            "prices": [{"label": f"Deposit {amount} ⭐", "amount": amount}],
-            "provider_token": ""
-        }
-        
-        response = requests.post(url, json=invoice_data, timeout=10)
-        result = response.json()
+        result = get_bot_api().create_invoice_link(payload, amount)
         
         if result.get('ok'):
             return jsonify({
@@ -447,13 +620,16 @@ def api_create_deposit():
         else:
             # Hapus transaksi jika gagal
             db_session.delete(transaction)
+            bump(db_session, pending_count=-1)
+            touch_users(db_session, transaction.user_id)
             db_session.commit()
             return jsonify({'success': False, 'error': result.get('description', 'Failed to create invoice')}), 500
             
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
-@app.route('/api/check-transaction', methods=['POST'])
+@api.route('/api/check-transaction', methods=['POST'])
+@rate_limited('check')
 def api_check_transaction():
     """Cek status transaksi"""
     try:
@@ -463,22 +639,114 @@ def api_check_transaction():
         if not payload:
             return jsonify({'success': False, 'error': 'Payload required'}), 400
         
-        transaction = db_session.query(Transaction).filter(Transaction.payload == payload).first()
+        transaction = find_transaction(db_session, payload=payload)
         
         if not transaction:
             return jsonify({'success': False, 'error': 'Transaction not found'}), 404
         
-        return jsonify({
-            'success': True,
-            'status': transaction.status,
-            'amount': transaction.amount,
-            'completed_at': transaction.completed_at.isoformat() if transaction.completed_at else None
-        })
+        return jsonify({'success': True, **transaction_status(transaction)})
+        
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@api.route('/api/wait-transaction', methods=['POST'])
+@rate_limited('wait')
+def api_wait_transaction():
+    """Long-poll: tahan request sampai transaksi keluar dari status pending"""
+    try:
+        data = request.json
+        payload = data.get('payload')
+        
+        if not payload:
+            return jsonify({'success': False, 'error': 'Payload required'}), 400
+        
+        try:
+            timeout = min(float(data.get('timeout', LONGPOLL_TIMEOUT)), LONGPOLL_TIMEOUT)
+        except (TypeError, ValueError):
+            timeout = LONGPOLL_TIMEOUT
+        
+        # Subscribe dulu baru baca status, supaya event tidak terlewat
+        with payment_events.subscribe(payload) as subscription:
+            transaction = find_transaction(db_session, payload=payload)
+            
+            if not transaction:
+                return jsonify({'success': False, 'error': 'Transaction not found'}), 404
+            
+            result = {'success': True, **transaction_status(transaction)}
+            # Lepas koneksi DB selama menunggu
+            db_session.remove()
+            
+            if result['status'] == 'pending':
+                event = subscription.wait(timeout)
+                if event:
+                    result.update({k: v for k, v in event.items() if v is not None})
+                else:
+                    # Timeout (atau event Redis hilang): status terakhir dari database
+                    transaction = find_transaction(db_session, payload=payload)
+                    result.update(transaction_status(transaction))
+        
+        return jsonify(result)
         
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
-@app.route('/api/user/<int:telegram_id>', methods=['GET'])
+@api.route('/api/internal/transaction-event', methods=['POST'])
+def api_transaction_event():
+    """Dipanggil b.py setelah status transaksi berubah, membangunkan long-poll"""
+    if not is_internal_request():
+        return jsonify({'success': False, 'error': 'forbidden'}), 403
+    
+    data = request.json or {}
+    payload = data.get('payload')
+    status = data.get('status')
+    
+    if not payload or not status:
+        return jsonify({'success': False, 'error': 'payload and status required'}), 400
+    
+    woken = payment_events.publish(payload, {
+        'status': status,
+        'amount': data.get('amount'),
+        'completed_at': data.get('completed_at')
+    })
+    
+    return jsonify({'success': True, 'woken': woken})
+
+@api.route('/api/admin/stats', methods=['GET'])
+def api_admin_stats():
+    """Statistik admin dari counter incremental (tanpa scan tabel)"""
+    if not is_internal_request():
+        return jsonify({'success': False, 'error': 'forbidden'}), 403
+    
+    counters = read_counters(db_session)
+    
+    return jsonify({
+        'success': True,
+        'total_users': counters['users'],
+        'completed_transactions': counters['completed_count'],
+        'total_stars': counters['completed_amount'],
+        'pending_transactions': counters['pending_count'],
+        'refunded_transactions': counters['refunded_count'],
+        'expired_transactions': counters['expired_count']
+    })
+
+@api.route('/api/admin/profile', methods=['GET'])
+def api_admin_profile():
+    """Request paling lambat beserta rincian query (butuh SQL_PROFILE=1)"""
+    if not is_internal_request():
+        return jsonify({'success': False, 'error': 'forbidden'}), 403
+    
+    slowest = profiling.slow_log.slowest()
+    if request.args.get('reset'):
+        profiling.slow_log.clear()
+    
+    return jsonify({
+        'success': True,
+        'enabled': profiling.ENABLED,
+        'slowest': slowest
+    })
+
+@api.route('/api/user/<int:telegram_id>', methods=['GET'])
+@rate_limited('read')
 def api_user_detail(telegram_id):
     """Get user details and transactions"""
     try:
@@ -487,16 +755,27 @@ def api_user_detail(telegram_id):
         if not user:
             return jsonify({'success': False, 'error': 'User not found'}), 404
         
-        # Ambil transaksi
-        transactions = db_session.query(Transaction).filter(
-            Transaction.user_id == user.id
-        ).order_by(Transaction.created_at.desc()).limit(50).all()
+        # Profil & riwayat tidak berubah sejak versi ini: 304 tanpa query ke transactions
+        etag = user_etag(user.id, user.version)
+        cached = not_modified(etag)
+        if cached:
+            return cached
         
-        return jsonify({
+        # Ambil transaksi (halaman pertama atau setelah cursor)
+        try:
+            limit = parse_page_size(request.args.get('limit'))
+            transactions, next_cursor = transaction_history(
+                db_session, user.id, cursor=request.args.get('cursor'), limit=limit
+            )
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        
+        return with_etag(json_response({
             'success': True,
             'user': user.to_dict(),
-            'transactions': [t.to_dict() for t in transactions]
-        })
+            'transactions': rows_to_dicts(transactions, TRANSACTION_FIELDS),
+            'next_cursor': next_cursor
+        }), etag)
         
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -504,8 +783,15 @@ def api_user_detail(telegram_id):
 # ============ AKHIR PENAMBAHAN ============
 
 if __name__ == '__main__':
-    port = int(os.getenv('PORT', 8080))
-    app.run(host='0.0.0.0', port=port, debug=False)
+    # Server production multi-proses (gunicorn); FLASK_DEV_SERVER=1 untuk server development Flask
+    if os.getenv('FLASK_DEV_SERVER', '').lower() in ('1', 'true', 'yes'):
+        create_app().run(host='0.0.0.0', port=int(os.getenv('PORT', 8080)), debug=False)
+    else:
+        try:
+            from py.serve import serve
+        except ImportError:
+            from serve import serve
+        serve(create_app())
 
-# Ekspor untuk digunakan di b.py
-__all__ = ['SessionLocal', 'User', 'Transaction', 'get_wib_time', 'engine', 'Base', 'db_session', 'app']
\ No newline at end of file
+# Ekspor untuk kompatibilitas; model & helper data sebaiknya diimpor dari py/models.py
+__all__ = ['SessionLocal', 'User', 'Transaction', 'ArchivedTransaction', 'find_transaction', 'generate_payload', 'get_wib_time', 'get_engine', 'Base', 'db_session', 'api', 'create_app']
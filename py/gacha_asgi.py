@@ -0,0 +1,810 @@
+"""API Gacha Stars mode ASGI (Starlette + SQLAlchemy asyncio).
+
+Route dan bentuk response sama dengan py/gacha.py (Flask). Model dan
+helper diambil dari py/models.py; query berjalan lewat AsyncSession
+(aiosqlite / asyncpg), dan logika sync yang sudah ada (UserService,
+transaction_history, settlement, pre-checkout) dipanggil dengan
+`AsyncSession.run_sync` tanpa thread pool. Long-poll /api/wait-transaction
+menunggu di event loop (AsyncPaymentWaiters) tanpa memegang thread atau
+koneksi DB, dan Bot API dipanggil lewat httpx.AsyncClient, jadi beberapa
+proses cukup untuk ribuan client Mini App.
+
+Dependensi tambahan (tidak dibutuhkan mode Flask):
+
+    pip install "sqlalchemy[asyncio]" starlette uvicorn aiosqlite httpx   # + asyncpg untuk PostgreSQL
+
+Jalankan (setelah `python py/models.py migrate`):
+
+    python py/gacha_asgi.py                                  # satu proses, PORT
+    uvicorn py.gacha_asgi:app --host 0.0.0.0 --port 8080 --workers 4
+
+Dengan beberapa worker, event dari b.py (/api/internal/transaction-event)
+hanya sampai ke satu worker; AsyncPaymentEventBus (py/payment_events.py)
+meneruskannya ke worker lain lewat Redis pub/sub, atau satu task per
+worker membaca status payload yang ditunggu dari database.
+"""
+import asyncio
+import functools
+import hmac
+import json
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+
+try:
+    from starlette.applications import Starlette
+    from starlette.concurrency import run_in_threadpool
+    from starlette.middleware import Middleware
+    from starlette.middleware.cors import CORSMiddleware
+    from starlette.responses import Response
+    from starlette.routing import Route
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+except ImportError as e:
+    raise ImportError(
+        'Mode ASGI membutuhkan: pip install "sqlalchemy[asyncio]" starlette uvicorn aiosqlite httpx'
+    ) from e
+
+from sqlalchemy import select
+
+try:
+    from py.api_common import (
+        INTERNAL_API_SECRET, LONGPOLL_TIMEOUT, METRICS_TOKEN, TELEGRAM_WEBHOOK_SECRET,
+        HTTP_IN_FLIGHT, HTTP_LATENCY, HTTP_REQUESTS, auth_profile
+    )
+    from py.models import (
+        DATABASE_URL, TRANSACTION_FIELDS, Transaction, User, find_transaction, finished_transactions,
+        generate_payload, get_wib_time, transaction_history, transaction_status, user_etag, user_service,
+        wib_isoformat
+    )
+    from py.bot_api import AsyncBotAPI
+    from py.database import create_async_db_engine
+    from py.pagination import parse_page_size
+    from py.payment_events import AsyncPaymentEventBus, AsyncPaymentWaiters
+    from py.payments import check_precheckout, deposit_success_message
+    from py.serialization import dumps, rows_to_dicts
+    from py.settlement import settle_payments
+    from py.ratelimit import client_ip, create_limiter, limited_body
+    from py.stats import bump, read_counters
+    from py.users import touch_users
+    from py import metrics, profiling
+except ImportError:
+    from api_common import (
+        INTERNAL_API_SECRET, LONGPOLL_TIMEOUT, METRICS_TOKEN, TELEGRAM_WEBHOOK_SECRET,
+        HTTP_IN_FLIGHT, HTTP_LATENCY, HTTP_REQUESTS, auth_profile
+    )
+    from models import (
+        DATABASE_URL, TRANSACTION_FIELDS, Transaction, User, find_transaction, finished_transactions,
+        generate_payload, get_wib_time, transaction_history, transaction_status, user_etag, user_service,
+        wib_isoformat
+    )
+    from bot_api import AsyncBotAPI
+    from database import create_async_db_engine
+    from pagination import parse_page_size
+    from payment_events import AsyncPaymentEventBus, AsyncPaymentWaiters
+    from payments import check_precheckout, deposit_success_message
+    from serialization import dumps, rows_to_dicts
+    from settlement import settle_payments
+    from ratelimit import client_ip, create_limiter, limited_body
+    from stats import bump, read_counters
+    from users import touch_users
+    import metrics
+    import profiling
+
+logger = logging.getLogger(__name__)
+
+# Engine async dibuat di lifespan (per proses worker), bukan saat modul diimpor,
+# sama seperti get_engine() di py/models.py
+engine = None
+# expire_on_commit=False: atribut objek tetap bisa dibaca setelah commit tanpa lazy load
+AsyncSessionLocal = async_sessionmaker(expire_on_commit=False)
+
+waiters = AsyncPaymentWaiters()
+# Dibuat di lifespan: meneruskan event ke worker lain (py/payment_events.py)
+payment_events = None
+bot_api = None
+# Rate limit per IP (py/ratelimit.py), sama dengan mode Flask
+limiter = create_limiter()
+
+metrics.registry.gauge(
+    'gacha_async_db_pool_checked_out', 'Koneksi DB async yang sedang dipakai',
+    callback=lambda: engine.pool.checkedout() if engine is not None else 0
+)
+metrics.registry.gauge(
+    'gacha_async_longpoll_waiting_payloads', 'Payload yang sedang ditunggu long-poll (ASGI)',
+    callback=lambda: len(waiters)
+)
+
+
+# Helper response
+
+def json_response(obj, status=200, headers=None):
+    return Response(dumps(obj), status_code=status, headers=headers, media_type='application/json')
+
+def error_response(message, status):
+    return json_response({'success': False, 'error': message}, status)
+
+def with_etag(response, etag):
+    # Sama dengan with_etag di py/gacha.py: ETag lemah + selalu revalidasi
+    response.headers['ETag'] = f'W/"{etag}"'
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def not_modified(request, etag):
+    """Response 304 jika If-None-Match cocok (perbandingan lemah), selain itu None"""
+    header = request.headers.get('if-none-match')
+    if not header:
+        return None
+    for candidate in header.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == '*' or candidate.strip('"') == etag:
+            return with_etag(Response(status_code=304), etag)
+    return None
+
+async def read_json(request):
+    """Body JSON request, None jika kosong atau tidak valid"""
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+def is_internal_request(request):
+    """Request dari bot / admin: header X-Internal-Secret harus cocok"""
+    secret = request.headers.get('x-internal-secret', '')
+    return bool(INTERNAL_API_SECRET) and hmac.compare_digest(secret, INTERNAL_API_SECRET)
+
+def parse_telegram_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+def rate_limited(route):
+    """Tolak dengan 429 + Retry-After jika budget `route` habis, sebelum endpoint menyentuh DB"""
+    def decorator(endpoint):
+        @functools.wraps(endpoint)
+        async def wrapper(request):
+            keys = {'ip': client_ip(
+                request.client.host if request.client else None,
+                request.headers.get('x-forwarded-for'),
+                request.headers.get('cf-connecting-ip')
+            )}
+            if limiter.blocking:
+                # Backend Redis: jangan blok event loop
+                retry_after = await run_in_threadpool(limiter.hit, route, **keys)
+            else:
+                retry_after = limiter.hit(route, **keys)
+            if retry_after:
+                return json_response(limited_body(retry_after), 429, headers={'Retry-After': str(retry_after)})
+            return await endpoint(request)
+        return wrapper
+    return decorator
+
+async def find_user_version(db, telegram_id):
+    """(id, version, balance) user tanpa memuat objek ORM, None jika tidak ada"""
+    result = await db.execute(
+        select(User.id, User.version, User.balance).where(User.telegram_id == telegram_id)
+    )
+    return result.first()
+
+async def _finished_transactions(payloads):
+    async with AsyncSessionLocal() as db:
+        return await db.run_sync(finished_transactions, payloads)
+
+
+# Logika sync (dijalankan lewat AsyncSession.run_sync)
+
+def _add_pending(db, user_id, telegram_id, amount):
+    """Buat transaksi pending + counter dalam satu commit"""
+    transaction = Transaction(
+        user_id=user_id,
+        amount=amount,
+        payload=generate_payload(telegram_id, amount),
+        status='pending'
+    )
+    db.add(transaction)
+    bump(db, pending_count=1)
+    touch_users(db, user_id)
+    db.commit()
+    return transaction
+
+def _delete_pending(db, transaction):
+    """Batalkan transaksi pending jika invoice gagal dibuat"""
+    db.delete(transaction)
+    bump(db, pending_count=-1)
+    touch_users(db, transaction.user_id)
+    db.commit()
+
+def _auth_user(db, data):
+    """Versi sync auth_user_from_request: return (user, None) atau (None, pesan error)"""
+    if not data or 'user' not in data:
+        return None, 'Invalid auth data'
+
+    user_data = json.loads(data['user'])
+    telegram_id = user_data.get('id')
+    if not telegram_id:
+        return None, 'No user ID'
+
+    user = user_service.get_or_create(
+        db, telegram_id, user_data.get('username'), user_data.get('first_name'),
+        user_data.get('last_name'), refresh_profile=True
+    )
+    return user, None
+
+def _latest_pending(db, user_id):
+    return db.query(Transaction).filter(
+        Transaction.user_id == user_id,
+        Transaction.status == 'pending'
+    ).order_by(Transaction.created_at.desc()).first()
+
+
+# Routes
+
+async def index(request):
+    return json_response({
+        'status': 'online',
+        'message': 'Gacha Stars API',
+        'time': get_wib_time().isoformat()
+    })
+
+@rate_limited('read')
+async def get_user(request):
+    """Get or create user by Telegram ID"""
+    if not request.query_params.get('telegram_id'):
+        return error_response('telegram_id required', 400)
+    telegram_id = parse_telegram_id(request.query_params['telegram_id'])
+    if telegram_id is None:
+        return error_response('invalid telegram_id', 400)
+
+    async with AsyncSessionLocal() as db:
+        # User lama dengan ETag yang masih berlaku: tidak perlu upsert
+        if request.headers.get('if-none-match'):
+            row = await find_user_version(db, telegram_id)
+            if row:
+                cached = not_modified(request, user_etag(row.id, row.version))
+                if cached:
+                    return cached
+
+        args = request.query_params
+        user = await db.run_sync(
+            user_service.get_or_create, telegram_id,
+            args.get('username', ''), args.get('first_name', ''), args.get('last_name', '')
+        )
+        user_dict = user.to_dict()
+        etag = user_etag(user.id, user.version)
+        await db.commit()
+
+    return with_etag(json_response({'success': True, 'user': user_dict}), etag)
+
+@rate_limited('read')
+async def get_balance(request):
+    """Get user balance"""
+    if not request.query_params.get('telegram_id'):
+        return error_response('telegram_id required', 400)
+    telegram_id = parse_telegram_id(request.query_params['telegram_id'])
+    if telegram_id is None:
+        return error_response('invalid telegram_id', 400)
+
+    async with AsyncSessionLocal() as db:
+        user = await find_user_version(db, telegram_id)
+
+    if not user:
+        return error_response('user not found', 404)
+
+    etag = user_etag(user.id, user.version)
+    return not_modified(request, etag) or with_etag(json_response({
+        'success': True,
+        'balance': user.balance
+    }), etag)
+
+@rate_limited('deposit')
+async def create_deposit(request):
+    """Create deposit invoice"""
+    data = await read_json(request)
+    if not data:
+        return error_response('no data provided', 400)
+
+    telegram_id = data.get('telegram_id')
+    amount = data.get('amount')
+    if not telegram_id or not amount:
+        return error_response('telegram_id and amount required', 400)
+
+    try:
+        telegram_id = int(telegram_id)
+        amount = int(amount)
+    except (TypeError, ValueError):
+        return error_response('invalid parameters', 400)
+    if amount <= 0 or amount > 2500:
+        return error_response('invalid amount (1-2500)', 400)
+
+    async with AsyncSessionLocal() as db:
+        user = await db.run_sync(
+            user_service.get_or_create, telegram_id,
+            data.get('username', ''), data.get('first_name', ''), data.get('last_name', '')
+        )
+        transaction = await db.run_sync(_add_pending, user.id, telegram_id, amount)
+
+        if not os.getenv('BOT_TOKEN'):
+            return error_response('bot token not configured', 500)
+
+        try:
+            result = await bot_api.create_invoice_link(transaction.payload, amount)
+        except Exception as e:
+            await db.run_sync(_delete_pending, transaction)
+            return error_response(str(e), 500)
+
+        if not result.get('ok'):
+            await db.run_sync(_delete_pending, transaction)
+            return error_response(result.get('description', 'Failed to create invoice'), 500)
+
+    return json_response({
+        'success': True,
+        'invoice_link': result['result'],
+        'payload': transaction.payload,
+        'amount': amount,
+        'transaction_id': transaction.id
+    })
+
+@rate_limited('read')
+async def get_user_transactions(request):
+    """Get user transactions"""
+    telegram_id = parse_telegram_id(request.path_params['telegram_id'])
+    if telegram_id is None:
+        return error_response('invalid telegram_id', 400)
+
+    async with AsyncSessionLocal() as db:
+        user = await find_user_version(db, telegram_id)
+        if not user:
+            return error_response('user not found', 404)
+
+        # Riwayat tidak berubah sejak versi ini: 304 tanpa query ke transactions
+        etag = user_etag(user.id, user.version)
+        cached = not_modified(request, etag)
+        if cached:
+            return cached
+
+        status = request.query_params.get('status', 'all')
+        try:
+            limit = parse_page_size(request.query_params.get('limit'))
+            transactions, next_cursor = await db.run_sync(
+                transaction_history, user.id, status=None if status == 'all' else status,
+                cursor=request.query_params.get('cursor'), limit=limit
+            )
+        except ValueError as e:
+            return error_response(str(e), 400)
+
+    return with_etag(json_response({
+        'success': True,
+        'transactions': rows_to_dicts(transactions, TRANSACTION_FIELDS),
+        'next_cursor': next_cursor
+    }), etag)
+
+@rate_limited('check')
+async def check_transaction(request):
+    """Check transaction status by payload"""
+    async with AsyncSessionLocal() as db:
+        transaction = await db.run_sync(find_transaction, payload=request.path_params['payload'])
+
+    if not transaction:
+        return error_response('transaction not found', 404)
+
+    return json_response({'success': True, 'transaction': transaction.to_dict()})
+
+async def telegram_webhook(request):
+    """Webhook Bot API, sama dengan /api/webhook/telegram di py/gacha.py"""
+    if not TELEGRAM_WEBHOOK_SECRET:
+        return error_response('webhook disabled', 404)
+
+    token = request.headers.get('x-telegram-bot-api-secret-token', '')
+    if not hmac.compare_digest(token, TELEGRAM_WEBHOOK_SECRET):
+        return error_response('forbidden', 403)
+
+    update = await read_json(request) or {}
+
+    if 'pre_checkout_query' in update:
+        return json_response(await webhook_precheckout(update['pre_checkout_query']))
+
+    message = update.get('message') or {}
+    if 'successful_payment' in message:
+        # Error di sini -> 500, Telegram mengirim ulang (settlement idempotent)
+        return json_response(await webhook_successful_payment(message))
+
+    return json_response({})
+
+async def webhook_precheckout(query):
+    try:
+        async with AsyncSessionLocal() as db:
+            error = await db.run_sync(
+                check_precheckout, query.get('invoice_payload', ''), query['from']['id'],
+                query.get('currency'), query.get('total_amount'), get_wib_time()
+            )
+    except Exception as e:
+        logger.error(f"Error in pre_checkout webhook: {e}")
+        error = "Terjadi kesalahan sistem"
+
+    answer = {
+        'method': 'answerPreCheckoutQuery',
+        'pre_checkout_query_id': query['id'],
+        'ok': error is None
+    }
+    if error:
+        answer['error_message'] = error
+    return answer
+
+async def webhook_successful_payment(message):
+    payment = message['successful_payment']
+    payload = payment.get('invoice_payload', '')
+    charge_id = payment['telegram_payment_charge_id']
+    amount = payment['total_amount']
+
+    async with AsyncSessionLocal() as db:
+        settled = await db.run_sync(settle_payments, [(payload, charge_id, amount)], get_wib_time())
+    completed_at = settled[0]
+    if not completed_at:
+        # Sudah di-settle (update dikirim ulang) atau payload tidak dikenal
+        return {}
+
+    await payment_events.publish(payload, {
+        'status': 'completed',
+        'amount': amount,
+        'completed_at': wib_isoformat(completed_at)
+    })
+
+    return {
+        'method': 'sendMessage',
+        'chat_id': message['chat']['id'],
+        'text': deposit_success_message(amount, charge_id, completed_at),
+        'parse_mode': 'HTML'
+    }
+
+async def metrics_endpoint(request):
+    """Metrics dalam text exposition format Prometheus"""
+    if METRICS_TOKEN:
+        expected = f'Bearer {METRICS_TOKEN}'
+        if not hmac.compare_digest(request.headers.get('authorization', ''), expected):
+            return Response('forbidden\n', status_code=403, media_type='text/plain')
+
+    return Response(metrics.registry.render(), headers={'Content-Type': metrics.CONTENT_TYPE})
+
+async def api_test(request):
+    """Endpoint untuk test koneksi"""
+    return json_response({
+        'success': True,
+        'status': 'online',
+        'time': get_wib_time().isoformat()
+    })
+
+@rate_limited('auth')
+async def api_auth(request):
+    """Autentikasi user dari Telegram"""
+    try:
+        data = await read_json(request)
+        async with AsyncSessionLocal() as db:
+            user, error = await db.run_sync(_auth_user, data)
+            if error:
+                return error_response(error, 400)
+            profile = auth_profile(user)
+            await db.commit()
+
+        return json_response({'success': True, **profile})
+
+    except Exception as e:
+        return error_response(str(e), 500)
+
+@rate_limited('auth')
+async def api_bootstrap(request):
+    """Startup Mini App dalam satu request: auth, profil, saldo, riwayat, invoice pending"""
+    try:
+        try:
+            limit = parse_page_size(request.query_params.get('limit'))
+        except ValueError as e:
+            return error_response(str(e), 400)
+
+        data = await read_json(request)
+        async with AsyncSessionLocal() as db:
+            user, error = await db.run_sync(_auth_user, data)
+            if error:
+                return error_response(error, 400)
+
+            user_id = user.id
+            profile = auth_profile(user)
+            await db.commit()
+
+            transactions, next_cursor = await db.run_sync(transaction_history, user_id, limit=limit)
+            pending = await db.run_sync(_latest_pending, user_id)
+
+        return json_response({
+            'success': True,
+            'user': profile,
+            'transactions': rows_to_dicts(transactions, TRANSACTION_FIELDS),
+            'next_cursor': next_cursor,
+            'pending_invoice': {
+                'payload': pending.payload,
+                'amount': pending.amount,
+                'created_at': pending.created_at.isoformat() if pending.created_at else None
+            } if pending else None
+        })
+
+    except Exception as e:
+        return error_response(str(e), 500)
+
+@rate_limited('deposit')
+async def api_create_deposit(request):
+    """Buat deposit invoice"""
+    try:
+        data = await read_json(request)
+        telegram_id = data.get('telegram_id')
+        amount = data.get('amount')
+
+        if not telegram_id or not amount:
+            return error_response('telegram_id and amount required', 400)
+
+        async with AsyncSessionLocal() as db:
+            user_id = (await db.execute(
+                select(User.id).where(User.telegram_id == telegram_id)
+            )).scalar()
+            if user_id is None:
+                return error_response('User not found', 404)
+
+            transaction = await db.run_sync(_add_pending, user_id, telegram_id, amount)
+            result = await bot_api.create_invoice_link(transaction.payload, amount)
+
+            if not result.get('ok'):
+                # Hapus transaksi jika gagal
+                await db.run_sync(_delete_pending, transaction)
+                return error_response(result.get('description', 'Failed to create invoice'), 500)
+
+        return json_response({
+            'success': True,
+            'payment_link': result['result'],
+            'payload': transaction.payload,
+            'amount': amount
+        })
+
+    except Exception as e:
+        return error_response(str(e), 500)
+
+@rate_limited('check')
+async def api_check_transaction(request):
+    """Cek status transaksi"""
+    try:
+        data = await read_json(request)
+        payload = data.get('payload')
+
+        if not payload:
+            return error_response('Payload required', 400)
+
+        async with AsyncSessionLocal() as db:
+            transaction = await db.run_sync(find_transaction, payload=payload)
+
+        if not transaction:
+            return error_response('Transaction not found', 404)
+
+        return json_response({'success': True, **transaction_status(transaction)})
+
+    except Exception as e:
+        return error_response(str(e), 500)
+
+@rate_limited('wait')
+async def api_wait_transaction(request):
+    """Long-poll: tahan request sampai transaksi keluar dari status pending"""
+    try:
+        data = await read_json(request)
+        payload = data.get('payload')
+
+        if not payload:
+            return error_response('Payload required', 400)
+
+        try:
+            timeout = min(float(data.get('timeout', LONGPOLL_TIMEOUT)), LONGPOLL_TIMEOUT)
+        except (TypeError, ValueError):
+            timeout = LONGPOLL_TIMEOUT
+
+        # Subscribe dulu baru baca status, supaya event tidak terlewat
+        with payment_events.subscribe(payload) as subscription:
+            # Session hanya dibuka selama query: koneksi DB tidak dipegang saat menunggu
+            async with AsyncSessionLocal() as db:
+                transaction = await db.run_sync(find_transaction, payload=payload)
+
+            if not transaction:
+                return error_response('Transaction not found', 404)
+
+            result = {'success': True, **transaction_status(transaction)}
+            if result['status'] == 'pending':
+                event = await subscription.wait(timeout)
+                if event:
+                    result.update({k: v for k, v in event.items() if v is not None})
+                else:
+                    # Timeout (atau event Redis hilang): status terakhir dari database
+                    async with AsyncSessionLocal() as db:
+                        transaction = await db.run_sync(find_transaction, payload=payload)
+                    result.update(transaction_status(transaction))
+
+        return json_response(result)
+
+    except Exception as e:
+        return error_response(str(e), 500)
+
+async def api_transaction_event(request):
+    """Dipanggil b.py setelah status transaksi berubah, membangunkan long-poll"""
+    if not is_internal_request(request):
+        return error_response('forbidden', 403)
+
+    data = await read_json(request) or {}
+    payload = data.get('payload')
+    status = data.get('status')
+
+    if not payload or not status:
+        return error_response('payload and status required', 400)
+
+    woken = await payment_events.publish(payload, {
+        'status': status,
+        'amount': data.get('amount'),
+        'completed_at': data.get('completed_at')
+    })
+
+    return json_response({'success': True, 'woken': woken})
+
+async def api_admin_stats(request):
+    """Statistik admin dari counter incremental (tanpa scan tabel)"""
+    if not is_internal_request(request):
+        return error_response('forbidden', 403)
+
+    async with AsyncSessionLocal() as db:
+        counters = await db.run_sync(read_counters)
+
+    return json_response({
+        'success': True,
+        'total_users': counters['users'],
+        'completed_transactions': counters['completed_count'],
+        'total_stars': counters['completed_amount'],
+        'pending_transactions': counters['pending_count'],
+        'refunded_transactions': counters['refunded_count'],
+        'expired_transactions': counters['expired_count']
+    })
+
+async def api_admin_profile(request):
+    """Request paling lambat beserta rincian query (butuh SQL_PROFILE=1)"""
+    if not is_internal_request(request):
+        return error_response('forbidden', 403)
+
+    slowest = profiling.slow_log.slowest()
+    if request.query_params.get('reset'):
+        profiling.slow_log.clear()
+
+    return json_response({
+        'success': True,
+        'enabled': profiling.ENABLED,
+        'slowest': slowest
+    })
+
+@rate_limited('read')
+async def api_user_detail(request):
+    """Get user details and transactions"""
+    try:
+        async with AsyncSessionLocal() as db:
+            user = (await db.execute(
+                select(User).where(User.telegram_id == request.path_params['telegram_id'])
+            )).scalar()
+
+            if not user:
+                return error_response('User not found', 404)
+
+            # Profil & riwayat tidak berubah sejak versi ini: 304 tanpa query ke transactions
+            etag = user_etag(user.id, user.version)
+            cached = not_modified(request, etag)
+            if cached:
+                return cached
+
+            try:
+                limit = parse_page_size(request.query_params.get('limit'))
+                transactions, next_cursor = await db.run_sync(
+                    transaction_history, user.id, cursor=request.query_params.get('cursor'), limit=limit
+                )
+            except ValueError as e:
+                return error_response(str(e), 400)
+
+        return with_etag(json_response({
+            'success': True,
+            'user': user.to_dict(),
+            'transactions': rows_to_dicts(transactions, TRANSACTION_FIELDS),
+            'next_cursor': next_cursor
+        }), etag)
+
+    except Exception as e:
+        return error_response(str(e), 500)
+
+
+class RequestMetrics:
+    """Middleware ASGI: metrics HTTP + profiling SQL per request (seperti hook Flask)"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        started = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        method = scope['method']
+        HTTP_IN_FLIGHT.inc()
+        try:
+            with profiling.profiled(f"{method} {scope['path']}"):
+                await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            # Router Starlette mengisi scope['route'] untuk request yang cocok
+            route = scope.get('route')
+            endpoint = route.path if route is not None else 'unmatched'
+            HTTP_LATENCY.observe(time.perf_counter() - started, method=method, endpoint=endpoint)
+            HTTP_REQUESTS.inc(method=method, endpoint=endpoint, status=status)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    global bot_api, engine, payment_events
+    engine = create_async_db_engine(DATABASE_URL)
+    profiling.install(engine.sync_engine)
+    AsyncSessionLocal.configure(bind=engine)
+    bot_api = AsyncBotAPI(os.getenv('BOT_TOKEN'))
+    payment_events = AsyncPaymentEventBus(waiters, _finished_transactions)
+    events_task = asyncio.create_task(payment_events.run())
+    if not INTERNAL_API_SECRET:
+        logger.warning("INTERNAL_API_SECRET belum di-set: endpoint internal/admin menolak semua request")
+    try:
+        yield
+    finally:
+        events_task.cancel()
+        await payment_events.aclose()
+        await bot_api.aclose()
+        await engine.dispose()
+        engine = None
+
+
+routes = [
+    Route('/', index),
+    Route('/api/user', get_user, methods=['GET']),
+    Route('/api/user/balance', get_balance, methods=['GET']),
+    Route('/api/deposit/create', create_deposit, methods=['POST']),
+    Route('/api/transactions/{telegram_id}', get_user_transactions, methods=['GET']),
+    Route('/api/transaction/check/{payload}', check_transaction, methods=['GET']),
+    Route('/api/webhook/telegram', telegram_webhook, methods=['POST']),
+    Route('/metrics', metrics_endpoint, methods=['GET']),
+    Route('/api/test', api_test, methods=['GET']),
+    Route('/api/auth', api_auth, methods=['POST']),
+    Route('/api/bootstrap', api_bootstrap, methods=['POST']),
+    Route('/api/create-deposit', api_create_deposit, methods=['POST']),
+    Route('/api/check-transaction', api_check_transaction, methods=['POST']),
+    Route('/api/wait-transaction', api_wait_transaction, methods=['POST']),
+    Route('/api/internal/transaction-event', api_transaction_event, methods=['POST']),
+    Route('/api/admin/stats', api_admin_stats, methods=['GET']),
+    Route('/api/admin/profile', api_admin_profile, methods=['GET']),
+    Route('/api/user/{telegram_id:int}', api_user_detail, methods=['GET']),
+]
+
+app = Starlette(
+    routes=routes,
+    middleware=[
+        # CORS untuk GitHub Pages, sama dengan CORS(app, expose_headers=['ETag'])
+        Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'],
+                   allow_headers=['*'], expose_headers=['ETag']),
+        Middleware(RequestMetrics),
+    ],
+    lifespan=lifespan,
+)
+
+if __name__ == '__main__':
+    import uvicorn
+
+    port = int(os.getenv('PORT', 8080))
+    uvicorn.run(app, host='0.0.0.0', port=port)
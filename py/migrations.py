@@ -0,0 +1,104 @@
+"""Migrasi skema database.
+
+Tabel baru dibuat oleh `Base.metadata.create_all`, tapi create_all tidak
+menyentuh tabel yang sudah ada. Perubahan pada tabel lama (index, kolom)
+didaftarkan di MIGRATIONS dan dijalankan sekali per database, versi yang
+sudah diterapkan dicatat di tabel `schema_version`.
+
+Menambah migrasi: tulis fungsi `(conn, metadata)` lalu tambahkan ke
+MIGRATIONS dengan nomor versi berikutnya. Jangan ubah migrasi lama.
+"""
+import logging
+
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import IntegrityError
+
+try:
+    from py.stats import rebuild_counters
+except ImportError:
+    from stats import rebuild_counters
+
+logger = logging.getLogger(__name__)
+
+
+def _create_indexes(conn, metadata, table_name, index_names):
+    table = metadata.tables[table_name]
+    for index in table.indexes:
+        if index.name in index_names:
+            index.create(conn, checkfirst=True)
+
+
+def _transactions_lookup_indexes(conn, metadata):
+    _create_indexes(conn, metadata, 'transactions', {
+        'ix_transactions_user_created',
+        'ix_transactions_user_status_created',
+        'ix_transactions_status',
+    })
+
+
+def _backfill_stats_counters(conn, metadata):
+    # Tabel stats_counters sudah dibuat create_all, isi dari data yang ada
+    rebuild_counters(conn)
+
+
+def _expiry_support(conn, metadata):
+    # Sweeper mencari pending terlama: (status, created_at) menggantikan index (status)
+    _create_indexes(conn, metadata, 'transactions', {'ix_transactions_status_created'})
+    conn.execute(text("DROP INDEX IF EXISTS ix_transactions_status"))
+    conn.execute(text(
+        "INSERT INTO stats_counters (name, value) "
+        "SELECT 'expired_count', (SELECT COUNT(*) FROM transactions WHERE status = 'expired') "
+        "WHERE NOT EXISTS (SELECT 1 FROM stats_counters WHERE name = 'expired_count')"
+    ))
+
+
+def _user_version(conn, metadata):
+    # Database baru sudah mendapat kolom ini dari create_all
+    columns = {column['name'] for column in inspect(conn).get_columns('users')}
+    if 'version' not in columns:
+        conn.execute(text("ALTER TABLE users ADD COLUMN version INTEGER NOT NULL DEFAULT 0"))
+
+
+MIGRATIONS = [
+    (1, 'transactions: index user_id/status/created_at', _transactions_lookup_indexes),
+    (2, 'stats_counters: backfill', _backfill_stats_counters),
+    (3, 'transactions: status expired + index status/created_at', _expiry_support),
+    (4, 'users: kolom version (ETag)', _user_version),
+]
+
+
+def current_version(conn):
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_version ("
+        "version INTEGER PRIMARY KEY, "
+        "name VARCHAR(255), "
+        "applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)"
+    ))
+    return conn.execute(text("SELECT MAX(version) FROM schema_version")).scalar() or 0
+
+
+def migrate(engine, metadata):
+    """Buat tabel yang belum ada lalu jalankan migrasi yang belum diterapkan"""
+    metadata.create_all(bind=engine)
+
+    with engine.begin() as conn:
+        version = current_version(conn)
+
+    for number, name, func in MIGRATIONS:
+        if number <= version:
+            continue
+        try:
+            # Satu transaksi per migrasi, termasuk pencatatan versinya
+            with engine.begin() as conn:
+                func(conn, metadata)
+                conn.execute(
+                    text("INSERT INTO schema_version (version, name) VALUES (:version, :name)"),
+                    {'version': number, 'name': name}
+                )
+            logger.info(f"Migrasi {number} diterapkan: {name}")
+        except IntegrityError:
+            with engine.begin() as conn:
+                if current_version(conn) < number:
+                    raise
+            # Proses lain (API/bot) sudah menerapkan migrasi ini
+            logger.info(f"Migrasi {number} sudah diterapkan proses lain")
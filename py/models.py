@@ -0,0 +1,302 @@
+"""Model database dan helper data bersama.
+
+Dipakai API (py/gacha.py, py/gacha_asgi.py), bot (b.py) dan worker
+(py/sweeper.py, py/archive.py). Modul ini sengaja ringan: tidak mengimpor
+Flask, tidak membuka koneksi dan tidak menyentuh skema saat diimpor. Engine
+dibuat saat pertama dipakai (`get_engine`, atau session pertama dari
+`SessionLocal`).
+
+Skema dibuat/dimigrasi dengan perintah terpisah, sekali per deploy sebelum
+API dan bot dijalankan:
+
+    python py/models.py migrate
+"""
+import os
+import sys
+import threading
+from datetime import datetime
+
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Index
+from sqlalchemy.orm import declarative_base, sessionmaker, relationship
+import pytz
+from dotenv import load_dotenv
+
+try:
+    from py.database import create_db_engine
+    from py.pagination import keyset_page, merge_pages
+    from py.archive import archive_horizon
+    from py.users import UserService
+    from py.payloads import new_payload
+    from py import profiling
+except ImportError:
+    from database import create_db_engine
+    from pagination import keyset_page, merge_pages
+    from archive import archive_horizon
+    from users import UserService
+    from payloads import new_payload
+    import profiling
+
+load_dotenv()
+
+# Timezone Indonesia
+WIB = pytz.timezone('Asia/Jakarta')
+
+# Database Configuration (profil SQLite: lihat py/database.py)
+DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///gacha.db')
+
+_engine = None
+_engine_lock = threading.Lock()
+_session_factory = sessionmaker(autocommit=False, autoflush=False)
+
+
+def get_engine():
+    """Engine proses ini, dibuat saat pertama dipakai"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                engine = create_db_engine(DATABASE_URL)
+                # Profiling query per request/handler (opt-in, SQL_PROFILE=1)
+                profiling.install(engine)
+                _session_factory.configure(bind=engine)
+                _engine = engine
+    return _engine
+
+
+def SessionLocal(**kwargs):
+    """Session baru; membuat engine jika belum ada"""
+    get_engine()
+    return _session_factory(**kwargs)
+
+
+def dispose_engine_after_fork():
+    """Dipanggil di proses anak setelah fork: buang pool warisan proses induk"""
+    # close=False supaya koneksi milik induk tidak ditutup dari proses anak
+    if _engine is not None:
+        _engine.dispose(close=False)
+
+
+Base = declarative_base()
+
+# Models
+class User(Base):
+    __tablename__ = 'users'
+    
+    id = Column(Integer, primary_key=True)
+    telegram_id = Column(Integer, unique=True, nullable=False)
+    username = Column(String(100))
+    first_name = Column(String(100))
+    last_name = Column(String(100))
+    balance = Column(Integer, default=0)  # Stars balance
+    # Naik setiap profil/saldo/transaksi berubah, dipakai sebagai ETag (py/users.py)
+    version = Column(Integer, nullable=False, default=0, server_default='0')
+    created_at = Column(DateTime, default=lambda: datetime.now(WIB))
+    updated_at = Column(DateTime, default=lambda: datetime.now(WIB), onupdate=lambda: datetime.now(WIB))
+    
+    # Relationships
+    transactions = relationship('Transaction', back_populates='user', cascade='all, delete-orphan')
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'telegram_id': self.telegram_id,
+            'username': self.username,
+            'first_name': self.first_name,
+            'last_name': self.last_name,
+            'balance': self.balance,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+class Transaction(Base):
+    __tablename__ = 'transactions'
+    
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    amount = Column(Integer, nullable=False)  # Stars amount
+    payload = Column(String(255), unique=True, nullable=False)
+    charge_id = Column(String(255), unique=True)
+    status = Column(String(50), default='pending')  # pending, completed, failed, refunded, expired
+    created_at = Column(DateTime, default=lambda: datetime.now(WIB))
+    completed_at = Column(DateTime)
+    refunded_at = Column(DateTime)
+    
+    # Relationships
+    user = relationship('User', back_populates='transactions')
+    
+    # Index untuk riwayat per user (terbaru dulu) dan hitungan per status.
+    # Database lama mendapat index ini lewat py/migrations.py
+    __table_args__ = (
+        Index('ix_transactions_user_created', 'user_id', 'created_at'),
+        Index('ix_transactions_user_status_created', 'user_id', 'status', 'created_at'),
+        Index('ix_transactions_status_created', 'status', 'created_at'),
+    )
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'user_id': self.user_id,
+            'amount': self.amount,
+            'payload': self.payload,
+            'charge_id': self.charge_id,
+            'status': self.status,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'completed_at': self.completed_at.isoformat() if self.completed_at else None,
+            'refunded_at': self.refunded_at.isoformat() if self.refunded_at else None
+        }
+
+class ArchivedTransaction(Base):
+    """Transaksi final yang sudah lama, dipindah dari `transactions` oleh py/archive.py"""
+    __tablename__ = 'transactions_archive'
+    
+    id = Column(Integer, primary_key=True, autoincrement=False)  # id asli dari transactions
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    amount = Column(Integer, nullable=False)
+    payload = Column(String(255), unique=True, nullable=False)
+    charge_id = Column(String(255), unique=True)
+    status = Column(String(50), nullable=False)
+    created_at = Column(DateTime)
+    completed_at = Column(DateTime)
+    refunded_at = Column(DateTime)
+    archived_at = Column(DateTime)
+    
+    __table_args__ = (
+        Index('ix_transactions_archive_user_created', 'user_id', 'created_at'),
+    )
+    
+    to_dict = Transaction.to_dict
+
+class OutboxMessage(Base):
+    """Antrian notifikasi ke user, dikirim oleh py/outbox.py (OutboxSender di b.py)"""
+    __tablename__ = 'outbox'
+    
+    id = Column(Integer, primary_key=True)
+    chat_id = Column(Integer, nullable=False)
+    text = Column(String, nullable=False)
+    parse_mode = Column(String(20))
+    status = Column(String(20), nullable=False, default='pending')  # pending, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False)
+    last_error = Column(String(500))
+    created_at = Column(DateTime, default=lambda: datetime.now(WIB))
+    
+    __table_args__ = (
+        Index('ix_outbox_status_next_attempt', 'status', 'next_attempt_at'),
+    )
+
+class StatCounter(Base):
+    """Counter agregat untuk /stats, di-update lewat py/stats.py"""
+    __tablename__ = 'stats_counters'
+    
+    name = Column(String(50), primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
+
+
+# Helper functions
+def get_wib_time():
+    return datetime.now(WIB)
+
+def find_transaction(db, **filters):
+    """Cari transaksi di tabel hot, lalu di arsip. Contoh: find_transaction(db, payload=p)"""
+    for model in (Transaction, ArchivedTransaction):
+        transaction = db.query(model).filter_by(**filters).first()
+        if transaction:
+            return transaction
+    return None
+
+def wib_isoformat(value):
+    """ISO 8601 dengan offset WIB (+07:00).
+
+    Kolom DateTime menyimpan jam WIB tanpa zona, sedangkan nilai dari
+    get_wib_time() aware; keduanya keluar dalam bentuk yang sama.
+    """
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        return WIB.localize(value).isoformat()
+    return value.astimezone(WIB).isoformat()
+
+def transaction_status(transaction):
+    """Status transaksi untuk check-transaction, long-poll dan event pembayaran"""
+    return {
+        'status': transaction.status,
+        'amount': transaction.amount,
+        'completed_at': wib_isoformat(transaction.completed_at)
+    }
+
+def finished_transactions(db, payloads):
+    """{payload: transaction_status} untuk payload yang sudah tidak pending"""
+    payloads = list(payloads)
+    finished = {}
+    # Transaksi pending tidak pernah diarsip: cukup tabel hot
+    for start in range(0, len(payloads), 500):
+        rows = db.query(
+            Transaction.payload, Transaction.status, Transaction.amount, Transaction.completed_at
+        ).filter(
+            Transaction.payload.in_(payloads[start:start + 500]),
+            Transaction.status != 'pending'
+        )
+        for row in rows:
+            finished[row.payload] = transaction_status(row)
+    return finished
+
+# Kolom riwayat transaksi, urutan & nama sama dengan Transaction.to_dict()
+TRANSACTION_FIELDS = (
+    'id', 'user_id', 'amount', 'payload', 'charge_id', 'status',
+    'created_at', 'completed_at', 'refunded_at'
+)
+
+def transaction_history(db, user_id, status=None, cursor=None, limit=50):
+    """Satu halaman riwayat user (terbaru dulu), membaca arsip jika perlu.
+    
+    Baris berupa tuple TRANSACTION_FIELDS (tanpa objek ORM), ubah ke dict
+    dengan rows_to_dicts. Arsip hanya di-query jika halaman hot tidak penuh
+    atau sudah melewati batas arsip, jadi halaman-halaman awal tetap satu
+    query ke tabel hot. Raise ValueError untuk cursor tidak valid.
+    """
+    def page(model):
+        columns = [getattr(model, field) for field in TRANSACTION_FIELDS]
+        query = db.query(*columns).filter(model.user_id == user_id)
+        if status:
+            query = query.filter(model.status == status)
+        return keyset_page(query, model.created_at, model.id, cursor=cursor, limit=limit)
+    
+    hot = page(Transaction)
+    rows, next_cursor = hot
+    if next_cursor and rows[-1].created_at.replace(tzinfo=None) >= archive_horizon(get_wib_time()):
+        return hot
+    return merge_pages([hot, page(ArchivedTransaction)], limit)
+
+def user_etag(user_id, version):
+    return f'u{user_id}-v{version}'
+
+def generate_payload(user_id, amount):
+    """Payload unik bertanda tangan untuk transaksi (lihat py/payloads.py)"""
+    return new_payload(user_id, amount)
+
+# Get-or-create user (upsert satu statement), dipakai juga oleh b.py
+user_service = UserService(User, get_wib_time)
+
+
+def create_schema():
+    """Buat tabel yang belum ada + jalankan migrasi (py/migrations.py)"""
+    try:
+        from py.migrations import migrate
+    except ImportError:
+        from migrations import migrate
+    migrate(get_engine(), Base.metadata)
+
+
+def main():
+    """python py/models.py migrate"""
+    import logging
+
+    logging.basicConfig(level=logging.INFO)
+    if sys.argv[1:] == ['migrate']:
+        create_schema()
+        print(f"Skema siap: {get_engine().url.render_as_string(hide_password=True)}")
+    else:
+        sys.exit(main.__doc__)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,215 @@
+"""Outbox notifikasi ke user Telegram.
+
+Pesan konfirmasi tidak lagi dikirim langsung dari handler pembayaran.
+Pesan ditulis ke tabel `outbox` di commit yang sama dengan settlement /
+refund (`enqueue`, `enqueue_for_payload`), lalu `OutboxSender` mengirimnya
+di background:
+
+- rate limit global (OUTBOX_GLOBAL_RATE pesan/detik) dan per chat
+  (jeda OUTBOX_CHAT_INTERVAL detik antar pesan ke chat yang sama),
+- maksimal OUTBOX_CONCURRENCY pengiriman bersamaan,
+- FloodWait menahan seluruh pengiriman selama waktu yang diminta Telegram,
+- error lain dicoba ulang dengan backoff eksponensial sampai
+  OUTBOX_MAX_ATTEMPTS, lalu ditandai 'failed'.
+
+Pesan yang terkirim dihapus dari tabel, jadi outbox hanya berisi antrian
+dan pesan gagal. Pesan yang belum terkirim saat proses mati dikirim ulang
+setelah restart.
+"""
+import asyncio
+import logging
+import os
+from datetime import timedelta
+
+from sqlalchemy import DateTime, bindparam, text
+
+logger = logging.getLogger(__name__)
+
+GLOBAL_RATE = float(os.getenv('OUTBOX_GLOBAL_RATE', 25))
+CHAT_INTERVAL = float(os.getenv('OUTBOX_CHAT_INTERVAL', 1.0))
+CONCURRENCY = int(os.getenv('OUTBOX_CONCURRENCY', 8))
+BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', 100))
+POLL_INTERVAL = float(os.getenv('OUTBOX_POLL_INTERVAL', 2.0))
+MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', 8))
+MAX_BACKOFF = 3600
+
+
+class RetryAfter(Exception):
+    """Dilempar fungsi send saat Telegram meminta menunggu (FloodWait)"""
+
+    def __init__(self, seconds):
+        super().__init__(f"retry after {seconds}s")
+        self.seconds = seconds
+
+
+class PermanentError(Exception):
+    """Dilempar fungsi send untuk error yang tidak perlu dicoba ulang (mis. bot diblokir)"""
+
+
+_INSERT_SQL = text(
+    "INSERT INTO outbox (chat_id, text, parse_mode, status, attempts, next_attempt_at, created_at) "
+    "VALUES (:chat_id, :text, :parse_mode, 'pending', 0, :now, :now)"
+).bindparams(bindparam('now', type_=DateTime()))
+
+_INSERT_FOR_PAYLOAD_SQL = text(
+    "INSERT INTO outbox (chat_id, text, parse_mode, status, attempts, next_attempt_at, created_at) "
+    "SELECT u.telegram_id, :text, :parse_mode, 'pending', 0, :now, :now "
+    "FROM transactions t JOIN users u ON u.id = t.user_id WHERE t.payload = :payload"
+).bindparams(bindparam('now', type_=DateTime()))
+
+_DUE_SQL = text(
+    "SELECT id, chat_id, text, parse_mode, attempts FROM outbox "
+    "WHERE status = 'pending' AND next_attempt_at <= :now "
+    "ORDER BY id LIMIT :limit"
+).bindparams(bindparam('now', type_=DateTime()))
+
+_DELETE_SQL = text("DELETE FROM outbox WHERE id IN :ids").bindparams(bindparam('ids', expanding=True))
+
+_RETRY_SQL = text(
+    "UPDATE outbox SET status = :status, attempts = :attempts, "
+    "next_attempt_at = :next_attempt_at, last_error = :error WHERE id = :id"
+).bindparams(bindparam('next_attempt_at', type_=DateTime()))
+
+
+def enqueue(db, chat_id, message, now, parse_mode='html'):
+    """Antrikan pesan di transaksi `db` (ikut commit pemanggil)"""
+    db.execute(_INSERT_SQL, {'chat_id': chat_id, 'text': message, 'parse_mode': parse_mode, 'now': now})
+
+
+def enqueue_for_payload(db, payload, message, now, parse_mode='html'):
+    """Antrikan pesan untuk pemilik transaksi `payload`"""
+    db.execute(_INSERT_FOR_PAYLOAD_SQL, {
+        'payload': payload, 'text': message, 'parse_mode': parse_mode, 'now': now
+    })
+
+
+def fetch_due(db, now, limit=BATCH_SIZE):
+    rows = db.execute(_DUE_SQL, {'now': now, 'limit': limit}).all()
+    db.rollback()
+    return rows
+
+
+def record_results(db, sent_ids, retries):
+    """Satu commit untuk hasil satu batch: hapus yang terkirim, jadwalkan ulang sisanya"""
+    if sent_ids:
+        db.execute(_DELETE_SQL, {'ids': sent_ids})
+    if retries:
+        db.execute(_RETRY_SQL, retries)
+    db.commit()
+
+
+def backoff(attempts):
+    return min(2 ** attempts * 5, MAX_BACKOFF)
+
+
+class OutboxSender:
+    """Pengirim background untuk event loop bot.
+
+    `send(chat_id, text, parse_mode)` adalah coroutine pengirim pesan; ia
+    melempar RetryAfter / PermanentError agar sender bisa membedakan
+    FloodWait dan error permanen dari error sementara.
+    """
+
+    def __init__(self, adb, send, clock, global_rate=GLOBAL_RATE, chat_interval=CHAT_INTERVAL,
+                 concurrency=CONCURRENCY, batch_size=BATCH_SIZE, poll_interval=POLL_INTERVAL,
+                 max_attempts=MAX_ATTEMPTS):
+        self.adb = adb
+        self.send = send
+        self.clock = clock
+        self.global_interval = 1 / global_rate
+        self.chat_interval = chat_interval
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._wakeup = asyncio.Event()
+        self._global_next = 0.0
+        self._paused_until = 0.0
+        self._chat_next = {}
+
+    def wake(self):
+        """Minta sender memeriksa outbox sekarang (mis. setelah settlement)"""
+        self._wakeup.set()
+
+    async def run(self):
+        logger.info(f"Outbox sender aktif: {1 / self.global_interval:g} pesan/detik, "
+                    f"{self.chat_interval}s per chat")
+        while True:
+            try:
+                sent = await self.drain_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Outbox error: {e}")
+                sent = 0
+            if sent < self.batch_size:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+
+    async def drain_once(self):
+        """Kirim satu batch pesan yang jatuh tempo. Return jumlah pesan yang diproses"""
+        rows = await self.adb.run(fetch_due, self.clock(), self.batch_size)
+        if not rows:
+            return 0
+        results = await asyncio.gather(*(self._deliver(row) for row in rows))
+
+        sent_ids = [row.id for row, result in zip(rows, results) if result is None]
+        retries = [result for result in results if result is not None]
+        await self.adb.run(record_results, sent_ids, retries)
+        return len(rows)
+
+    async def _throttle(self, chat_id):
+        # Reservasi slot global dan slot chat secara terpisah, supaya antrian
+        # satu chat tidak menahan pesan ke chat lain, lalu tidur sampai slot itu
+        loop = asyncio.get_running_loop()
+        while True:
+            now = loop.time()
+            global_slot = max(now, self._global_next)
+            self._global_next = global_slot + self.global_interval
+            start = max(global_slot, self._chat_next.get(chat_id, 0.0))
+            self._chat_next[chat_id] = start + self.chat_interval
+            if len(self._chat_next) > 10000:
+                self._chat_next = {chat: at for chat, at in self._chat_next.items() if at > now}
+            if start > now:
+                await asyncio.sleep(start - now)
+            # Slot yang dipesan sebelum FloodWait tidak berlaku: tunggu lalu pesan ulang
+            if loop.time() >= self._paused_until:
+                return
+            await asyncio.sleep(self._paused_until - loop.time())
+
+    async def _deliver(self, row):
+        """Return None jika terkirim, atau parameter update untuk record_results"""
+        # Tunggu slot rate limit di luar semaphore: jeda per chat tidak memakan slot kirim
+        await self._throttle(row.chat_id)
+        async with self._semaphore:
+            try:
+                await self.send(row.chat_id, row.text, row.parse_mode)
+                return None
+            except RetryAfter as e:
+                # FloodWait berlaku untuk bot, bukan hanya chat ini: tahan semua pengiriman
+                pause_until = asyncio.get_running_loop().time() + e.seconds
+                self._paused_until = max(self._paused_until, pause_until)
+                self._global_next = max(self._global_next, pause_until)
+                logger.warning(f"Outbox FloodWait {e.seconds}s")
+                return self._retry(row, str(e), e.seconds, count_attempt=False)
+            except PermanentError as e:
+                logger.warning(f"Outbox: pesan {row.id} ke {row.chat_id} gagal permanen: {e}")
+                return self._retry(row, str(e), 0, give_up=True)
+            except Exception as e:
+                return self._retry(row, str(e), backoff(row.attempts))
+
+    def _retry(self, row, error, delay, count_attempt=True, give_up=False):
+        attempts = row.attempts + (1 if count_attempt else 0)
+        failed = give_up or attempts >= self.max_attempts
+        if failed and not give_up:
+            logger.error(f"Outbox: pesan {row.id} ke {row.chat_id} gagal setelah {attempts} percobaan: {error}")
+        return {
+            'id': row.id,
+            'status': 'failed' if failed else 'pending',
+            'attempts': attempts,
+            'next_attempt_at': self.clock() + timedelta(seconds=delay),
+            'error': error[:500]
+        }
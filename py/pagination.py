@@ -0,0 +1,88 @@
+"""Keyset (cursor) pagination untuk riwayat transaksi.
+
+Halaman diurutkan (created_at DESC, id DESC). Cursor menyimpan posisi
+baris terakhir halaman sebelumnya, jadi halaman berikutnya langsung
+dicari lewat index (user_id, created_at) tanpa OFFSET: biaya halaman ke-N
+sama dengan halaman pertama.
+"""
+import base64
+import json
+from datetime import datetime
+
+from sqlalchemy import and_, or_
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 100
+
+
+def encode_cursor(created_at, row_id):
+    """Cursor opaque (base64url) dari posisi (created_at, id)"""
+    raw = json.dumps([created_at.isoformat() if created_at else None, row_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Kebalikan encode_cursor. Raise ValueError jika cursor tidak valid"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return (datetime.fromisoformat(created_at) if created_at else None), int(row_id)
+    except Exception:
+        raise ValueError('invalid cursor')
+
+
+def parse_page_size(value, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    """Ukuran halaman dari query string, dibatasi 1..maximum"""
+    if value in (None, ''):
+        return default
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        raise ValueError('invalid limit')
+    return max(1, min(size, maximum))
+
+
+def keyset_page(query, created_col, id_col, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """Ambil satu halaman terbaru-dulu setelah `cursor`.
+
+    Return (rows, next_cursor); next_cursor None jika tidak ada halaman lagi.
+    """
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        query = query.filter(or_(
+            created_col < created_at,
+            and_(created_col == created_at, id_col < row_id)
+        ))
+
+    # Ambil satu baris ekstra untuk tahu apakah masih ada halaman berikutnya
+    rows = query.order_by(created_col.desc(), id_col.desc()).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(last.created_at, last.id)
+
+    return rows, next_cursor
+
+
+def merge_pages(pages, limit=DEFAULT_PAGE_SIZE):
+    """Gabungkan hasil keyset_page dari beberapa tabel (mis. hot + arsip).
+
+    Setiap halaman harus diambil dengan cursor dan limit yang sama. Return
+    (rows, next_cursor) seolah-olah semua baris berasal dari satu tabel.
+    """
+    rows = sorted(
+        (row for page_rows, _ in pages for row in page_rows),
+        key=lambda row: (row.created_at or datetime.min, row.id),
+        reverse=True
+    )
+    has_more = len(rows) > limit or any(next_cursor for _, next_cursor in pages)
+    rows = rows[:limit]
+
+    next_cursor = None
+    if has_more and rows:
+        last = rows[-1]
+        next_cursor = encode_cursor(last.created_at, last.id)
+
+    return rows, next_cursor
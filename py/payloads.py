@@ -0,0 +1,128 @@
+"""Payload invoice deposit yang ditandatangani (HMAC) dan dijamin unik.
+
+Format: `d1.<telegram_id>.<amount>.<uid>.<sig>`
+
+- uid: id monoton ala snowflake (base36) = milidetik sejak EPOCH, id
+  host, PID proses dan nomor urut per milidetik. Dua payload dari proses
+  yang berjalan bersamaan tidak mungkin sama, jadi insert ke kolom unik
+  `payload` tidak pernah bentrok.
+- sig: HMAC-SHA256 (dipotong 16 byte, base64url) atas bagian sebelumnya
+  dengan PAYLOAD_SECRET (fallback BOT_TOKEN).
+
+Pre-checkout memverifikasi tanda tangan, pemilik, jumlah dan umur invoice
+dari payload saja sebelum menyentuh database (lihat py/payments.py).
+Payload lama (`deposit:...`) tetap diterima lewat lookup database.
+
+Untuk beberapa host yang memakai database yang sama, set PAYLOAD_HOST_ID
+berbeda di setiap host (0..1023).
+"""
+import base64
+import hashlib
+import hmac
+import os
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timezone
+
+PREFIX = 'd1'
+EPOCH_MS = 1704067200000  # 2024-01-01T00:00:00Z
+HOST_BITS = 10
+PID_BITS = 22
+SEQUENCE_BITS = 12
+WORKER_SHIFT = HOST_BITS + PID_BITS + SEQUENCE_BITS
+SIGNATURE_BYTES = 16
+
+SignedPayload = namedtuple('SignedPayload', 'telegram_id amount uid created_at')
+
+_BASE36 = '0123456789abcdefghijklmnopqrstuvwxyz'
+
+
+def _base36(number):
+    digits = []
+    while True:
+        number, rem = divmod(number, 36)
+        digits.append(_BASE36[rem])
+        if not number:
+            return ''.join(reversed(digits))
+
+
+def _secret():
+    secret = os.getenv('PAYLOAD_SECRET') or os.getenv('BOT_TOKEN')
+    if not secret:
+        raise RuntimeError('PAYLOAD_SECRET / BOT_TOKEN belum di-set')
+    return secret.encode()
+
+
+def _sign(body):
+    digest = hmac.new(_secret(), body.encode(), hashlib.sha256).digest()[:SIGNATURE_BYTES]
+    return base64.urlsafe_b64encode(digest).decode().rstrip('=')
+
+
+class UidGenerator:
+    """Id naik terus: [milidetik][host 10 bit][PID 22 bit][urutan 12 bit]"""
+
+    def __init__(self, host_id=None, pid=None):
+        if host_id is None:
+            host_id = int(os.getenv('PAYLOAD_HOST_ID', 0))
+        self.pid = os.getpid() if pid is None else pid
+        # PID Linux selalu < 2^22, jadi proses yang berjalan bersamaan di satu host tidak pernah bentrok
+        self.worker_id = ((host_id & ((1 << HOST_BITS) - 1)) << PID_BITS) | (self.pid & ((1 << PID_BITS) - 1))
+        self._last_ms = -1
+        self._sequence = 0
+        self._lock = threading.Lock()
+
+    def next(self):
+        with self._lock:
+            # Jam mundur (NTP) tidak boleh membuat id lebih kecil
+            now_ms = max(int(time.time() * 1000) - EPOCH_MS, self._last_ms)
+            if now_ms == self._last_ms:
+                self._sequence = (self._sequence + 1) & ((1 << SEQUENCE_BITS) - 1)
+                if self._sequence == 0:
+                    # 4096 id dalam satu milidetik: pakai milidetik berikutnya
+                    now_ms += 1
+            else:
+                self._sequence = 0
+            self._last_ms = now_ms
+            return (now_ms << WORKER_SHIFT) | (self.worker_id << SEQUENCE_BITS) | self._sequence
+
+
+_uids = None
+_uids_lock = threading.Lock()
+
+
+def _uid_generator():
+    # Dibuat ulang setelah fork (mis. worker gunicorn) supaya memakai PID proses sendiri
+    global _uids
+    if _uids is None or _uids.pid != os.getpid():
+        with _uids_lock:
+            if _uids is None or _uids.pid != os.getpid():
+                _uids = UidGenerator()
+    return _uids
+
+
+def new_payload(telegram_id, amount):
+    """Payload baru untuk invoice deposit `amount` Stars milik `telegram_id`"""
+    body = f"{PREFIX}.{int(telegram_id)}.{int(amount)}.{_base36(_uid_generator().next())}"
+    return f"{body}.{_sign(body)}"
+
+
+def is_signed_payload(payload):
+    return payload.startswith(PREFIX + '.')
+
+
+def verify_payload(payload):
+    """Return SignedPayload jika format dan tanda tangan valid, None jika tidak"""
+    parts = payload.split('.')
+    if len(parts) != 5 or parts[0] != PREFIX:
+        return None
+    body, signature = payload.rsplit('.', 1)
+    if not hmac.compare_digest(signature.encode(), _sign(body).encode()):
+        return None
+    try:
+        telegram_id, amount, uid = int(parts[1]), int(parts[2]), int(parts[3], 36)
+    except ValueError:
+        return None
+    created_ms = (uid >> WORKER_SHIFT) + EPOCH_MS
+    created_at = datetime.fromtimestamp(created_ms / 1000, timezone.utc)
+    return SignedPayload(telegram_id, amount, uid, created_at)
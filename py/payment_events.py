@@ -0,0 +1,321 @@
+"""Menunggu perubahan status transaksi (long-poll /api/wait-transaction).
+
+`PaymentWaiters` adalah registry in-process: endpoint long-poll mendaftar
+lalu tidur sampai `publish` dipanggil. Dengan beberapa worker (py/serve.py,
+`uvicorn --workers`) event hanya muncul di satu proses, jadi registry
+dibungkus `PaymentEventBus` yang meneruskan event ke semua worker:
+
+- Redis (PAYMENT_EVENTS_REDIS_URL, butuh `pip install redis`): `publish`
+  dikirim ke satu channel pub/sub; setiap proses punya satu listener yang
+  membangunkan waiter lokal.
+- Tanpa Redis: satu listener per proses membaca status semua payload yang
+  sedang ditunggu dengan satu query setiap PAYMENT_EVENTS_POLL_SECONDS
+  (default 1), hanya selama ada waiter. Beban DB sebanding jumlah worker,
+  bukan jumlah client yang menunggu.
+
+Listener dijalankan sekali per proses: thread saat subscribe pertama
+(Flask, aman untuk preload + fork), atau task di lifespan (ASGI).
+
+`AsyncPaymentWaiters` / `AsyncPaymentEventBus` adalah versi asyncio untuk
+API mode ASGI (py/gacha_asgi.py); publish dan wait berjalan di event loop
+yang sama.
+"""
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+
+try:
+    import redis
+    import redis.asyncio as aioredis
+except ImportError:
+    redis = aioredis = None
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+REDIS_URL = os.getenv('PAYMENT_EVENTS_REDIS_URL')
+CHANNEL = os.getenv('PAYMENT_EVENTS_CHANNEL', 'gacha:payment-events')
+POLL_INTERVAL = float(os.getenv('PAYMENT_EVENTS_POLL_SECONDS', 1))
+# Jeda sebelum listener Redis mencoba subscribe lagi setelah error
+RETRY_SECONDS = 5
+
+
+class _Entry:
+    __slots__ = ('event', 'data', 'refs')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.data = None
+        self.refs = 0
+
+
+class Subscription:
+    def __init__(self, entry):
+        self._entry = entry
+
+    def wait(self, timeout):
+        """Tunggu publish; return data event atau None jika timeout"""
+        if self._entry.event.wait(timeout):
+            return self._entry.data
+        return None
+
+
+class PaymentWaiters:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    @contextmanager
+    def subscribe(self, payload):
+        """Daftar sebelum membaca status, supaya publish tidak terlewat"""
+        with self._lock:
+            entry = self._entries.get(payload)
+            if entry is None:
+                entry = self._entries[payload] = _Entry()
+            entry.refs += 1
+        try:
+            yield Subscription(entry)
+        finally:
+            with self._lock:
+                entry.refs -= 1
+                if entry.refs <= 0 and self._entries.get(payload) is entry:
+                    del self._entries[payload]
+
+    def publish(self, payload, data):
+        """Bangunkan semua waiter untuk payload ini. Return jumlah waiter"""
+        with self._lock:
+            entry = self._entries.get(payload)
+            if entry is None:
+                return 0
+            entry.data = data
+            entry.event.set()
+            return entry.refs
+
+    def payloads(self):
+        """Payload yang sedang ditunggu dan belum mendapat event"""
+        with self._lock:
+            return [payload for payload, entry in self._entries.items() if not entry.event.is_set()]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+class _AsyncSubscription:
+    def __init__(self, entry):
+        self._entry = entry
+
+    async def wait(self, timeout):
+        """Tunggu publish; return data event atau None jika timeout"""
+        try:
+            await asyncio.wait_for(self._entry.event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        return self._entry.data
+
+
+class AsyncPaymentWaiters:
+    def __init__(self):
+        self._entries = {}
+
+    @contextmanager
+    def subscribe(self, payload):
+        entry = self._entries.get(payload)
+        if entry is None:
+            entry = self._entries[payload] = _Entry()
+            entry.event = asyncio.Event()
+        entry.refs += 1
+        try:
+            yield _AsyncSubscription(entry)
+        finally:
+            entry.refs -= 1
+            if entry.refs <= 0 and self._entries.get(payload) is entry:
+                del self._entries[payload]
+
+    def publish(self, payload, data):
+        entry = self._entries.get(payload)
+        if entry is None:
+            return 0
+        entry.data = data
+        entry.event.set()
+        return entry.refs
+
+    def payloads(self):
+        return [payload for payload, entry in self._entries.items() if not entry.event.is_set()]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def _encode(payload, data):
+    return json.dumps({'payload': payload, 'data': data})
+
+
+def _decode(message):
+    event = json.loads(message)
+    return event['payload'], event['data']
+
+
+def _require_redis(redis_url):
+    if redis_url and redis is None:
+        raise ImportError("PAYMENT_EVENTS_REDIS_URL membutuhkan redis (pip install redis)")
+
+
+class PaymentEventBus:
+    """Event status transaksi untuk semua worker (Flask, thread)
+
+    `fetch_finished(payloads)` -> {payload: data} untuk payload yang sudah
+    tidak pending; dipakai listener database jika Redis tidak di-set.
+    """
+
+    def __init__(self, waiters, fetch_finished, redis_url=REDIS_URL, poll_interval=POLL_INTERVAL):
+        _require_redis(redis_url)
+        self.waiters = waiters
+        self.fetch_finished = fetch_finished
+        self.redis_url = redis_url
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._listener_pid = None
+        self._client = None
+        self._client_pid = None
+
+    @contextmanager
+    def subscribe(self, payload):
+        self._ensure_listener()
+        with self.waiters.subscribe(payload) as subscription:
+            yield subscription
+
+    def publish(self, payload, data):
+        """Bangunkan waiter di proses ini dan (lewat Redis) di worker lain"""
+        woken = self.waiters.publish(payload, data)
+        if self.redis_url:
+            try:
+                self._redis().publish(CHANNEL, _encode(payload, data))
+            except redis.RedisError as e:
+                # Worker lain tetap selesai saat timeout long-poll (status dibaca ulang)
+                logger.error(f"Gagal publish event pembayaran ke Redis: {e}")
+        return woken
+
+    def _redis(self):
+        # Client per proses: koneksi milik proses induk tidak dipakai setelah fork
+        if self._client_pid != os.getpid():
+            self._client = redis.Redis.from_url(self.redis_url, socket_timeout=1, socket_connect_timeout=1)
+            self._client_pid = os.getpid()
+        return self._client
+
+    def _ensure_listener(self):
+        pid = os.getpid()
+        if self._listener_pid == pid:
+            return
+        with self._lock:
+            if self._listener_pid == pid:
+                return
+            target = self._listen_redis if self.redis_url else self._poll_database
+            threading.Thread(target=target, name='payment-events', daemon=True).start()
+            self._listener_pid = pid
+
+    def _listen_redis(self):
+        client = redis.Redis.from_url(self.redis_url, socket_connect_timeout=1, health_check_interval=30)
+        while True:
+            pubsub = client.pubsub(ignore_subscribe_messages=True)
+            try:
+                pubsub.subscribe(CHANNEL)
+                for message in pubsub.listen():
+                    self._deliver(message['data'])
+            except Exception as e:
+                logger.error(f"Listener event pembayaran Redis error: {e}")
+                time.sleep(RETRY_SECONDS)
+            finally:
+                pubsub.close()
+
+    def _deliver(self, message):
+        try:
+            payload, data = _decode(message)
+        except (ValueError, KeyError, TypeError):
+            logger.warning(f"Event pembayaran tidak valid: {message!r}")
+            return
+        self.waiters.publish(payload, data)
+
+    def _poll_database(self):
+        while True:
+            time.sleep(self.poll_interval)
+            payloads = self.waiters.payloads()
+            if not payloads:
+                continue
+            try:
+                finished = self.fetch_finished(payloads)
+            except Exception as e:
+                logger.error(f"Gagal membaca status transaksi untuk long-poll: {e}")
+                continue
+            for payload, data in finished.items():
+                self.waiters.publish(payload, data)
+
+
+class AsyncPaymentEventBus(PaymentEventBus):
+    """Versi asyncio: `fetch_finished` berupa coroutine, listener dijalankan dengan `run()`"""
+
+    def __init__(self, waiters, fetch_finished, redis_url=REDIS_URL, poll_interval=POLL_INTERVAL):
+        super().__init__(waiters, fetch_finished, redis_url, poll_interval)
+        self._async_client = aioredis.from_url(self.redis_url) if self.redis_url else None
+
+    def subscribe(self, payload):
+        # Listener berjalan sebagai task lifespan, bukan thread
+        return self.waiters.subscribe(payload)
+
+    async def publish(self, payload, data):
+        woken = self.waiters.publish(payload, data)
+        if self._async_client is not None:
+            try:
+                await self._async_client.publish(CHANNEL, _encode(payload, data))
+            except redis.RedisError as e:
+                logger.error(f"Gagal publish event pembayaran ke Redis: {e}")
+        return woken
+
+    async def run(self):
+        if self._async_client is not None:
+            await self._listen_redis_async()
+        else:
+            await self._poll_database_async()
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.aclose()
+
+    async def _listen_redis_async(self):
+        while True:
+            pubsub = self._async_client.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(CHANNEL)
+                async for message in pubsub.listen():
+                    self._deliver(message['data'])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Listener event pembayaran Redis error: {e}")
+                await asyncio.sleep(RETRY_SECONDS)
+            finally:
+                await pubsub.reset()
+
+    async def _poll_database_async(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            payloads = self.waiters.payloads()
+            if not payloads:
+                continue
+            try:
+                finished = await self.fetch_finished(payloads)
+            except Exception as e:
+                logger.error(f"Gagal membaca status transaksi untuk long-poll: {e}")
+                continue
+            for payload, data in finished.items():
+                self.waiters.publish(payload, data)
+
+
+waiters = PaymentWaiters()
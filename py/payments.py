@@ -0,0 +1,98 @@
+"""Logika pembayaran yang dipakai bersama oleh bot MTProto (b.py) dan
+webhook Bot API (/api/webhook/telegram di py/gacha.py).
+
+Settlement ada di py/settlement.py; modul ini berisi validasi
+pre-checkout dan pesan konfirmasi deposit, supaya kedua jalur masuk
+pembayaran berperilaku sama.
+"""
+from html import escape
+
+from sqlalchemy import DateTime, text
+
+try:
+    from py.sweeper import is_expired, PENDING_TTL
+    from py.payloads import is_signed_payload, verify_payload
+except ImportError:
+    from sweeper import is_expired, PENDING_TTL
+    from payloads import is_signed_payload, verify_payload
+
+# Payload bertanda tangan: pemilik & jumlah sudah terverifikasi, cukup cek status
+_STATUS_SQL = text("SELECT status FROM transactions WHERE payload = :payload")
+
+# Payload lama: status transaksi + pemilik invoice dalam satu query
+_PRECHECKOUT_SQL = text(
+    "SELECT t.status, t.amount, t.created_at, u.telegram_id "
+    "FROM transactions t JOIN users u ON u.id = t.user_id "
+    "WHERE t.payload = :payload"
+).columns(created_at=DateTime())
+
+
+def check_precheckout(db, payload, telegram_id, currency, total_amount, now):
+    """Validasi pre-checkout, return pesan error atau None jika valid"""
+    if is_signed_payload(payload):
+        return _check_signed(db, payload, telegram_id, currency, total_amount, now)
+
+    row = db.execute(_PRECHECKOUT_SQL, {'payload': payload}).first()
+
+    if not row:
+        return "Transaksi tidak valid"
+
+    if row.status == 'expired' or (row.status == 'pending' and is_expired(row.created_at, now)):
+        return "Invoice sudah kedaluwarsa, silakan buat deposit baru"
+
+    if row.status != 'pending':
+        return "Transaksi tidak valid"
+
+    if row.telegram_id != telegram_id:
+        return "User tidak sesuai"
+
+    if currency != 'XTR' or total_amount != row.amount:
+        return "Jumlah tidak sesuai"
+
+    return None
+
+
+def _check_signed(db, payload, telegram_id, currency, total_amount, now):
+    # Payload palsu/diubah, user atau jumlah salah ditolak tanpa query database
+    signed = verify_payload(payload)
+    if signed is None:
+        return "Transaksi tidak valid"
+
+    if signed.telegram_id != telegram_id:
+        return "User tidak sesuai"
+
+    if currency != 'XTR' or total_amount != signed.amount:
+        return "Jumlah tidak sesuai"
+
+    if signed.created_at < now - PENDING_TTL:
+        return "Invoice sudah kedaluwarsa, silakan buat deposit baru"
+
+    status = db.execute(_STATUS_SQL, {'payload': payload}).scalar()
+    if status == 'expired':
+        return "Invoice sudah kedaluwarsa, silakan buat deposit baru"
+
+    if status != 'pending':
+        return "Transaksi tidak valid"
+
+    return None
+
+
+def refund_message(charge_id):
+    """Notifikasi refund ke user (parse mode HTML)"""
+    return (
+        f"🔄 <b>Deposit Dikembalikan (Refund)</b>\n\n"
+        f"ID Transaksi: <code>{escape(charge_id)}</code>\n\n"
+        f"Stars telah dikembalikan ke akun Anda."
+    )
+
+
+def deposit_success_message(amount, charge_id, completed_at):
+    """Pesan konfirmasi deposit (parse mode HTML)"""
+    waktu = completed_at.strftime('%d/%m/%Y %H:%M:%S')
+    return (
+        f"✅ <b>DEPOSIT BERHASIL!</b>\n\n"
+        f"💰 <b>Jumlah:</b> {amount} ⭐\n"
+        f"🆔 <b>Transaksi:</b> <code>{escape(charge_id)}</code>\n"
+        f"📅 <b>Waktu:</b> {waktu}\n\n"
+        f"Terima kasih telah melakukan deposit! 🎉"
+    )
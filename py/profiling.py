@@ -0,0 +1,176 @@
+"""Profiling query SQL per request Flask / per handler bot (opt-in).
+
+Aktif jika SQL_PROFILE=1. Listener engine SQLAlchemy mencatat durasi
+setiap statement ke profil yang sedang aktif (contextvar), lalu di akhir
+request/handler:
+
+- jumlah statement dan total waktu query dicatat,
+- statement dengan SQL yang sama yang dijalankan berulang kali ditandai
+  (indikasi N+1),
+- request yang lambat atau berpola N+1 ditulis ke log, dan N request
+  terlambat disimpan untuk /api/admin/profile.
+
+Pengaturan: SQL_PROFILE_SLOW_MS (default 200), SQL_PROFILE_REPEAT
+(default 3, ambang N+1), SQL_PROFILE_KEEP (default 20).
+"""
+import contextvars
+import heapq
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.getenv('SQL_PROFILE', '').lower() in ('1', 'true', 'yes')
+SLOW_MS = float(os.getenv('SQL_PROFILE_SLOW_MS', 200))
+REPEAT_THRESHOLD = int(os.getenv('SQL_PROFILE_REPEAT', 3))
+KEEP = int(os.getenv('SQL_PROFILE_KEEP', 20))
+
+_current = contextvars.ContextVar('sql_profile', default=None)
+
+
+def _short_sql(statement, limit=300):
+    statement = ' '.join(statement.split())
+    return statement if len(statement) <= limit else statement[:limit] + '...'
+
+
+class QueryProfile:
+    def __init__(self, name):
+        self.name = name
+        self.started = time.perf_counter()
+        self.elapsed = None
+        self.queries = []  # (sql, durasi detik)
+        self._lock = threading.Lock()
+
+    def add(self, statement, duration):
+        with self._lock:
+            self.queries.append((statement, duration))
+
+    def finish(self):
+        self.elapsed = time.perf_counter() - self.started
+
+    def repeated(self):
+        """Statement yang sama (tanpa melihat parameter) >= REPEAT_THRESHOLD kali"""
+        counts = Counter(statement for statement, _ in self.queries)
+        return {statement: count for statement, count in counts.items() if count >= REPEAT_THRESHOLD}
+
+    def summary(self):
+        with self._lock:
+            queries = list(self.queries)
+        query_time = sum(duration for _, duration in queries)
+        return {
+            'name': self.name,
+            'elapsed_ms': round((self.elapsed or 0) * 1000, 2),
+            'query_count': len(queries),
+            'query_ms': round(query_time * 1000, 2),
+            'repeated': [
+                {'sql': _short_sql(statement), 'count': count}
+                for statement, count in self.repeated().items()
+            ],
+            'queries': [
+                {'sql': _short_sql(statement), 'ms': round(duration * 1000, 3)}
+                for statement, duration in queries
+            ],
+        }
+
+
+class SlowLog:
+    """Simpan `keep` profil dengan waktu total terlama"""
+
+    def __init__(self, keep=KEEP):
+        self.keep = keep
+        self._heap = []
+        self._counter = 0
+        self._lock = threading.Lock()
+
+    def add(self, profile):
+        with self._lock:
+            self._counter += 1
+            entry = (profile.elapsed, self._counter, profile.summary())
+            if len(self._heap) < self.keep:
+                heapq.heappush(self._heap, entry)
+            elif entry[0] > self._heap[0][0]:
+                heapq.heapreplace(self._heap, entry)
+
+    def slowest(self):
+        with self._lock:
+            return [summary for _, _, summary in sorted(self._heap, reverse=True)]
+
+    def clear(self):
+        with self._lock:
+            self._heap.clear()
+
+
+slow_log = SlowLog()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault('sql_profile_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _current.get()
+    starts = conn.info.get('sql_profile_start')
+    if profile is not None and starts:
+        profile.add(statement, time.perf_counter() - starts.pop())
+
+
+def install(engine):
+    """Pasang listener di engine (tidak melakukan apa-apa jika profiling mati)"""
+    if not ENABLED:
+        return
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+    logger.info(f"SQL profiling aktif (slow {SLOW_MS} ms, N+1 >= {REPEAT_THRESHOLD}x)")
+
+
+def start(name):
+    """Mulai profil untuk request/handler; return token untuk `stop`"""
+    if not ENABLED:
+        return None
+    profile = QueryProfile(name)
+    return profile, _current.set(profile)
+
+
+def stop(token):
+    if token is None:
+        return
+    profile, var_token = token
+    try:
+        _current.reset(var_token)
+    except ValueError:
+        # Dipanggil dari context berbeda (mis. teardown di thread lain)
+        _current.set(None)
+    profile.finish()
+    _report(profile)
+
+
+@contextmanager
+def profiled(name):
+    """`start`/`stop` sebagai context manager (handler bot, middleware ASGI)"""
+    token = start(name)
+    try:
+        yield
+    finally:
+        stop(token)
+
+
+def _report(profile):
+    if not profile.queries:
+        return
+    slow_log.add(profile)
+    repeated = profile.repeated()
+    elapsed_ms = profile.elapsed * 1000
+    if elapsed_ms >= SLOW_MS or repeated:
+        summary = profile.summary()
+        message = (f"[sql-profile] {profile.name}: {elapsed_ms:.1f} ms, "
+                   f"{summary['query_count']} query ({summary['query_ms']} ms)")
+        for item in summary['repeated']:
+            message += f"\n  N+1? {item['count']}x {item['sql']}"
+        logger.warning(message)
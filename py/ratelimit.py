@@ -0,0 +1,247 @@
+"""Rate limit token bucket untuk endpoint API yang mahal.
+
+Setiap route punya budget per scope `ip` (alamat client). Satu request
+mengambil satu token dari setiap bucket yang berlaku; jika salah satu
+kosong, request ditolak dengan 429 + header Retry-After sebelum menyentuh
+database atau Bot API. Tidak ada bucket per user: telegram_id di request
+dikirim client tanpa validasi initData, jadi siapa pun bisa menghabiskan
+budget user lain.
+
+Backend:
+
+- memory (default): bucket di proses ini; dengan beberapa worker budget
+  efektif menjadi budget x jumlah worker.
+- Redis (RATE_LIMIT_REDIS_URL, butuh `pip install redis`): bucket dibagi
+  semua worker/proses lewat satu script Lua atomik. Jika Redis tidak bisa
+  dihubungi, limiter fallback ke memory (fail-open per proses) dan mencatat
+  error ke log.
+
+Budget ditulis "N/S" = burst N request, terisi ulang N token per S detik.
+Default ada di RULES; ubah per route/scope lewat env, mis.
+RATE_LIMIT_DEPOSIT_IP=10/60, atau "0" untuk mematikan satu bucket.
+RATE_LIMIT_ENABLED=0 mematikan semuanya.
+
+IP client: jika peer adalah loopback (cloudflared / reverse proxy di host
+yang sama), header CF-Connecting-IP lalu X-Forwarded-For dipercaya; tanpa
+ini semua client terlihat sebagai 127.0.0.1 dan berbagi satu bucket. Jika
+proxy ada di host lain, set RATE_LIMIT_PROXY_HOPS ke jumlah proxy
+tepercaya di depan API.
+"""
+import ipaddress
+import logging
+import math
+import os
+import threading
+import time
+from collections import namedtuple
+
+from dotenv import load_dotenv
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+try:
+    from py import metrics
+except ImportError:
+    import metrics
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.getenv('RATE_LIMIT_ENABLED', '1').lower() not in ('0', 'false', 'no')
+REDIS_URL = os.getenv('RATE_LIMIT_REDIS_URL')
+PROXY_HOPS = int(os.getenv('RATE_LIMIT_PROXY_HOPS', 0))
+MAX_BUCKETS = int(os.getenv('RATE_LIMIT_MAX_BUCKETS', 100000))
+# Jeda sebelum mencoba Redis lagi setelah error
+REDIS_RETRY_SECONDS = 5
+
+Rule = namedtuple('Rule', 'capacity rate')  # rate = token per detik
+
+# Budget default per route & scope. Mini App normal: invoice sesekali,
+# cek status tiap 3 detik atau long-poll 25 detik.
+RULES = {
+    'deposit': {'ip': '20/60'},
+    'check': {'ip': '120/60'},
+    'wait': {'ip': '60/60'},
+    'auth': {'ip': '60/60'},
+    'read': {'ip': '300/60'},
+}
+
+RATE_LIMITED = metrics.registry.counter(
+    'gacha_rate_limited_total', 'Request yang ditolak rate limit', ('route', 'scope')
+)
+
+
+def parse_rule(spec):
+    """"N/S" -> Rule(N, N/S); "0" atau kosong -> None (tanpa limit)"""
+    if not spec or spec.strip() == '0':
+        return None
+    count, _, seconds = spec.partition('/')
+    count, seconds = float(count), float(seconds or 1)
+    return Rule(count, count / seconds)
+
+
+def load_rules(defaults=RULES):
+    rules = {}
+    for route, scopes in defaults.items():
+        for scope, spec in scopes.items():
+            env = f"RATE_LIMIT_{route.upper()}_{scope.upper()}"
+            rule = parse_rule(os.getenv(env, spec))
+            if rule:
+                rules[(route, scope)] = rule
+    return rules
+
+
+def is_loopback(address):
+    try:
+        return ipaddress.ip_address(address).is_loopback
+    except ValueError:
+        return False
+
+
+def client_ip(remote_addr, forwarded_for=None, connecting_ip=None, proxy_hops=PROXY_HOPS):
+    """IP client; header proxy hanya dipercaya dari peer loopback atau jika `proxy_hops` > 0
+
+    CF-Connecting-IP (`connecting_ip`) dipakai lebih dulu; X-Forwarded-For
+    diambil sejauh `proxy_hops` (minimal 1) dari kanan.
+    """
+    if not (proxy_hops or is_loopback(remote_addr or '')):
+        return remote_addr or 'unknown'
+    if connecting_ip and connecting_ip.strip():
+        return connecting_ip.strip()
+    if forwarded_for:
+        chain = [part.strip() for part in forwarded_for.split(',') if part.strip()]
+        if chain:
+            return chain[-min(max(proxy_hops, 1), len(chain))]
+    return remote_addr or 'unknown'
+
+
+class MemoryBackend:
+    """Token bucket in-process (thread-safe)"""
+
+    def __init__(self, max_buckets=MAX_BUCKETS, clock=time.monotonic):
+        self.max_buckets = max_buckets
+        self.clock = clock
+        self._buckets = {}  # key -> [tokens, updated]
+        self._lock = threading.Lock()
+
+    def take(self, key, rule):
+        """Ambil satu token; return 0 jika boleh, atau detik sampai token berikutnya"""
+        now = self.clock()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= self.max_buckets:
+                    self._prune(now)
+                bucket = self._buckets[key] = [rule.capacity, now]
+            else:
+                bucket[0] = min(rule.capacity, bucket[0] + (now - bucket[1]) * rule.rate)
+                bucket[1] = now
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return 0
+            return (1 - bucket[0]) / rule.rate
+
+    def _prune(self, now):
+        # Bucket yang diam cukup lama sudah penuh lagi: aman dibuang.
+        # Jika masih terlalu banyak (banyak IP berbeda), buang yang paling lama diam
+        idle = [key for key, (_, updated) in self._buckets.items() if now - updated > 600]
+        for key in idle:
+            del self._buckets[key]
+        if len(self._buckets) >= self.max_buckets:
+            oldest = sorted(self._buckets, key=lambda key: self._buckets[key][1])
+            for key in oldest[:len(oldest) // 2]:
+                del self._buckets[key]
+
+
+# KEYS[1] = bucket; ARGV = kapasitas, token/detik, waktu sekarang (detik)
+_TAKE_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1])
+local updated = tonumber(state[2])
+if tokens == nil then
+    tokens = capacity
+else
+    tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+end
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000) + 1000)
+return tostring(wait)
+"""
+
+
+class RedisBackend:
+    """Token bucket di Redis, dibagi semua worker; fallback ke memory jika Redis error"""
+
+    def __init__(self, url, prefix='gacha:rl:', fallback=None):
+        if redis is None:
+            raise ImportError("RATE_LIMIT_REDIS_URL membutuhkan redis (pip install redis)")
+        self.client = redis.Redis.from_url(url, socket_timeout=0.2, socket_connect_timeout=0.2)
+        self.prefix = prefix
+        self.fallback = fallback or MemoryBackend()
+        self._script = self.client.register_script(_TAKE_SCRIPT)
+        self._error_logged_at = 0.0
+        self._down_until = 0.0
+
+    def take(self, key, rule):
+        # Setelah error, Redis dilewati sebentar supaya request tidak menunggu timeout satu per satu
+        if time.monotonic() < self._down_until:
+            return self.fallback.take(key, rule)
+        try:
+            return float(self._script(keys=[self.prefix + key], args=[rule.capacity, rule.rate, time.time()]))
+        except redis.RedisError as e:
+            now = time.monotonic()
+            self._down_until = now + REDIS_RETRY_SECONDS
+            if now - self._error_logged_at > 60:
+                self._error_logged_at = now
+                logger.error(f"Rate limit Redis error, fallback ke memory: {e}")
+            return self.fallback.take(key, rule)
+
+
+class RateLimiter:
+    def __init__(self, backend=None, rules=None, enabled=ENABLED):
+        self.backend = backend or MemoryBackend()
+        self.rules = load_rules() if rules is None else rules
+        self.enabled = enabled
+
+    @property
+    def blocking(self):
+        """True jika `hit` melakukan I/O jaringan (jalankan di thread dari event loop)"""
+        return isinstance(self.backend, RedisBackend)
+
+    def hit(self, route, **keys):
+        """Catat satu request. Return None jika boleh, atau Retry-After (detik, int)"""
+        if not self.enabled:
+            return None
+        wait = 0
+        for scope, value in keys.items():
+            rule = self.rules.get((route, scope))
+            if rule is None or value is None:
+                continue
+            scope_wait = self.backend.take(f"{route}:{scope}:{value}", rule)
+            if scope_wait > 0:
+                RATE_LIMITED.inc(route=route, scope=scope)
+                wait = max(wait, scope_wait)
+        return max(1, math.ceil(wait)) if wait else None
+
+
+def create_limiter():
+    """Limiter sesuai env (Redis jika RATE_LIMIT_REDIS_URL di-set)"""
+    backend = RedisBackend(REDIS_URL) if REDIS_URL else MemoryBackend()
+    return RateLimiter(backend)
+
+
+def limited_body(retry_after):
+    return {'success': False, 'error': 'too many requests', 'retry_after': retry_after}
@@ -0,0 +1,316 @@
+"""Refund Stars massal untuk admin bot (b.py: /refund, /refundbulk).
+
+- `parse_charge_list`: daftar charge id dari teks / file (satu per baris,
+  atau `<user_id> <charge_id>` untuk charge yang tidak ada di database).
+- `resolve_charges`: pemilik (telegram_id) dan jumlah setiap charge dari
+  tabel transaksi + arsip dalam beberapa query.
+- `RefundSessions`: batch yang menunggu konfirmasi, disimpan per admin dan
+  per batch id, kedaluwarsa setelah REFUND_CONFIRM_TTL detik. Dua admin
+  atau dua batch tidak saling menimpa.
+- `RefundRunner`: menjalankan panggilan refund dengan konkurensi terbatas
+  (REFUND_CONCURRENCY). FloodWait menahan semua worker, error sementara
+  dicoba ulang, dan hasilnya dicatat ke database per REFUND_COMMIT_EVERY
+  refund dalam satu commit (`mark_refunded`). Progres dilaporkan lewat
+  callback setiap REFUND_PROGRESS_INTERVAL detik.
+
+Fungsi refund (panggilan MTProto) diberikan oleh b.py dan melempar
+RetryAfter / PermanentError dari py/outbox.py, sama seperti pengirim
+outbox.
+"""
+import asyncio
+import logging
+import os
+import re
+import secrets
+import time
+from collections import namedtuple
+
+from sqlalchemy import select
+
+try:
+    from py.models import ArchivedTransaction, Transaction, User
+    from py.outbox import PermanentError, RetryAfter, enqueue
+    from py.payments import refund_message
+    from py.stats import bump
+    from py.users import touch_users
+except ImportError:
+    from models import ArchivedTransaction, Transaction, User
+    from outbox import PermanentError, RetryAfter, enqueue
+    from payments import refund_message
+    from stats import bump
+    from users import touch_users
+
+logger = logging.getLogger(__name__)
+
+CONCURRENCY = int(os.getenv('REFUND_CONCURRENCY', 4))
+COMMIT_EVERY = int(os.getenv('REFUND_COMMIT_EVERY', 20))
+PROGRESS_INTERVAL = float(os.getenv('REFUND_PROGRESS_INTERVAL', 3))
+MAX_ATTEMPTS = int(os.getenv('REFUND_MAX_ATTEMPTS', 3))
+MAX_BATCH = int(os.getenv('REFUND_MAX_BATCH', 1000))
+CONFIRM_TTL = float(os.getenv('REFUND_CONFIRM_TTL', 600))
+
+# Batas jumlah parameter IN per query (aman untuk SQLite)
+_CHUNK = 500
+_CHARGE_RE = re.compile(r'^[A-Za-z0-9_\-]{8,}$')
+
+RefundItem = namedtuple('RefundItem', 'charge_id telegram_id amount')
+
+
+def parse_charge_list(text):
+    """Teks -> (daftar (telegram_id|None, charge_id) tanpa duplikat, token yang tidak valid)"""
+    entries, invalid, seen = [], [], set()
+    for line in text.splitlines():
+        tokens = line.replace(',', ' ').split()
+        if not tokens or tokens[0].startswith('/'):
+            # Baris kosong atau baris perintah (/refundbulk)
+            tokens = tokens[1:]
+        if len(tokens) == 2 and tokens[0].isdigit() and _CHARGE_RE.match(tokens[1]):
+            pairs = [(int(tokens[0]), tokens[1])]
+        else:
+            pairs = [(None, token) for token in tokens]
+        for telegram_id, charge_id in pairs:
+            if not _CHARGE_RE.match(charge_id):
+                invalid.append(charge_id)
+            elif charge_id not in seen:
+                seen.add(charge_id)
+                entries.append((telegram_id, charge_id))
+    return entries, invalid
+
+
+def resolve_charges(db, entries):
+    """(telegram_id|None, charge_id) -> (RefundItem yang siap, charge id yang tidak dikenal)
+
+    Pemilik dari database selalu dipakai; user_id dari admin hanya untuk
+    charge yang tidak ada di database.
+    """
+    charge_ids = [charge_id for _, charge_id in entries]
+    known = {}
+    for model in (Transaction, ArchivedTransaction):
+        missing = [charge_id for charge_id in charge_ids if charge_id not in known]
+        for start in range(0, len(missing), _CHUNK):
+            rows = db.execute(
+                select(model.charge_id, User.telegram_id, model.amount)
+                .join(User, User.id == model.user_id)
+                .where(model.charge_id.in_(missing[start:start + _CHUNK]))
+            ).all()
+            known.update({row.charge_id: (row.telegram_id, row.amount) for row in rows})
+    db.rollback()
+
+    items, unknown = [], []
+    for telegram_id, charge_id in entries:
+        if charge_id in known:
+            owner, amount = known[charge_id]
+            items.append(RefundItem(charge_id, owner, amount))
+        elif telegram_id is not None:
+            items.append(RefundItem(charge_id, telegram_id, None))
+        else:
+            unknown.append(charge_id)
+    return items, unknown
+
+
+def mark_refunded(db, refunds, now):
+    """Catat refund yang sudah diproses Telegram dalam satu commit.
+
+    `refunds`: list (charge_id, telegram_id, notify). Transaksi (hot atau
+    arsip) yang belum 'refunded' ditandai dan counter disesuaikan; jika
+    notify, notifikasi refund diantrikan ke outbox user.
+    """
+    charge_ids = [charge_id for charge_id, _, _ in refunds]
+    found = {}
+    for model in (Transaction, ArchivedTransaction):
+        missing = [charge_id for charge_id in charge_ids if charge_id not in found]
+        for start in range(0, len(missing), _CHUNK):
+            chunk = missing[start:start + _CHUNK]
+            for transaction in db.query(model).filter(model.charge_id.in_(chunk)):
+                found[transaction.charge_id] = transaction
+
+    completed_count = completed_amount = refunded_count = 0
+    user_ids = set()
+    for charge_id, telegram_id, notify in refunds:
+        transaction = found.get(charge_id)
+        if transaction and transaction.status != 'refunded':
+            if transaction.status == 'completed':
+                completed_count += 1
+                completed_amount += transaction.amount
+            refunded_count += 1
+            transaction.status = 'refunded'
+            transaction.refunded_at = now
+            user_ids.add(transaction.user_id)
+        if notify:
+            enqueue(db, telegram_id, refund_message(charge_id), now)
+
+    bump(db, completed_count=-completed_count, completed_amount=-completed_amount,
+         refunded_count=refunded_count)
+    touch_users(db, *user_ids)
+    db.commit()
+
+
+class RefundBatch:
+    def __init__(self, admin_id, chat_id, items, unknown=()):
+        self.id = secrets.token_hex(4)
+        self.admin_id = admin_id
+        self.chat_id = chat_id
+        self.items = list(items)
+        self.unknown = list(unknown)
+        self.created = time.monotonic()
+        self.message_id = None
+
+    @property
+    def total_amount(self):
+        return sum(item.amount or 0 for item in self.items)
+
+
+class RefundSessions:
+    """Batch menunggu konfirmasi: {admin_id: {batch_id: RefundBatch}}"""
+
+    def __init__(self, ttl=CONFIRM_TTL):
+        self.ttl = ttl
+        self._batches = {}
+
+    def add(self, batch):
+        self._expire()
+        self._batches.setdefault(batch.admin_id, {})[batch.id] = batch
+        return batch
+
+    def pop(self, admin_id, batch_id):
+        """Ambil batch milik admin (sekali saja); None jika tidak ada/kedaluwarsa"""
+        self._expire()
+        batches = self._batches.get(admin_id, {})
+        batch = batches.pop(batch_id, None)
+        if not batches:
+            self._batches.pop(admin_id, None)
+        return batch
+
+    def _expire(self):
+        cutoff = time.monotonic() - self.ttl
+        for admin_id in list(self._batches):
+            batches = self._batches[admin_id]
+            for batch_id in [key for key, batch in batches.items() if batch.created < cutoff]:
+                del batches[batch_id]
+            if not batches:
+                del self._batches[admin_id]
+
+    def __len__(self):
+        return sum(len(batches) for batches in self._batches.values())
+
+
+class RefundReport:
+    def __init__(self, total):
+        self.total = total
+        self.refunded = 0
+        self.already = 0
+        self.failed = []  # (charge_id, error)
+        self.unrecorded = 0  # refund sukses yang gagal dicatat ke database
+        self.started = time.monotonic()
+
+    @property
+    def done(self):
+        return self.refunded + self.already + len(self.failed)
+
+
+def is_already_refunded(error):
+    return 'CHARGE_ALREADY_REFUNDED' in str(error)
+
+
+class RefundRunner:
+    """Jalankan `refund(item)` untuk setiap item dengan konkurensi terbatas.
+
+    Satu runner dipakai bersama oleh semua batch: jeda FloodWait dan batas
+    konkurensi berlaku untuk bot, bukan per batch.
+    """
+
+    def __init__(self, adb, refund, clock, concurrency=CONCURRENCY, commit_every=COMMIT_EVERY,
+                 max_attempts=MAX_ATTEMPTS):
+        self.adb = adb
+        self.refund = refund
+        self.clock = clock
+        self.commit_every = commit_every
+        self.max_attempts = max_attempts
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._paused_until = 0.0
+
+    async def run(self, items, on_progress=None, progress_interval=PROGRESS_INTERVAL):
+        report = RefundReport(len(items))
+        pending = []  # refund yang belum dicatat ke database
+
+        async def worker(item):
+            async with self._semaphore:
+                await self._process(item, report, pending)
+
+        progress_task = None
+        if on_progress:
+            progress_task = asyncio.create_task(self._report_progress(report, on_progress, progress_interval))
+        try:
+            await asyncio.gather(*(worker(item) for item in items))
+        finally:
+            if progress_task:
+                progress_task.cancel()
+            await self._flush(report, pending)
+        return report
+
+    async def _process(self, item, report, pending):
+        attempts = floods = 0
+        while True:
+            await self._wait_pause()
+            try:
+                await self.refund(item)
+                report.refunded += 1
+                await self._record(item, True, report, pending)
+                return
+            except RetryAfter as e:
+                # FloodWait berlaku untuk bot: semua worker berhenti, item ini dicoba lagi
+                floods += 1
+                if floods > self.max_attempts * 3:
+                    report.failed.append((item.charge_id, f"FloodWait berulang ({e.seconds}s)"))
+                    return
+                pause_until = asyncio.get_running_loop().time() + e.seconds
+                self._paused_until = max(self._paused_until, pause_until)
+                logger.warning(f"Refund FloodWait {e.seconds}s")
+            except PermanentError as e:
+                if is_already_refunded(e):
+                    report.already += 1
+                    await self._record(item, False, report, pending)
+                else:
+                    report.failed.append((item.charge_id, str(e)))
+                return
+            except Exception as e:
+                attempts += 1
+                if attempts >= self.max_attempts:
+                    logger.error(f"Refund {item.charge_id} gagal setelah {attempts} percobaan: {e}")
+                    report.failed.append((item.charge_id, str(e)))
+                    return
+                await asyncio.sleep(2 ** attempts)
+
+    async def _wait_pause(self):
+        loop = asyncio.get_running_loop()
+        while loop.time() < self._paused_until:
+            await asyncio.sleep(self._paused_until - loop.time())
+
+    async def _record(self, item, notify, report, pending):
+        pending.append((item.charge_id, item.telegram_id, notify))
+        if len(pending) >= self.commit_every:
+            await self._flush(report, pending)
+
+    async def _flush(self, report, pending):
+        chunk = pending[:]
+        pending.clear()
+        if not chunk:
+            return
+        try:
+            await self.adb.run(mark_refunded, chunk, self.clock())
+        except Exception as e:
+            # Refund di Telegram sudah terjadi: laporkan supaya admin bisa mencatat ulang
+            report.unrecorded += len(chunk)
+            logger.error(f"Gagal mencatat {len(chunk)} refund ke database: {e} "
+                         f"({', '.join(charge_id for charge_id, _, _ in chunk)})")
+
+    async def _report_progress(self, report, on_progress, interval):
+        last = None
+        while True:
+            await asyncio.sleep(interval)
+            if report.done != last:
+                last = report.done
+                try:
+                    await on_progress(report)
+                except Exception as e:
+                    logger.warning(f"Gagal update progres refund: {e}")
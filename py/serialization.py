@@ -0,0 +1,39 @@
+"""Jalur JSON cepat untuk endpoint yang mengembalikan banyak baris.
+
+Baris diambil sebagai tuple kolom (tanpa objek ORM), lalu di-encode
+langsung dengan orjson jika terpasang. orjson menulis datetime dalam format
+ISO yang sama dengan `isoformat()`, jadi timestamp tidak perlu diformat satu
+per satu di Python. Tanpa orjson, fallback ke modul json standar.
+"""
+import json
+from datetime import date, datetime
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(obj):
+    """Encode ke JSON (bytes)"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, default=_default, separators=(',', ':')).encode()
+
+
+def json_response(obj, status=200):
+    """Pengganti jsonify untuk response besar"""
+    # Import lokal: dumps juga dipakai API ASGI yang tidak memuat Flask
+    from flask import Response
+    return Response(dumps(obj), status=status, mimetype='application/json')
+
+
+def rows_to_dicts(rows, fields):
+    """Tuple kolom -> dict dengan key `fields` (datetime dibiarkan, di-encode oleh dumps)"""
+    return [dict(zip(fields, row)) for row in rows]
@@ -0,0 +1,110 @@
+"""Server production multi-proses untuk API Flask (py/gacha.py) di atas gunicorn.
+
+    pip install gunicorn
+    python py/models.py migrate     # sekali per deploy
+    python py/serve.py              # atau: python py/gacha.py
+
+- Prefork: master memuat app sekali (preload), lalu fork GUNICORN_WORKERS
+  worker (default 2 x core + 1). Setiap worker memakai worker gthread dengan GUNICORN_THREADS thread, karena long-poll
+  /api/wait-transaction menahan satu thread sampai LONGPOLL_TIMEOUT.
+- Pool koneksi DB per worker: engine dibuat saat pertama dipakai
+  (py/models.py), dan `post_fork` membuang pool warisan master jika ada,
+  supaya koneksi SQLite / PostgreSQL tidak dipakai bersama lintas proses.
+  Client Bot API dan generator payload dibuat ulang otomatis per PID.
+- Worker didaur ulang setelah GUNICORN_MAX_REQUESTS request (+ jitter)
+  untuk membatasi pertumbuhan memori.
+- Reload graceful: `kill -HUP <pid master>` mengganti worker satu per satu
+  tanpa memutus request yang sedang berjalan (konfigurasi dibaca ulang; kode
+  yang di-preload tidak). Untuk deploy kode baru: `kill -USR2 <pid master>`
+  lalu `kill -QUIT <pid master lama>` (PID tersimpan di GUNICORN_PIDFILE).
+
+Catatan: metrics (/metrics) bersifat per worker. Event pembayaran untuk
+long-poll diteruskan ke semua worker oleh py/payment_events.py (Redis
+pub/sub, atau satu thread per worker yang membaca status dari database).
+Setiap long-poll tetap memegang satu thread gthread sampai selesai; mode
+ASGI (py/gacha_asgi.py, `uvicorn --workers`) menunggu tanpa thread.
+"""
+import multiprocessing
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+try:
+    from gunicorn.app.base import BaseApplication
+except ImportError:
+    BaseApplication = None
+
+try:
+    from py.models import dispose_engine_after_fork
+except ImportError:
+    from models import dispose_engine_after_fork
+
+
+def server_options():
+    """Pengaturan gunicorn dari env"""
+    longpoll_timeout = int(os.getenv('LONGPOLL_TIMEOUT', 25))
+    return {
+        'bind': os.getenv('GUNICORN_BIND', f"0.0.0.0:{os.getenv('PORT', 8080)}"),
+        'workers': int(os.getenv('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1)),
+        'worker_class': 'gthread',
+        'threads': int(os.getenv('GUNICORN_THREADS', 16)),
+        'preload_app': True,
+        'max_requests': int(os.getenv('GUNICORN_MAX_REQUESTS', 2000)),
+        'max_requests_jitter': int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 200)),
+        'backlog': int(os.getenv('GUNICORN_BACKLOG', 2048)),
+        'keepalive': int(os.getenv('GUNICORN_KEEPALIVE', 5)),
+        # Worker yang diam lebih lama dari ini dianggap hang; harus di atas LONGPOLL_TIMEOUT
+        'timeout': int(os.getenv('GUNICORN_TIMEOUT', max(60, longpoll_timeout * 2))),
+        'graceful_timeout': int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', longpoll_timeout + 5)),
+        'pidfile': os.getenv('GUNICORN_PIDFILE') or None,
+        'accesslog': os.getenv('GUNICORN_ACCESS_LOG') or None,
+        'errorlog': '-',
+        'loglevel': os.getenv('GUNICORN_LOG_LEVEL', 'info'),
+    }
+
+
+if BaseApplication is not None:
+    class GachaServer(BaseApplication):
+        """Aplikasi gunicorn untuk app Flask yang sudah dimuat"""
+
+        def __init__(self, app, options=None):
+            self.application = app
+            self.options = options or {}
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                if value is not None and key in self.cfg.settings:
+                    self.cfg.set(key, value)
+            self.cfg.set('post_fork', self._post_fork)
+
+        def _post_fork(self, server, worker):
+            # Koneksi di pool master tidak boleh dipakai worker
+            dispose_engine_after_fork()
+
+        def load(self):
+            return self.application
+
+
+def serve(app, **overrides):
+    """Jalankan `app` dengan gunicorn (blocking)"""
+    if BaseApplication is None:
+        raise SystemExit("gunicorn belum terpasang: pip install gunicorn "
+                         "(atau FLASK_DEV_SERVER=1 python py/gacha.py)")
+    options = server_options()
+    options.update(overrides)
+    GachaServer(app, options).run()
+
+
+def main():
+    try:
+        from py.gacha import create_app
+    except ImportError:
+        from gacha import create_app
+    serve(create_app())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""Settlement pembayaran: kredit saldo atomik dan group commit.
+
+`settle_payment` menandai transaksi completed dengan UPDATE bersyarat
+(`status = 'pending'`, atau 'expired'), lalu menambah saldo dengan
+`balance = balance + :amount` di database. Tidak ada read-modify-write di Python, jadi tidak ada kredit
+yang hilang walau pembayaran datang bersamaan, dan update yang sama
+(charge_id dikirim ulang) tidak akan mengkredit dua kali.
+
+`SettlementBatcher` mengumpulkan settlement yang datang berdekatan lalu
+meng-commit-nya sekaligus dalam satu transaksi. Hook `on_settled` berjalan
+di transaksi yang sama (dipakai b.py untuk menulis notifikasi ke outbox).
+"""
+import asyncio
+import logging
+
+from sqlalchemy import DateTime, bindparam, text
+
+try:
+    from py.stats import bump
+except ImportError:
+    from stats import bump
+
+logger = logging.getLogger(__name__)
+
+_COMPLETE_SQL = text(
+    "UPDATE transactions "
+    "SET status = 'completed', charge_id = :charge_id, completed_at = :completed_at "
+    "WHERE payload = :payload AND status = :from_status"
+).bindparams(bindparam('completed_at', type_=DateTime()))
+
+# Status yang boleh di-settle beserta counter yang dikurangi. 'expired' ikut
+# karena pembayaran yang lolos pre-checkout tepat sebelum sweeper berjalan
+# tetap sudah ditagih Telegram dan harus dikredit.
+_SETTLEABLE = (('pending', 'pending_count'), ('expired', 'expired_count'))
+
+_CREDIT_SQL = text(
+    "UPDATE users SET balance = balance + :amount, version = version + 1 "
+    "WHERE id = (SELECT user_id FROM transactions WHERE payload = :payload AND charge_id = :charge_id)"
+)
+
+
+def settle_payment(db, payload, charge_id, amount, completed_at):
+    """Settle satu pembayaran di transaksi `db` (belum di-commit).
+
+    Return True jika transaksi berpindah dari pending/expired ke completed dan saldo
+    dikredit, False jika sudah pernah di-settle atau payload tidak dikenal.
+    """
+    params = {'payload': payload, 'charge_id': charge_id}
+    for from_status, counter in _SETTLEABLE:
+        result = db.execute(_COMPLETE_SQL, {**params, 'completed_at': completed_at, 'from_status': from_status})
+        if result.rowcount == 1:
+            break
+    else:
+        return False
+
+    db.execute(_CREDIT_SQL, {**params, 'amount': amount})
+    bump(db, **{counter: -1}, completed_count=1, completed_amount=amount)
+    return True
+
+
+def settle_payments(db, items, completed_at, on_settled=None):
+    """Settle beberapa pembayaran `(payload, charge_id, amount)` dalam satu commit.
+
+    `on_settled(db, payload, charge_id, amount, completed_at)` dipanggil untuk
+    setiap pembayaran yang berhasil, sebelum commit.
+    Return list completed_at (atau None jika tidak di-settle) sesuai urutan items.
+    """
+    try:
+        results = []
+        for payload, charge_id, amount in items:
+            settled = settle_payment(db, payload, charge_id, amount, completed_at)
+            if settled and on_settled:
+                on_settled(db, payload, charge_id, amount, completed_at)
+            results.append(completed_at if settled else None)
+        db.commit()
+        return results
+    except Exception:
+        db.rollback()
+        if len(items) == 1:
+            raise
+        # Satu item bermasalah (mis. charge_id duplikat) jangan menggagalkan
+        # seluruh batch: ulangi satu per satu
+        logger.warning(f"Batch settlement {len(items)} item gagal, diulang per item")
+        results = []
+        for item in items:
+            try:
+                results.extend(settle_payments(db, [item], completed_at, on_settled))
+            except Exception as e:
+                logger.error(f"Settlement gagal untuk payload {item[0]}: {e}")
+                results.append(None)
+        return results
+
+
+class SettlementBatcher:
+    """Group commit untuk handler async.
+
+    `submit` menunggu hingga settlement-nya ikut di-commit. Settlement yang
+    masuk dalam jendela `max_delay` detik (atau sampai `max_batch` item)
+    di-commit bersama lewat `adb` (lihat py/aio.py).
+    """
+
+    def __init__(self, adb, clock, max_batch=50, max_delay=0.01, on_settled=None):
+        self.adb = adb
+        self.clock = clock
+        self.on_settled = on_settled
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._pending = []
+        self._task = None
+
+    async def submit(self, payload, charge_id, amount):
+        """Return completed_at jika berhasil di-settle, None jika tidak"""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append(((payload, charge_id, amount), future))
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+        return await future
+
+    async def _flush_loop(self):
+        try:
+            while self._pending:
+                if len(self._pending) < self.max_batch:
+                    # Beri kesempatan settlement lain ikut dalam commit ini
+                    await asyncio.sleep(self.max_delay)
+                batch = self._pending[:self.max_batch]
+                del self._pending[:self.max_batch]
+                await self._flush(batch)
+        finally:
+            self._task = None
+
+    async def _flush(self, batch):
+        items = [item for item, _ in batch]
+        try:
+            results = await self.adb.run(settle_payments, items, self.clock(), self.on_settled)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
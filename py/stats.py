@@ -0,0 +1,60 @@
+"""Counter agregat yang di-update secara incremental.
+
+Setiap perubahan (user baru, transaksi dibuat / selesai / refund / expired) memanggil
+`bump` di session yang sama sebelum commit, sehingga counter selalu ikut
+commit atau rollback bersama datanya. /stats dan /api/admin/stats cukup
+membaca satu tabel kecil, tidak perlu COUNT/SUM ke seluruh tabel.
+"""
+from sqlalchemy import text
+
+USERS = 'users'
+PENDING_COUNT = 'pending_count'
+COMPLETED_COUNT = 'completed_count'
+COMPLETED_AMOUNT = 'completed_amount'
+REFUNDED_COUNT = 'refunded_count'
+EXPIRED_COUNT = 'expired_count'
+
+COUNTERS = (USERS, PENDING_COUNT, COMPLETED_COUNT, COMPLETED_AMOUNT, REFUNDED_COUNT, EXPIRED_COUNT)
+
+_BUMP_SQL = text("UPDATE stats_counters SET value = value + :delta WHERE name = :name")
+
+
+def bump(db, **deltas):
+    """Tambah/kurangi counter di transaksi `db` yang sedang berjalan.
+
+    Contoh: bump(db, pending_count=-1, completed_count=1, completed_amount=amount)
+    """
+    params = [{'name': name, 'delta': delta} for name, delta in deltas.items() if delta]
+    if params:
+        db.execute(_BUMP_SQL, params)
+
+
+def read_counters(db):
+    """Semua counter sebagai dict (satu query ke tabel stats_counters)"""
+    rows = db.execute(text("SELECT name, value FROM stats_counters")).all()
+    counters = dict.fromkeys(COUNTERS, 0)
+    counters.update({name: value for name, value in rows})
+    return counters
+
+
+def rebuild_counters(conn):
+    """Hitung ulang semua counter dari data (dipakai migrasi / perbaikan manual)"""
+    # Transaksi lama ada di transactions_archive (py/archive.py), ikut dihitung
+    transactions = (
+        "(SELECT status, amount FROM transactions "
+        "UNION ALL SELECT status, amount FROM transactions_archive) AS t"
+    )
+    values = {
+        USERS: "SELECT COUNT(*) FROM users",
+        PENDING_COUNT: f"SELECT COUNT(*) FROM {transactions} WHERE status = 'pending'",
+        COMPLETED_COUNT: f"SELECT COUNT(*) FROM {transactions} WHERE status = 'completed'",
+        COMPLETED_AMOUNT: f"SELECT COALESCE(SUM(amount), 0) FROM {transactions} WHERE status = 'completed'",
+        REFUNDED_COUNT: f"SELECT COUNT(*) FROM {transactions} WHERE status = 'refunded'",
+        EXPIRED_COUNT: f"SELECT COUNT(*) FROM {transactions} WHERE status = 'expired'",
+    }
+    conn.execute(text("DELETE FROM stats_counters"))
+    for name, query in values.items():
+        conn.execute(
+            text("INSERT INTO stats_counters (name, value) VALUES (:name, :value)"),
+            {'name': name, 'value': conn.execute(text(query)).scalar() or 0}
+        )
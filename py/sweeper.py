@@ -0,0 +1,133 @@
+"""Sweeper transaksi pending yang sudah kedaluwarsa.
+
+Invoice yang tidak pernah dibayar tetap `pending` selamanya dan membuat
+himpunan pending (dihitung /stats, dicari pre-checkout) terus membesar.
+Sweeper memindahkan transaksi pending yang lebih tua dari TTL ke status
+`expired`, dalam batch kecil supaya lock tulis SQLite tidak lama.
+
+Berjalan di event loop b.py (lihat `run_sweeper`) atau sebagai worker
+terpisah:
+
+    python py/sweeper.py            # loop terus
+    python py/sweeper.py --once     # satu kali sapu lalu keluar
+
+Pengaturan: PENDING_TTL_MINUTES (default 60), SWEEP_INTERVAL_SECONDS
+(default 60), SWEEP_BATCH_SIZE (default 500).
+"""
+import asyncio
+import logging
+import os
+import sys
+import time
+from datetime import timedelta
+
+from dotenv import load_dotenv
+from sqlalchemy import DateTime, bindparam, text
+
+try:
+    from py.stats import bump
+    from py.users import touch_users
+except ImportError:
+    from stats import bump
+    from users import touch_users
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+PENDING_TTL = timedelta(minutes=float(os.getenv('PENDING_TTL_MINUTES', 60)))
+SWEEP_INTERVAL = float(os.getenv('SWEEP_INTERVAL_SECONDS', 60))
+SWEEP_BATCH_SIZE = int(os.getenv('SWEEP_BATCH_SIZE', 500))
+
+# Index (status, created_at) dipakai untuk mencari pending terlama
+_SELECT_SQL = text(
+    "SELECT id, user_id FROM transactions "
+    "WHERE status = 'pending' AND created_at < :cutoff "
+    "ORDER BY created_at LIMIT :batch_size"
+).bindparams(bindparam('cutoff', type_=DateTime()))
+
+_EXPIRE_SQL = text(
+    "UPDATE transactions SET status = 'expired' "
+    "WHERE id IN :ids AND status = 'pending'"
+).bindparams(bindparam('ids', expanding=True))
+
+
+def is_expired(created_at, now, ttl=PENDING_TTL):
+    """True jika transaksi pending dengan created_at ini sudah lewat TTL"""
+    if created_at is None:
+        return False
+    return created_at.replace(tzinfo=None) < now.replace(tzinfo=None) - ttl
+
+
+def expire_batch(db, now, ttl=PENDING_TTL, batch_size=SWEEP_BATCH_SIZE):
+    """Expire satu batch dan commit. Return jumlah transaksi yang di-expire"""
+    rows = db.execute(_SELECT_SQL, {'cutoff': now - ttl, 'batch_size': batch_size}).all()
+    if not rows:
+        db.rollback()
+        return 0
+    result = db.execute(_EXPIRE_SQL, {'ids': [row.id for row in rows]})
+    expired = result.rowcount or 0
+    bump(db, pending_count=-expired, expired_count=expired)
+    # Riwayat user berubah: ETag lama tidak berlaku lagi
+    touch_users(db, *(row.user_id for row in rows))
+    db.commit()
+    return expired
+
+
+def sweep(db, now, ttl=PENDING_TTL, batch_size=SWEEP_BATCH_SIZE):
+    """Expire semua pending yang lewat TTL, batch demi batch"""
+    total = 0
+    while True:
+        expired = expire_batch(db, now, ttl, batch_size)
+        total += expired
+        if expired < batch_size:
+            return total
+
+
+async def run_sweeper(adb, clock, ttl=PENDING_TTL, interval=SWEEP_INTERVAL, batch_size=SWEEP_BATCH_SIZE):
+    """Loop sweeper untuk event loop bot, kerja DB lewat AsyncDB (py/aio.py)"""
+    logger.info(f"Sweeper pending aktif: TTL {ttl}, interval {interval}s, batch {batch_size}")
+    while True:
+        try:
+            total = 0
+            while True:
+                # Satu batch per panggilan executor, handler lain tetap bisa jalan di sela-sela
+                expired = await adb.run(expire_batch, clock(), ttl, batch_size)
+                total += expired
+                if expired < batch_size:
+                    break
+            if total:
+                logger.info(f"Sweeper: {total} transaksi pending di-expire")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Sweeper error: {e}")
+        await asyncio.sleep(interval)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    try:
+        from py.models import SessionLocal, get_wib_time
+    except ImportError:
+        from models import SessionLocal, get_wib_time
+
+    once = '--once' in sys.argv[1:]
+    logger.info(f"Sweeper worker: TTL {PENDING_TTL}, interval {SWEEP_INTERVAL}s, batch {SWEEP_BATCH_SIZE}")
+    while True:
+        db = SessionLocal()
+        try:
+            total = sweep(db, get_wib_time())
+            if total or once:
+                logger.info(f"Sweeper: {total} transaksi pending di-expire")
+        except Exception as e:
+            logger.error(f"Sweeper error: {e}")
+        finally:
+            db.close()
+        if once:
+            return
+        time.sleep(SWEEP_INTERVAL)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+"""Service get-or-create user yang dipakai API (py/gacha.py) dan bot (b.py).
+
+User dibuat dengan `INSERT ... ON CONFLICT (telegram_id) ... RETURNING`,
+jadi request pertama dari user baru cukup satu round trip, dan dua request
+bersamaan untuk user yang sama tidak pernah gagal dengan IntegrityError
+pada kolom unik telegram_id. Counter `users` hanya naik jika database
+menyatakan baris benar-benar di-INSERT: `xmax = 0` di PostgreSQL (satu
+statement DO UPDATE), atau baris yang kembali dari DO NOTHING di SQLite
+(user lama: UPDATE/SELECT kedua).
+
+Kolom `users.version` naik setiap kali profil, saldo atau riwayat
+transaksi user berubah (lihat `touch_users`) dan dipakai sebagai ETag
+oleh endpoint user di py/gacha.py.
+"""
+from sqlalchemy import bindparam, case, func, literal_column, or_, select, text, update
+from sqlalchemy.exc import IntegrityError
+
+try:
+    from py.stats import bump
+except ImportError:
+    from stats import bump
+
+PROFILE_FIELDS = ('username', 'first_name', 'last_name')
+
+_TOUCH_SQL = text(
+    "UPDATE users SET version = version + 1 WHERE id IN :ids"
+).bindparams(bindparam('ids', expanding=True))
+
+
+def touch_users(db, *user_ids):
+    """Naikkan versi user di transaksi `db` (belum di-commit).
+
+    Panggil setiap ada perubahan saldo atau transaksi milik user, supaya
+    ETag lama tidak lagi cocok.
+    """
+    ids = sorted({user_id for user_id in user_ids if user_id is not None})
+    if ids:
+        db.execute(_TOUCH_SQL, {'ids': ids})
+
+
+def _dialect_insert(db):
+    name = db.get_bind().dialect.name
+    if name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    elif name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        return None
+    return insert
+
+
+def _profile_update(User, new_values):
+    """SET untuk refresh profil: nilai kosong (None / '') tidak menimpa data lama"""
+    set_ = {
+        name: func.coalesce(func.nullif(new_values[name], ''), getattr(User, name))
+        for name in PROFILE_FIELDS
+    }
+    # Versi hanya naik jika profil benar-benar berubah
+    changed = or_(*(
+        set_[name].is_distinct_from(getattr(User, name)) for name in PROFILE_FIELDS
+    ))
+    set_['version'] = User.version + case((changed, 1), else_=0)
+    return set_
+
+
+class UserService:
+    def __init__(self, model, clock):
+        self.model = model
+        self.clock = clock
+
+    def get_or_create(self, db, telegram_id, username=None, first_name=None, last_name=None,
+                      refresh_profile=False):
+        """Ambil user berdasarkan telegram_id, buat jika belum ada.
+
+        refresh_profile=True memperbarui username/nama dengan nilai yang
+        diberikan (None atau '' tidak menimpa data lama). Tidak melakukan
+        commit: counter user baru ikut transaksi pemanggil.
+        """
+        profile = {'username': username, 'first_name': first_name, 'last_name': last_name}
+        now = self.clock()
+
+        insert = _dialect_insert(db)
+        if insert is None:
+            return self._get_or_create_fallback(db, telegram_id, profile, refresh_profile, now)
+
+        User = self.model
+        stmt = insert(User).values(
+            telegram_id=telegram_id,
+            balance=0,
+            version=0,
+            created_at=now,
+            updated_at=now,
+            **profile
+        )
+        if db.get_bind().dialect.name == 'postgresql':
+            user, inserted = self._upsert_postgresql(db, stmt, refresh_profile)
+        else:
+            user, inserted = self._upsert_sqlite(db, stmt, telegram_id, profile, refresh_profile, now)
+
+        if inserted:
+            bump(db, users=1)
+        return user
+
+    def _upsert_postgresql(self, db, stmt, refresh_profile):
+        """Satu statement; xmax = 0 hanya untuk baris yang baru di-INSERT"""
+        User = self.model
+        if refresh_profile:
+            set_ = _profile_update(User, {name: getattr(stmt.excluded, name) for name in PROFILE_FIELDS})
+            set_['updated_at'] = stmt.excluded.updated_at
+        else:
+            # No-op update supaya RETURNING tetap mengembalikan baris yang sudah ada
+            set_ = {'telegram_id': stmt.excluded.telegram_id}
+        stmt = stmt.on_conflict_do_update(index_elements=['telegram_id'], set_=set_).returning(
+            User, literal_column('xmax = 0').label('inserted')
+        )
+        row = db.execute(stmt, execution_options={'populate_existing': True}).one()
+        return row[0], row.inserted
+
+    def _upsert_sqlite(self, db, stmt, telegram_id, profile, refresh_profile, now):
+        """INSERT ... DO NOTHING RETURNING: baris kembali hanya jika benar-benar dibuat"""
+        User = self.model
+        stmt = stmt.on_conflict_do_nothing(index_elements=['telegram_id']).returning(User)
+        user = db.scalars(stmt, execution_options={'populate_existing': True}).first()
+        if user is not None:
+            return user, True
+
+        if refresh_profile:
+            set_ = _profile_update(User, profile)
+            set_['updated_at'] = now
+            query = update(User).where(User.telegram_id == telegram_id).values(set_).returning(User)
+        else:
+            query = select(User).where(User.telegram_id == telegram_id)
+        return db.scalars(query, execution_options={'populate_existing': True}).one(), False
+
+    def _get_or_create_fallback(self, db, telegram_id, profile, refresh_profile, now):
+        """Database tanpa ON CONFLICT: SELECT lalu INSERT, ulangi jika kalah race"""
+        User = self.model
+        user = db.scalars(select(User).where(User.telegram_id == telegram_id)).first()
+        if user is None:
+            user = User(telegram_id=telegram_id, balance=0, version=0, created_at=now, updated_at=now, **profile)
+            try:
+                with db.begin_nested():
+                    db.add(user)
+                bump(db, users=1)
+                return user
+            except IntegrityError:
+                user = db.scalars(select(User).where(User.telegram_id == telegram_id)).one()
+        if refresh_profile:
+            changed = False
+            for name, value in profile.items():
+                if value and getattr(user, name) != value:
+                    setattr(user, name, value)
+                    changed = True
+            if changed:
+                user.version += 1
+        return user
@@ -0,0 +1,66 @@
+"""Fixture bersama untuk test.
+
+Modul di py/ diimpor langsung (`import models`), sama seperti saat
+dijalankan sebagai script: nama `py` bentrok dengan modul kompatibilitas
+bawaan pytest. Test memakai database SQLite sementara yang dibuat lewat
+migrasi yang sama dengan `python py/models.py migrate`. Environment di-set
+sebelum import karena DATABASE_URL dibaca saat modul diimpor.
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'py'))
+
+_DB_DIR = tempfile.mkdtemp(prefix='gacha-test-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_DB_DIR, 'test.db')}"
+os.environ['BOT_TOKEN'] = 'test-bot-token'
+os.environ['PAYLOAD_SECRET'] = 'test-payload-secret'
+
+from sqlalchemy import text  # noqa: E402
+
+import models  # noqa: E402
+from models import Base, SessionLocal, Transaction, User  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def schema():
+    models.create_schema()
+
+
+@pytest.fixture
+def db(schema):
+    """Session ke database test; semua data dihapus setelah test"""
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.rollback()
+        for table in reversed(Base.metadata.sorted_tables):
+            if table.name != 'stats_counters':
+                session.execute(table.delete())
+        session.execute(text("UPDATE stats_counters SET value = 0"))
+        session.commit()
+        session.close()
+
+
+@pytest.fixture
+def make_transaction(db):
+    """Buat user (jika belum ada) dan satu transaksi, return Transaction"""
+    def make(telegram_id=1000, amount=50, status='pending', payload=None, **fields):
+        user = db.query(User).filter_by(telegram_id=telegram_id).first()
+        if user is None:
+            user = User(telegram_id=telegram_id, balance=0)
+            db.add(user)
+            db.flush()
+        transaction = Transaction(
+            user_id=user.id, amount=amount, status=status,
+            payload=payload or models.generate_payload(telegram_id, amount), **fields
+        )
+        db.add(transaction)
+        db.commit()
+        return transaction
+    return make
@@ -0,0 +1,69 @@
+from datetime import timedelta
+
+import pytest
+
+from models import ArchivedTransaction, User, get_wib_time, transaction_history
+from pagination import decode_cursor, encode_cursor
+
+
+def _walk(db, user_id, limit, **kwargs):
+    pages, cursor = [], None
+    while True:
+        rows, cursor = transaction_history(db, user_id, cursor=cursor, limit=limit, **kwargs)
+        pages.append([row.id for row in rows])
+        if cursor is None:
+            return pages
+
+
+@pytest.fixture
+def history(db, make_transaction):
+    """3 transaksi baru di tabel hot + 3 transaksi lama di arsip.
+
+    Return (user_id, id semua transaksi urut terbaru dulu).
+    """
+    now = get_wib_time().replace(tzinfo=None)
+    hot_ids = [
+        make_transaction(status='completed', created_at=now - timedelta(hours=hours)).id
+        for hours in (1, 2, 3)
+    ]
+    user = db.query(User).filter_by(telegram_id=1000).one()
+    archived_ids = [903, 902, 901]
+    for row_id, days in zip(archived_ids, (200, 300, 400)):
+        db.add(ArchivedTransaction(
+            id=row_id, user_id=user.id, amount=10, payload=f"deposit:old:{row_id}",
+            status='completed', created_at=now - timedelta(days=days), archived_at=now
+        ))
+    db.commit()
+    return user.id, hot_ids + archived_ids
+
+
+def test_cursor_round_trip():
+    created_at = get_wib_time().replace(tzinfo=None, microsecond=0)
+    assert decode_cursor(encode_cursor(created_at, 42)) == (created_at, 42)
+
+
+def test_invalid_cursor_rejected(db):
+    with pytest.raises(ValueError):
+        transaction_history(db, 1, cursor='not-a-cursor')
+
+
+@pytest.mark.parametrize('limit', [1, 2, 4, 6, 10])
+def test_pages_cross_hot_archive_boundary(db, history, limit):
+    user_id, expected = history
+    pages = _walk(db, user_id, limit)
+
+    assert [row_id for page in pages for row_id in page] == expected
+    assert all(len(page) == limit for page in pages[:-1])
+
+
+def test_status_filter_applies_to_archive(db, history, make_transaction):
+    user_id, expected = history
+    make_transaction(status='pending')
+    db.add(ArchivedTransaction(
+        id=100, user_id=user_id, amount=10, payload='deposit:old:refunded',
+        status='refunded', created_at=get_wib_time().replace(tzinfo=None) - timedelta(days=500)
+    ))
+    db.commit()
+
+    pages = _walk(db, user_id, 2, status='completed')
+    assert [row_id for page in pages for row_id in page] == expected
@@ -0,0 +1,77 @@
+from datetime import timedelta
+
+import pytest
+
+from models import get_wib_time
+from payloads import UidGenerator, new_payload, verify_payload
+from payments import check_precheckout
+from sweeper import PENDING_TTL
+
+EXPIRED = "Invoice sudah kedaluwarsa, silakan buat deposit baru"
+
+
+def _replace_part(payload, index, value):
+    parts = payload.split('.')
+    parts[index] = value
+    return '.'.join(parts)
+
+
+def test_valid_payload_round_trip():
+    signed = verify_payload(new_payload(1234, 50))
+
+    assert (signed.telegram_id, signed.amount) == (1234, 50)
+    assert abs(signed.created_at - get_wib_time()) < timedelta(seconds=5)
+
+
+@pytest.mark.parametrize('tamper', [
+    lambda p: _replace_part(p, 1, '9999'),       # pemilik diganti
+    lambda p: _replace_part(p, 2, '5000'),       # jumlah diganti
+    lambda p: _replace_part(p, 3, 'zzzzzzzzzz'),  # uid diganti
+    lambda p: _replace_part(p, 4, 'A' * 22),     # tanda tangan palsu
+    lambda p: _replace_part(p, 0, 'd2'),         # versi format lain
+    lambda p: p.rsplit('.', 1)[0],               # tanpa tanda tangan
+    lambda p: p + '.x',                          # bagian ekstra
+])
+def test_tampered_payload_rejected(tamper):
+    assert verify_payload(tamper(new_payload(1234, 50))) is None
+
+
+def test_payload_signed_with_other_secret_rejected(monkeypatch):
+    payload = new_payload(1234, 50)
+    monkeypatch.setenv('PAYLOAD_SECRET', 'rotated-secret')
+
+    assert verify_payload(payload) is None
+
+
+def test_uids_are_unique_and_increasing():
+    generator = UidGenerator(host_id=1, pid=4321)
+    uids = [generator.next() for _ in range(10000)]
+
+    assert uids == sorted(set(uids))
+
+
+def test_precheckout_accepts_fresh_payload(db, make_transaction):
+    transaction = make_transaction(telegram_id=1234, amount=50)
+
+    assert check_precheckout(db, transaction.payload, 1234, 'XTR', 50, get_wib_time()) is None
+
+
+def test_precheckout_rejects_expired_payload(db, make_transaction):
+    transaction = make_transaction(telegram_id=1234, amount=50)
+    later = get_wib_time() + PENDING_TTL + timedelta(minutes=1)
+
+    assert check_precheckout(db, transaction.payload, 1234, 'XTR', 50, later) == EXPIRED
+
+
+def test_precheckout_rejects_tampered_payload_without_row(db):
+    payload = _replace_part(new_payload(1234, 50), 2, '1')
+
+    assert check_precheckout(db, payload, 1234, 'XTR', 1, get_wib_time()) == "Transaksi tidak valid"
+
+
+def test_precheckout_rejects_other_user_and_amount(db, make_transaction):
+    transaction = make_transaction(telegram_id=1234, amount=50)
+    now = get_wib_time()
+
+    assert check_precheckout(db, transaction.payload, 999, 'XTR', 50, now) == "User tidak sesuai"
+    assert check_precheckout(db, transaction.payload, 1234, 'XTR', 49, now) == "Jumlah tidak sesuai"
@@ -0,0 +1,101 @@
+import pytest
+
+from ratelimit import MemoryBackend, RateLimiter, Rule, client_ip, parse_rule
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def test_parse_rule():
+    assert parse_rule('20/60') == Rule(20, 20 / 60)
+    assert parse_rule('5') == Rule(5, 5)
+    assert parse_rule('0') is None
+    assert parse_rule('') is None
+
+
+def test_bucket_burst_then_refill(clock):
+    backend = MemoryBackend(clock=clock)
+    rule = Rule(3, 1.0)
+
+    assert [backend.take('k', rule) for _ in range(3)] == [0, 0, 0]
+    assert backend.take('k', rule) == pytest.approx(1.0)
+
+    clock.now += 0.5
+    assert backend.take('k', rule) == pytest.approx(0.5)
+    clock.now += 0.5
+    assert backend.take('k', rule) == 0
+
+
+def test_bucket_refill_capped_at_capacity(clock):
+    backend = MemoryBackend(clock=clock)
+    rule = Rule(2, 1.0)
+    backend.take('k', rule)
+
+    clock.now += 3600
+    assert [backend.take('k', rule) for _ in range(2)] == [0, 0]
+    assert backend.take('k', rule) > 0
+
+
+def test_buckets_are_independent(clock):
+    backend = MemoryBackend(clock=clock)
+    rule = Rule(1, 0.1)
+
+    assert backend.take('a', rule) == 0
+    assert backend.take('a', rule) > 0
+    assert backend.take('b', rule) == 0
+
+
+def test_prune_keeps_bucket_count_bounded(clock):
+    backend = MemoryBackend(max_buckets=10, clock=clock)
+    rule = Rule(1, 1.0)
+    for i in range(100):
+        clock.now += 1
+        backend.take(f"ip:{i}", rule)
+
+    assert len(backend._buckets) <= 10
+
+
+def test_limiter_retry_after_rounds_up(clock):
+    limiter = RateLimiter(MemoryBackend(clock=clock), rules={('deposit', 'ip'): Rule(1, 1 / 60)}, enabled=True)
+
+    assert limiter.hit('deposit', ip='1.2.3.4') is None
+    assert limiter.hit('deposit', ip='1.2.3.4') == 60
+    assert limiter.hit('deposit', ip='5.6.7.8') is None
+    assert limiter.hit('check', ip='1.2.3.4') is None
+
+
+def test_limiter_disabled(clock):
+    limiter = RateLimiter(MemoryBackend(clock=clock), rules={('deposit', 'ip'): Rule(1, 1)}, enabled=False)
+
+    assert all(limiter.hit('deposit', ip='1.2.3.4') is None for _ in range(5))
+
+
+@pytest.mark.parametrize('remote_addr, forwarded_for, connecting_ip, proxy_hops, expected', [
+    # Peer publik tanpa proxy: header diabaikan (bisa dipalsukan client)
+    ('203.0.113.5', '1.1.1.1', '2.2.2.2', 0, '203.0.113.5'),
+    # cloudflared di host yang sama: CF-Connecting-IP lebih dulu
+    ('127.0.0.1', '1.1.1.1, 9.9.9.9', '2.2.2.2', 0, '2.2.2.2'),
+    ('::1', None, ' 2.2.2.2 ', 0, '2.2.2.2'),
+    # Loopback tanpa CF-Connecting-IP: entri X-Forwarded-For paling kanan
+    ('127.0.0.1', '6.6.6.6, 1.1.1.1', None, 0, '1.1.1.1'),
+    ('127.0.0.1', None, None, 0, '127.0.0.1'),
+    ('127.0.0.1', ' , ', '  ', 0, '127.0.0.1'),
+    # Proxy di host lain: ambil `proxy_hops` dari kanan
+    ('10.0.0.2', '6.6.6.6, 1.1.1.1, 10.0.0.1', None, 2, '1.1.1.1'),
+    ('10.0.0.2', '1.1.1.1', None, 3, '1.1.1.1'),
+    ('10.0.0.2', None, None, 1, '10.0.0.2'),
+    (None, None, None, 0, 'unknown'),
+    ('not-an-ip', '1.1.1.1', None, 0, 'not-an-ip'),
+])
+def test_client_ip(remote_addr, forwarded_for, connecting_ip, proxy_hops, expected):
+    assert client_ip(remote_addr, forwarded_for, connecting_ip, proxy_hops=proxy_hops) == expected
@@ -0,0 +1,63 @@
+import pytest
+
+from refunds import parse_charge_list
+
+CHARGE_A = 'stxAbC123-def_456'
+CHARGE_B = 'stxZyX987_ghi-321'
+
+
+def test_empty_text():
+    assert parse_charge_list('') == ([], [])
+    assert parse_charge_list('\n  \n\t\n') == ([], [])
+
+
+def test_one_charge_per_line():
+    assert parse_charge_list(f"{CHARGE_A}\n{CHARGE_B}\n") == ([(None, CHARGE_A), (None, CHARGE_B)], [])
+
+
+def test_command_line_is_skipped():
+    text = f"/refundbulk {CHARGE_A}\n{CHARGE_B}"
+    assert parse_charge_list(text) == ([(None, CHARGE_A), (None, CHARGE_B)], [])
+    assert parse_charge_list('/refundbulk') == ([], [])
+
+
+@pytest.mark.parametrize('text', [
+    f"{CHARGE_A},{CHARGE_B}",
+    f"{CHARGE_A}, {CHARGE_B}",
+    f"  {CHARGE_A}\t{CHARGE_B}  ",
+    f"{CHARGE_A}\r\n{CHARGE_B}\r\n",
+])
+def test_separators(text):
+    assert parse_charge_list(text) == ([(None, CHARGE_A), (None, CHARGE_B)], [])
+
+
+def test_user_id_and_charge_pair():
+    assert parse_charge_list(f"123456 {CHARGE_A}") == ([(123456, CHARGE_A)], [])
+    assert parse_charge_list(f"123456,{CHARGE_A}") == ([(123456, CHARGE_A)], [])
+
+
+def test_pair_requires_exactly_two_tokens():
+    # Tiga token: semuanya dianggap charge id, angka pendek tidak valid
+    entries, invalid = parse_charge_list(f"123456 {CHARGE_A} {CHARGE_B}")
+
+    assert entries == [(None, CHARGE_A), (None, CHARGE_B)]
+    assert invalid == ['123456']
+
+
+def test_pair_with_invalid_charge():
+    assert parse_charge_list('123456 short') == ([], ['123456', 'short'])
+
+
+def test_duplicates_keep_first_occurrence():
+    text = f"{CHARGE_A}\n123456 {CHARGE_A}\n{CHARGE_B}\n{CHARGE_A}"
+
+    assert parse_charge_list(text) == ([(None, CHARGE_A), (None, CHARGE_B)], [])
+
+
+@pytest.mark.parametrize('token', ['short', 'abc$defgh', 'charge.id.1', 'ünïcödé-id'])
+def test_invalid_tokens_reported(token):
+    assert parse_charge_list(f"{CHARGE_A}\n{token}") == ([(None, CHARGE_A)], [token])
+
+
+def test_invalid_tokens_not_deduplicated():
+    assert parse_charge_list('bad bad') == ([], ['bad', 'bad'])
@@ -0,0 +1,59 @@
+from models import User, get_wib_time
+from settlement import settle_payment, settle_payments
+from stats import read_counters
+
+
+def _balance(db, telegram_id=1000):
+    db.expire_all()
+    return db.query(User).filter_by(telegram_id=telegram_id).one().balance
+
+
+def test_settle_credits_once(db, make_transaction):
+    transaction = make_transaction(amount=50)
+    now = get_wib_time()
+
+    assert settle_payment(db, transaction.payload, 'charge-0001', 50, now) is True
+    db.commit()
+    assert settle_payment(db, transaction.payload, 'charge-0001', 50, now) is False
+    db.commit()
+
+    assert _balance(db) == 50
+
+
+def test_resettling_same_charge_returns_none(db, make_transaction):
+    transaction = make_transaction(amount=30)
+    now = get_wib_time()
+    item = (transaction.payload, 'charge-0002', 30)
+
+    assert settle_payments(db, [item], now) == [now]
+    assert settle_payments(db, [item], now) == [None]
+
+    assert _balance(db) == 30
+    assert read_counters(db)['completed_count'] == 1
+
+
+def test_settles_expired_transaction(db, make_transaction):
+    transaction = make_transaction(amount=10, status='expired')
+
+    assert settle_payments(db, [(transaction.payload, 'charge-0003', 10)], get_wib_time()) != [None]
+    assert _balance(db) == 10
+
+
+def test_duplicate_charge_id_in_batch_falls_back_per_item(db, make_transaction, caplog):
+    first = make_transaction(amount=20)
+    duplicate = make_transaction(amount=40)
+    other = make_transaction(amount=5)
+    now = get_wib_time()
+
+    results = settle_payments(db, [
+        (first.payload, 'charge-dup-1', 20),
+        (duplicate.payload, 'charge-dup-1', 40),
+        (other.payload, 'charge-0004', 5),
+    ], now)
+
+    assert results == [now, None, now]
+    assert 'diulang per item' in caplog.text
+    assert _balance(db) == 25
+    db.expire_all()
+    assert duplicate.status == 'pending'
+    assert read_counters(db)['completed_count'] == 2